@@ -0,0 +1,5 @@
+"""
+Performance benchmarks, run from the repository root, e.g.:
+
+    python -m benchmarks.palmdoc
+"""
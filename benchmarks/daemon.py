@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark conversions sent to the warm daemon against new processes.
+
+A batch of small synthetic text files is converted to text, the way batch
+jobs run many short conversions: once by starting ebook-converter for every
+file, and once by sending every file to a daemon started with --serve,
+using --connect. The outputs are checked to be identical. The time to start
+the daemon is reported separately.
+
+Usage: python -m benchmarks.daemon [--count 20] [--workers 2]
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+MAIN = 'from ebook_converter.main import main; main()'
+
+
+def synthetic_books(directory, count, seed=0):
+    rnd = random.Random(seed)
+    words = [''.join(rnd.choice('etaoinshrdlcumwfgypbvkjxqz')
+                     for _ in range(rnd.randint(1, 10))) for _ in range(2000)]
+    paths = []
+    for i in range(count):
+        paragraphs = []
+        for _ in range(rnd.randint(20, 60)):
+            paragraphs.append(' '.join(rnd.choice(words)
+                                       for _ in range(rnd.randint(20, 80))))
+        path = os.path.join(directory, 'book%03d.txt' % i)
+        with open(path, 'w') as f:
+            f.write('\n\n'.join(paragraphs) + '\n')
+        paths.append(path)
+    return paths
+
+
+def ebook_converter(*args):
+    return subprocess.run([sys.executable, '-c', MAIN] + list(args),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+
+def convert_all(books, output_dir, *args):
+    start = time.perf_counter()
+    outputs = []
+    for book in books:
+        output = os.path.join(output_dir, os.path.basename(book))
+        p = ebook_converter(book, output, *args)
+        if p.returncode != 0:
+            raise SystemExit('Failed to convert %s:\n%s' % (book, p.stderr))
+        outputs.append(output)
+    elapsed = time.perf_counter() - start
+    ans = []
+    for output in outputs:
+        with open(output, 'rb') as f:
+            ans.append(f.read())
+    return elapsed, ans
+
+
+def start_daemon(path, workers):
+    start = time.perf_counter()
+    daemon = subprocess.Popen(
+        [sys.executable, '-c', MAIN, '--serve', path, '--workers',
+         str(workers)], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    while not os.path.exists(path):
+        if daemon.poll() is not None:
+            raise SystemExit('The daemon failed to start:\n%s' %
+                             daemon.stderr.read().decode('utf-8', 'replace'))
+        time.sleep(0.01)
+    return daemon, time.perf_counter() - start
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--count', type=int, default=20,
+                        help='Number of books to convert (default: 20)')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Number of workers of the daemon (default: 2)')
+    opts = parser.parse_args(args)
+
+    tdir = tempfile.mkdtemp(prefix='daemon-bench-')
+    try:
+        for name in ('in', 'cli', 'daemon'):
+            os.mkdir(os.path.join(tdir, name))
+        books = synthetic_books(os.path.join(tdir, 'in'), opts.count)
+        old_time, old_result = convert_all(books, os.path.join(tdir, 'cli'))
+
+        path = os.path.join(tdir, 'daemon.sock')
+        daemon, startup = start_daemon(path, opts.workers)
+        try:
+            new_time, new_result = convert_all(
+                books, os.path.join(tdir, 'daemon'), '--connect', path)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+        if new_result != old_result:
+            raise SystemExit('The daemon produced different outputs')
+        print('%d books, daemon started in %.4fs' % (len(books), startup))
+        print('  %-22s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx' % (
+            'conversions', new_time, old_time,
+            old_time / max(new_time, 1e-9)))
+    finally:
+        shutil.rmtree(tdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+Benchmark the Dehyphenator word index against searching the whole document.
+
+A large synthetic pdftohtml output, with lines ending in words hyphenated
+across the line break and a few genuinely hyphenated words, is dehyphenated
+in the modes used for PDF input and for the heuristics cleanup, once looking
+words up in the index of the document and once with str.find() on the whole
+document as before. The HTML produced is checked to be identical.
+
+Usage: python -m benchmarks.dehyphenate [--size 2000000] [file.html ...]
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+
+from ebook_converter.ebooks.conversion.preprocess import DocAnalysis, \
+    Dehyphenator
+
+
+LETTERS = 'etaoinshrdlcumwfgypbvkjxqz'
+SUFFIXES = ('', '', '', 's', 'ed', 'ing', 'ly', 'ness', 'tion', 'er')
+PREFIXES = ('', '', '', '', 'dis', 're', 'un', 'in')
+
+
+def synthetic_pdftohtml(size, seed=0):
+    rnd = random.Random(seed)
+    weights = list(itertools.accumulate(
+        1.0 / (i + 1) for i in range(len(LETTERS))))
+    stems = set()
+    while len(stems) < 8000:
+        stems.add(''.join(rnd.choices(LETTERS, cum_weights=weights,
+                                      k=rnd.randint(2, 9))))
+    stems = sorted(stems)
+    # Zipf like word frequencies, as in real text
+    stem_weights = list(itertools.accumulate(
+        1.0 / (i + 1) for i in range(len(stems))))
+
+    def word():
+        w = rnd.choices(stems, cum_weights=stem_weights)[0]
+        if rnd.random() < 0.2:
+            w = rnd.choice(PREFIXES) + w + rnd.choice(SUFFIXES)
+        if rnd.random() < 0.01:
+            w += '-' + rnd.choices(stems, cum_weights=stem_weights)[0]
+        if rnd.random() < 0.05:
+            w = w.capitalize()
+        return w
+
+    parts = ['<html><head><title>Synthetic scan</title></head><body>\n']
+    total, page = 0, 0
+    while total < size:
+        page += 1
+        lines = ['<a name="%d"></a>' % page]
+        for _ in range(rnd.randint(30, 40)):
+            line = []
+            while sum(map(len, line)) < 60:
+                line.append(word())
+            text = ' '.join(line)
+            if rnd.random() < 0.2:
+                w = word()
+                cut = rnd.randint(1, max(1, len(w) - 1))
+                text += ' ' + w[:cut] + '-'
+                carry = w[cut:]
+            else:
+                carry = None
+                text += rnd.choice('.,;')
+            if rnd.random() < 0.1:
+                text = '<i>%s</i>' % text
+            lines.append('<p>%s</p>' % text)
+            if carry:
+                lines.append('<p>%s %s.</p>' % (carry, ' '.join(
+                    word() for _ in range(8))))
+        chunk = '\n'.join(lines) + '\n<hr/>\n'
+        parts.append(chunk)
+        total += len(chunk)
+    parts.append('</body></html>\n')
+    return ''.join(parts)
+
+
+class ReferenceDehyphenator(Dehyphenator):
+    """The previous lookups, searching the whole document for each word."""
+
+    def dehyphenate(self, match):
+        firsthalf = match.group('firstpart')
+        secondhalf = match.group('secondpart')
+        try:
+            wraptags = match.group('wraptags')
+        except Exception:
+            wraptags = ''
+        hyphenated = str(firsthalf) + "-" + str(secondhalf)
+        dehyphenated = str(firsthalf) + str(secondhalf)
+        if self.suffixes.match(secondhalf) is None:
+            lookupword = self.removesuffixes.sub('', dehyphenated)
+        else:
+            lookupword = dehyphenated
+        if len(firsthalf) > 4 and self.prefixes.match(firsthalf) is None:
+            lookupword = self.removeprefix.sub('', lookupword)
+        searchresult = self.html.find(lookupword.lower())
+        if self.format == 'html_cleanup' or self.format == 'txt_cleanup':
+            if self.html.find(lookupword) != -1 or searchresult != -1:
+                return dehyphenated
+            elif self.html.find(hyphenated) != -1:
+                return hyphenated
+            return firsthalf+'—'+wraptags+secondhalf
+        if (self.format == 'individual_words' and
+                len(firsthalf) + len(secondhalf) <= 6):
+            return hyphenated
+        if len(firsthalf) <= 2 and len(secondhalf) <= 2:
+            return hyphenated
+        if self.html.find(lookupword) != -1 or searchresult != -1:
+            return dehyphenated
+        return hyphenated
+
+
+def run(cls, html, length):
+    # The passes of the PDF input and of the heuristics cleanup
+    start = time.perf_counter()
+    dehyphenator = cls()
+    html = dehyphenator(html, 'html', length)
+    html = dehyphenator(html, 'html_cleanup', length)
+    html = dehyphenator(html, 'individual_words', length)
+    return time.perf_counter() - start, html
+
+
+def timeit(cls, html, length, repeat):
+    best = result = None
+    for _ in range(repeat):
+        elapsed, result = run(cls, html, length)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench(name, html, repeat):
+    length = DocAnalysis('html', html).line_length(0.4)
+    print('%s: %d characters, %d hyphens, line length: %d' % (
+        name, len(html), html.count('-'), length))
+    new_time, new_result = timeit(Dehyphenator, html, length, repeat)
+    old_time, old_result = timeit(ReferenceDehyphenator, html, length, repeat)
+    if new_result != old_result:
+        raise SystemExit('%s: HTML differs from whole document searches'
+                         % name)
+    print('  %-22s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx' % (
+        'dehyphenate', new_time, old_time, old_time / max(new_time, 1e-9)))
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('files', nargs='*', help='pdftohtml output to use as '
+                        'input, a synthetic document is used if none are '
+                        'given')
+    parser.add_argument('--size', type=int, default=2 * 1000 * 1000,
+                        help='Size of the synthetic document (default: 2 MB)')
+    parser.add_argument('--repeat', type=int, default=1)
+    opts = parser.parse_args(args)
+
+    if opts.files:
+        for path in opts.files:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                bench(path, f.read(), opts.repeat)
+    else:
+        bench('synthetic document', synthetic_pdftohtml(opts.size),
+              opts.repeat)
+
+
+if __name__ == '__main__':
+    main()
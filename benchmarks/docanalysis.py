@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Benchmark the DocAnalysis line length statistics against walking the lines.
+
+A synthetic plain text book with hard line breaks, and its HTML and pdftohtml
+renderings, are analysed the way the input plugins and the heuristics do: a
+histogram query to detect hard line breaks followed by line length queries
+at several percentiles. This is done once with the line length counts of
+DocAnalysis, shared between the queries, and once collecting, sorting and
+bucketing the lengths of all the lines for each query as before. The answers
+are checked to be identical.
+
+Usage: python -m benchmarks.docanalysis [--size 5000000] [file.txt ...]
+"""
+import argparse
+import math
+import random
+import re
+import sys
+import time
+
+from ebook_converter.ebooks.conversion.preprocess import DocAnalysis
+
+
+PERCENTS = (0.4, 0.45, 0.5, 0.55, 0.9)
+
+
+def synthetic_text(size, seed=0):
+    rnd = random.Random(seed)
+    words = [''.join(rnd.choice('etaoinshrdlcumwfgypbvkjxqz')
+                     for _ in range(rnd.randint(1, 10))) for _ in range(5000)]
+    lines, total = [], 0
+    while total < size:
+        if rnd.random() < 0.05:
+            line = ''
+        else:
+            width = rnd.choice((60, 65, 70, 72, 75, 80))
+            line = []
+            while sum(map(len, line)) + len(line) < width:
+                line.append(rnd.choice(words))
+            line = ' '.join(line)
+            if rnd.random() < 0.02:
+                line = line * rnd.randint(2, 40)
+        lines.append(line)
+        total += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def renderings(text):
+    lines = text.splitlines()
+    yield 'txt', text
+    yield 'html', ''.join('<p>%s</p>\n' % line for line in lines)
+    yield 'pdf', '<br>' + ''.join('%s<br>\n' % line for line in lines)
+
+
+class ReferenceDocAnalysis(object):
+    """The previous analysis, walking the list of lines for every query."""
+
+    def __init__(self, format='html', raw=''):
+        raw = raw.replace('&nbsp;', ' ')
+        if format == 'html':
+            linere = re.compile(r'(?<=<p)(?![^>]*>\s*</p>).*?(?=</p>)',
+                                re.DOTALL)
+        elif format == 'pdf':
+            linere = re.compile(r'(?<=<br>)(?!\s*<br>).*?(?=<br>)', re.DOTALL)
+        elif format == 'spanned_html':
+            linere = re.compile('(?<=<span).*?(?=</span>)', re.DOTALL)
+        elif format == 'txt':
+            linere = re.compile('.*?\n')
+        self.lines = linere.findall(raw)
+
+    def line_length(self, percent):
+        lengths = []
+        for line in self.lines:
+            if len(line) > 0:
+                lengths.append(len(line))
+        if not lengths:
+            return 0
+        lengths = list(set(lengths))
+        avg = sum(lengths) / len(lengths)
+        max_line = math.ceil(avg * 2)
+        lengths = sorted(lengths)
+        for i in range(len(lengths) - 1, -1, -1):
+            if lengths[i] > max_line:
+                del lengths[i]
+        percent = min(max(percent, 0), 1)
+        return lengths[int(len(lengths) * percent) - 1]
+
+    def line_histogram(self, percent):
+        hRaw = [0 for i in range(0, 20)]
+        for line in self.lines:
+            _l = len(line)
+            if _l > 20 and _l < 1900:
+                hRaw[int(_l // 100)] += 1
+        totalLines = len(self.lines)
+        if totalLines > 0:
+            h = [float(count)/totalLines for count in hRaw]
+        else:
+            h = []
+        return max(h, default=0) >= percent
+
+
+def queries(analyse, format, raw):
+    # Every pass looking at the text asks for its own analysis
+    ans = [analyse(format, raw).line_histogram(0.5)]
+    for percent in PERCENTS:
+        ans.append(analyse(format, raw).line_length(percent))
+    return ans
+
+
+def shared_analysis():
+    # One analysis per text, kept for the passes as a conversion does
+    analyses = {}
+
+    def analyse(format, raw):
+        ans = analyses.get((format, raw))
+        if ans is None:
+            ans = analyses[(format, raw)] = DocAnalysis(format, raw)
+        return ans
+    return analyse
+
+
+def timeit(make_analyse, format, raw, repeat):
+    best = result = None
+    for _ in range(repeat):
+        analyse = make_analyse()
+        start = time.perf_counter()
+        result = queries(analyse, format, raw)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench(name, text, repeat):
+    print('%s: %d characters, %d lines' % (name, len(text), text.count('\n')))
+    for format, raw in renderings(text):
+        new_time, new_result = timeit(shared_analysis, format, raw, repeat)
+        old_time, old_result = timeit(lambda: ReferenceDocAnalysis, format,
+                                      raw, repeat)
+        if new_result != old_result or \
+                queries(DocAnalysis, format, raw) != old_result:
+            raise SystemExit('%s: %s analysis differs from walking the '
+                             'lines' % (name, format))
+        print('  %-22s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx' % (
+            '%s analysis' % format, new_time, old_time,
+            old_time / max(new_time, 1e-9)))
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('files', nargs='*', help='UTF-8 text files to use as '
+                        'input, a synthetic book is used if none are given')
+    parser.add_argument('--size', type=int, default=5 * 1000 * 1000,
+                        help='Size of the synthetic book (default: 5 MB)')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args(args)
+
+    if opts.files:
+        for path in opts.files:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                bench(path, f.read(), opts.repeat)
+    else:
+        bench('synthetic book', synthetic_text(opts.size), opts.repeat)
+
+
+if __name__ == '__main__':
+    main()
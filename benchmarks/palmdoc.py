@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Benchmark the PalmDOC codec against the previous pure Python implementation.
+
+Both the compressor and the decompressor are run on single 4 KB text records
+and on a whole book, and their output is checked to be byte-identical to the
+reference implementation.
+
+Usage: python -m benchmarks.palmdoc [book.txt ...]
+"""
+import argparse
+import io
+import random
+import sys
+import time
+from struct import pack
+
+from ebook_converter.ebooks.compression.palmdoc import compress_doc, \
+    decompress_doc
+
+
+RECORD_SIZE = 4096
+
+
+# Reference implementation {{{
+def reference_decompress_doc(data):
+    uncompressed = b''
+    skip_next = 0
+
+    for idx, item in enumerate(data):
+        if skip_next:
+            skip_next -= 1
+            continue
+
+        if item in range(1, 9):
+            skip_next = item
+            for amount in range(1, item + 1):
+                uncompressed += data[idx + amount].to_bytes(1, sys.byteorder)
+
+        elif item < 128:
+            uncompressed += item.to_bytes(1, sys.byteorder)
+
+        elif item >= 192:
+            uncompressed += b' ' + (item ^ 128).to_bytes(1, sys.byteorder)
+
+        else:
+            skip_next = 1
+            item = (item << 8) + data[idx + 1]
+            character_index = (item & 0x3FFF) >> 3
+            for _ in range((item & 7) + 3):
+                uncompressed += (uncompressed[len(uncompressed) -
+                                              character_index]
+                                 .to_bytes(1, sys.byteorder))
+
+    return uncompressed
+
+
+def reference_compress_doc(data):
+    out = io.BytesIO()
+    i = 0
+    ldata = len(data)
+    while i < ldata:
+        if i > 10 and (ldata - i) > 10:
+            chunk = b''
+            match = -1
+            for j in range(10, 2, -1):
+                chunk = data[i:i+j]
+                try:
+                    match = data.rindex(chunk, 0, i)
+                except ValueError:
+                    continue
+                if (i - match) <= 2047:
+                    break
+                match = -1
+            if match >= 0:
+                n = len(chunk)
+                m = i - match
+                code = 0x8000 + ((m << 3) & 0x3ff8) + (n - 3)
+                out.write(pack('>H', code))
+                i += n
+                continue
+        ch = data[i:i+1]
+        och = ord(ch)
+        i += 1
+        if ch == b' ' and (i + 1) < ldata:
+            onch = ord(data[i:i+1])
+            if onch >= 0x40 and onch < 0x80:
+                out.write(pack('>B', onch ^ 0x80))
+                i += 1
+                continue
+        if och == 0 or (och > 8 and och < 0x80):
+            out.write(ch)
+        else:
+            j = i
+            binseq = [ch]
+            while j < ldata and len(binseq) < 8:
+                ch = data[j:j+1]
+                och = ord(ch)
+                if och == 0 or (och > 8 and och < 0x80):
+                    break
+                binseq.append(ch)
+                j += 1
+            out.write(pack('>B', len(binseq)))
+            out.write(b''.join(binseq))
+            i += len(binseq) - 1
+    return out.getvalue()
+# }}}
+
+
+def synthetic_book(size, seed=0):
+    """HTML-ish text with some UTF-8, similar to a MOBI text flow."""
+    rnd = random.Random(seed)
+    words = ('the of and to in a is that for it as was with be by on not he '
+             'I this are or his from at which but have an they you were '
+             'her she there been one all we their 章节 小说 第一 “quoted” '
+             'Tolstoy’s naïve café').split()
+    parts = []
+    total = 0
+    while total < size:
+        para = ' '.join(rnd.choice(words) for _ in range(rnd.randint(20, 120)))
+        chunk = ('<p class="calibre%d">%s.</p>\n' % (rnd.randint(1, 9),
+                                                     para.capitalize()))
+        chunk = chunk.encode('utf-8')
+        parts.append(chunk)
+        total += len(chunk)
+    return b''.join(parts)[:size]
+
+
+def timeit(func, data, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def records(data):
+    return [data[i:i + RECORD_SIZE] for i in range(0, len(data),
+                                                   RECORD_SIZE)]
+
+
+def bench(name, data, repeat):
+    def all_records(func):
+        return lambda recs: [func(r) for r in recs]
+
+    recs = records(data)
+    print('%s: %d bytes, %d records' % (name, len(data), len(recs)))
+    cases = (('compress 4KB record', compress_doc, reference_compress_doc,
+              recs[0]),
+             ('compress book', all_records(compress_doc),
+              all_records(reference_compress_doc), recs))
+    compressed = [compress_doc(r) for r in recs]
+    cases += (('decompress 4KB record', decompress_doc,
+               reference_decompress_doc, compressed[0]),
+              ('decompress book', all_records(decompress_doc),
+               all_records(reference_decompress_doc), compressed))
+    for label, new, old, arg in cases:
+        new_time, new_result = timeit(new, arg, repeat)
+        old_time, old_result = timeit(old, arg, repeat)
+        if new_result != old_result:
+            raise SystemExit('%s: output differs from the reference '
+                             'implementation' % label)
+        print('  %-22s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx' % (
+            label, new_time, old_time, old_time / max(new_time, 1e-9)))
+    if [decompress_doc(c) for c in compressed] != recs:
+        raise SystemExit('Round trip failed for %s' % name)
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('books', nargs='*', help='Files to use as input, '
+                        'a synthetic book is used if none are given')
+    parser.add_argument('--size', type=int, default=1024 * 1024,
+                        help='Size of the synthetic book (default: 1 MB)')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args(args)
+
+    if opts.books:
+        for path in opts.books:
+            with open(path, 'rb') as f:
+                bench(path, f.read(), opts.repeat)
+    else:
+        bench('synthetic book', synthetic_book(opts.size), opts.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Benchmark the rtf2xml passes run in memory against temporary files.
+
+A large synthetic RTF document, with fonts, colors, styles, footnotes,
+headers, fields, lists and tables, is converted to XML the way the RTF input
+plugin does it, once with every pass going through a temporary file on disk
+as before and once with the passes chained in memory. The XML produced is
+checked to be identical.
+
+Usage: python -m benchmarks.rtf2xml [--size 5000000] [file.rtf ...]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from ebook_converter.ebooks.rtf2xml.ParseRtf import ParseRtf
+
+
+WORDS = ('the of and to in a is that for it as was with be by on not he I '
+         'this are or his from at which but have an they you were her she '
+         'there been one all we their').split()
+
+
+def synthetic_rtf(size, seed=0):
+    rnd = random.Random(seed)
+    parts = [r'{\rtf1\ansi\ansicpg1252\deff0'
+             r'{\fonttbl{\f0\froman\fcharset0 Times New Roman;}'
+             r'{\f1\fswiss\fcharset0 Arial;}{\f2\fnil\fcharset2 Symbol;}}'
+             r'{\colortbl;\red0\green0\blue0;\red255\green0\blue0;'
+             r'\red0\green0\blue255;}'
+             r'{\stylesheet{\s0\f0\fs24 Normal;}'
+             r'{\s1\f1\fs36\b heading 1;}{\s2\f1\fs28\b\i heading 2;}'
+             r'{\s3\f0\fs24\li720 Quote;}}'
+             r'{\info{\title Synthetic book}{\author Benchmark}}'
+             r'{\header \pard\qc Running header\par}' '\n']
+    total = sum(map(len, parts))
+    chapter = 0
+    while total < size:
+        rnd_words = lambda n: ' '.join(rnd.choice(WORDS) for _ in range(n))
+        kind = rnd.random()
+        if kind < 0.03:
+            chapter += 1
+            chunk = r'\pard\s1\f1\fs36\b Chapter %d\b0\par' % chapter
+        elif kind < 0.08:
+            chunk = r'\pard\s2\f1\fs28\b\i %s\b0\i0\par' % rnd_words(5)
+        elif kind < 0.12:
+            rows = []
+            for _ in range(rnd.randint(2, 5)):
+                cells = ''.join(r'\pard\intbl %s\cell ' % rnd_words(3)
+                                for _ in range(3))
+                rows.append(r'\trowd\cellx2000\cellx4000\cellx6000 %s\row'
+                            % cells)
+            chunk = ''.join(rows) + r'\pard'
+        elif kind < 0.16:
+            chunk = ''.join(r'{\pard\li720\fi-360{\pntext\f2 \'b7\tab}'
+                            r'%s\par}' % rnd_words(8)
+                            for _ in range(rnd.randint(2, 6)))
+        else:
+            words = []
+            for i in range(rnd.randint(20, 120)):
+                word = rnd.choice(WORDS)
+                r = rnd.random()
+                if r < 0.03:
+                    word = r'{\b %s}' % word
+                elif r < 0.06:
+                    word = r'{\i %s}' % word
+                elif r < 0.07:
+                    word = r'{\cf2 %s}' % word
+                elif r < 0.075:
+                    word = r'caf\'e9'
+                elif r < 0.077:
+                    word = r'%s{\super\chftn}{\footnote\pard\plain'\
+                        r'{\super\chftn} %s\par}' % (word, rnd_words(10))
+                elif r < 0.078:
+                    word = r'{\field{\*\fldinst HYPERLINK "http://x/%d"}'\
+                        r'{\fldrslt %s}}' % (i, word)
+                words.append(word)
+            style = r'\s3\li720' if rnd.random() < 0.05 else r'\s0'
+            chunk = r'\pard%s\f0\fs24 %s.\par' % (style, ' '.join(words))
+        chunk += '\n'
+        parts.append(chunk)
+        total += len(chunk)
+    parts.append('}\n')
+    return ''.join(parts)
+
+
+def convert(path, in_memory):
+    """Convert path like the RTF input plugin and return the XML."""
+    workdir = tempfile.mkdtemp(prefix='rtf2xml-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        parser = ParseRtf(in_file=path, out_file='dataxml.xml',
+                          convert_symbol=1, convert_zapf=1,
+                          convert_wingdings=1, convert_caps=1, indent=0,
+                          form_lists=1, headings_to_sections=1,
+                          group_styles=1, group_borders=1,
+                          empty_paragraphs=1, deb_dir=None,
+                          default_encoding='cp1252', run_level=1)
+        parser.in_memory = in_memory
+        start = time.perf_counter()
+        parser.parse_rtf()
+        elapsed = time.perf_counter() - start
+        with open('dataxml.xml', 'rb') as f:
+            return elapsed, f.read()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def timeit(path, in_memory, repeat):
+    best = result = None
+    for _ in range(repeat):
+        elapsed, result = convert(path, in_memory)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench(name, path, repeat):
+    print('%s: %d bytes' % (name, os.path.getsize(path)))
+    new_time, new_result = timeit(path, True, repeat)
+    old_time, old_result = timeit(path, False, repeat)
+    if new_result != old_result:
+        raise SystemExit('%s: XML differs from the temporary file pipeline'
+                         % name)
+    print('  %-22s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx' % (
+        'parse_rtf', new_time, old_time, old_time / max(new_time, 1e-9)))
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('files', nargs='*', help='RTF files to use as input, '
+                        'a synthetic document is used if none are given')
+    parser.add_argument('--size', type=int, default=5 * 1024 * 1024,
+                        help='Size of the synthetic document (default: 5 MB)')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args(args)
+
+    paths = [os.path.abspath(p) for p in opts.files]
+    if paths:
+        for path in paths:
+            bench(path, path, opts.repeat)
+        return
+    fd, path = tempfile.mkstemp(suffix='.rtf')
+    try:
+        with os.fdopen(fd, 'w', encoding='ascii') as f:
+            f.write(synthetic_rtf(opts.size))
+        bench('synthetic document', path, opts.repeat)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
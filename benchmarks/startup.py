@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmark the import time of a conversion, failing if cold start regresses.
+
+A new interpreter is started with -X importtime for each run, imports the
+conversion pipeline and looks up the input and output plugins of a
+conversion, as ebook-converter does before converting. The reference run
+also loads every builtin format plugin, which is what importing the plugin
+registry used to do. The import time reported by the interpreter is summed
+over all the modules imported.
+
+The benchmark fails if the conversion imports the module of any format
+plugin other than the two it uses, if it is not faster than the reference,
+or if it takes more than --max-time seconds.
+
+Usage: python -m benchmarks.startup [--formats txt epub] [--max-time 0.5]
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+from ebook_converter.customize import builtins
+from ebook_converter.customize.conversion import FormatPluginEntry, \
+    InputFormatPlugin
+
+
+PLUGINS_PACKAGE = 'ebook_converter.ebooks.conversion.plugins.'
+IMPORT_TIME_PAT = re.compile(r'^import time:\s+(\d+)\s+\|\s+\d+\s+\|\s*(\S+)',
+                             re.MULTILINE)
+
+CONVERSION = '''\
+from ebook_converter.customize import ui
+from ebook_converter.ebooks.conversion import plumber
+ui.plugin_for_input_format(%r)
+ui.plugin_for_output_format(%r)
+'''
+ALL_PLUGINS = '''\
+list(ui.initialized_plugins())
+'''
+
+
+def import_times(code):
+    """Map the modules imported by code in a new interpreter to their own
+    import time, in seconds."""
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                       universal_newlines=True)
+    if p.returncode != 0:
+        raise SystemExit('Failed to run:\n%s\n%s' % (code, p.stderr))
+    return {name: int(us) / 1e6
+            for us, name in IMPORT_TIME_PAT.findall(p.stderr)}
+
+
+def best_of(code, repeat):
+    best = modules = None
+    for _ in range(repeat):
+        modules = import_times(code)
+        total = sum(modules.values())
+        best = total if best is None else min(best, total)
+    return best, modules
+
+
+def plugin_modules(input_fmt, output_fmt):
+    """The modules of the plugins converting input_fmt to output_fmt."""
+    ans = set()
+    for entry in builtins.plugins:
+        if not isinstance(entry, FormatPluginEntry):
+            continue
+        if entry.type == InputFormatPlugin.type:
+            used = input_fmt in entry.file_types
+        else:
+            used = output_fmt == entry.file_type
+        if used:
+            ans.add(entry.actual_plugin.partition(':')[0])
+    return ans
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--formats', nargs=2, default=('txt', 'epub'),
+                        metavar=('INPUT', 'OUTPUT'),
+                        help='The formats of the conversion (default: txt '
+                        'epub)')
+    parser.add_argument('--max-time', type=float, default=None,
+                        help='Fail if the imports of the conversion take '
+                        'longer than this, in seconds')
+    parser.add_argument('--repeat', type=int, default=5)
+    opts = parser.parse_args(args)
+
+    input_fmt, output_fmt = (x.lower() for x in opts.formats)
+    code = CONVERSION % (input_fmt, output_fmt)
+    new_time, modules = best_of(code, opts.repeat)
+    old_time, old_modules = best_of(code + ALL_PLUGINS, opts.repeat)
+    print('%s to %s: %d modules imported, %d when loading every plugin' % (
+        input_fmt, output_fmt, len(modules), len(old_modules)))
+    print('  %-22s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx' % (
+        'import time', new_time, old_time, old_time / max(new_time, 1e-9)))
+
+    expected = plugin_modules(input_fmt, output_fmt)
+    if not expected:
+        raise SystemExit('No plugins to convert %s to %s' % (
+            input_fmt, output_fmt))
+    unexpected = sorted(name for name in modules
+                        if name.startswith(PLUGINS_PACKAGE) and
+                        name not in expected)
+    if unexpected:
+        raise SystemExit('The conversion imports unused format plugins: %s'
+                         % ', '.join(unexpected))
+    if new_time >= old_time:
+        raise SystemExit('Importing the conversion is not faster than '
+                         'loading every plugin')
+    if opts.max_time is not None and new_time > opts.max_time:
+        raise SystemExit('Importing the conversion took %.4fs, more than '
+                         '%.4fs' % (new_time, opts.max_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Benchmark style resolution of the Stylizer on a book with a large stylesheet.
+
+A synthetic book with one big stylesheet shared by all chapters is styled
+chapter by chapter. Rule matching through the selector index is compared to
+the previous approach of matching every rule against the whole tree, and the
+matched elements are checked to be the same.
+
+Usage: python -m benchmarks.stylizer [--rules 5000] [--chapters 200]
+"""
+import argparse
+import random
+import sys
+import time
+
+from css_parser import parseString
+from lxml import etree
+
+from ebook_converter import constants as const
+from ebook_converter import logging
+from ebook_converter.css_selectors import Select, SelectorError
+from ebook_converter.customize.profiles import OutputProfile
+from ebook_converter.ebooks.oeb.base import OEBBook
+from ebook_converter.ebooks.oeb.stylizer import Stylizer
+
+
+TAGS = ('p', 'div', 'span', 'em', 'strong', 'a', 'h2', 'h3', 'blockquote')
+
+
+class Options(object):
+    change_justification = 'original'
+
+    def __init__(self):
+        self.output_profile = OutputProfile(None)
+
+
+def synthetic_css(num_rules, seed=0):
+    rnd = random.Random(seed)
+    rules = []
+    for i in range(num_rules):
+        kind = rnd.random()
+        if kind < 0.4:
+            sel = '.c%d' % i
+        elif kind < 0.6:
+            sel = '%s.c%d' % (rnd.choice(TAGS), i)
+        elif kind < 0.75:
+            sel = 'div.s%d %s' % (rnd.randrange(num_rules // 10),
+                                  rnd.choice(TAGS))
+        elif kind < 0.85:
+            sel = 'h2 + p.c%d' % i
+        elif kind < 0.95:
+            sel = '#id%d' % i
+        else:
+            sel = '%s:first-child' % rnd.choice(TAGS)
+        rules.append('%s { margin-left: %dpx; color: #%06x }' % (
+            sel, rnd.randrange(50), rnd.randrange(0xffffff)))
+    return '\n'.join(rules)
+
+
+def synthetic_chapter(num, num_rules, seed=0):
+    rnd = random.Random(seed + num)
+    root = etree.Element('{%s}html' % const.XHTML_NS, nsmap={None:
+                                                             const.XHTML_NS})
+    head = etree.SubElement(root, '{%s}head' % const.XHTML_NS)
+    etree.SubElement(head, '{%s}link' % const.XHTML_NS, rel='stylesheet',
+                     type='text/css', href='style.css')
+    body = etree.SubElement(root, '{%s}body' % const.XHTML_NS)
+    section = None
+    for i in range(300):
+        if section is None or rnd.random() < 0.05:
+            section = etree.SubElement(
+                body, '{%s}div' % const.XHTML_NS,
+                {'class': 's%d' % rnd.randrange(num_rules // 10)})
+        elem = etree.SubElement(section, '{%s}%s' % (const.XHTML_NS,
+                                                    rnd.choice(TAGS)))
+        elem.set('class', 'c%d' % rnd.randrange(num_rules))
+        if rnd.random() < 0.02:
+            elem.set('id', 'id%d' % rnd.randrange(num_rules))
+        elem.text = 'Paragraph %d of chapter %d' % (i, num)
+    return root
+
+
+def synthetic_book(num_rules, num_chapters, seed=0):
+    oeb = OEBBook(logging.default_log, html_preprocessor=None)
+    oeb.manifest.add('css', 'style.css', 'text/css',
+                     data=parseString(synthetic_css(num_rules, seed),
+                                      validate=False))
+    for num in range(num_chapters):
+        item = oeb.manifest.add('ch%d' % num, 'chapter%d.html' % num,
+                                'application/xhtml+xml',
+                                data=synthetic_chapter(num, num_rules, seed))
+        oeb.spine.add(item, True)
+    return oeb
+
+
+def reference_matches(rules, tree):
+    select = Select(tree, ignore_inappropriate_pseudo_classes=True)
+    ans = []
+    for i, (_, _, _, text, _) in enumerate(rules):
+        try:
+            matches = tuple(select(text))
+        except SelectorError:
+            continue
+        if matches:
+            ans.append((i, matches))
+    return ans
+
+
+def indexed_matches(index, tree):
+    select = Select(tree, ignore_inappropriate_pseudo_classes=True)
+    ans = []
+    for i in index.candidates(select):
+        try:
+            matches = index.matches(select, i)
+        except SelectorError:
+            continue
+        if matches:
+            ans.append((i, matches))
+    return ans
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rules', type=int, default=5000)
+    parser.add_argument('--chapters', type=int, default=200)
+    opts = parser.parse_args(args)
+
+    oeb = synthetic_book(opts.rules, opts.chapters)
+    options = Options()
+    print('%d rules, %d chapters' % (opts.rules, opts.chapters))
+
+    start = time.perf_counter()
+    for item in oeb.spine:
+        Stylizer(item.data, item.href, oeb, options, options.output_profile)
+    print('  %-24s %9.4fs' % ('Stylizer, whole book', time.perf_counter() -
+                              start))
+
+    stylizer_rules = oeb.stylizer_rules
+    trees = [item.data for item in oeb.spine]
+    start = time.perf_counter()
+    index = stylizer_rules.index
+    new = [indexed_matches(index, tree) for tree in trees]
+    new_time = time.perf_counter() - start
+    start = time.perf_counter()
+    old = [reference_matches(stylizer_rules.rules, tree) for tree in trees]
+    old_time = time.perf_counter() - start
+    if new != old:
+        raise SystemExit('Matched elements differ from full tree matching')
+    print('  %-24s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx' % (
+        'rule matching', new_time, old_time, old_time / max(new_time, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
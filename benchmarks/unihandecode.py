@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Benchmark the unihandecode translation tables against code point lookups.
+
+A synthetic Japanese novel, mostly kana and kanji with punctuation, some
+Latin text and the odd character outside the BMP, is transliterated to ASCII
+with the table of every language, once with str.translate() and once by
+looking up each non ASCII character in the code point dictionaries as
+before. The results are checked to be identical. The time to build a table
+from the code point modules and to load it from the disk cache is reported
+too, the reference including the import of the code point modules.
+
+Usage: python -m benchmarks.unihandecode [--size 500000] [file.txt ...]
+"""
+import argparse
+import importlib
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from ebook_converter.ebooks.unihandecode import tables
+
+
+HIRAGANA = [chr(c) for c in range(0x3041, 0x3097)]
+KATAKANA = [chr(c) for c in range(0x30a1, 0x30fb)]
+KANJI = [chr(c) for c in range(0x4e00, 0x9fa6)]
+PUNCTUATION = '、。「」『』（）・…！？ー'
+LATIN = ('Tokyo', 'Kyoto', 'OK', 'CD', 'Mr.', '1964', 'café', 'Ｔｏｋｙｏ')
+ASTRAL = ('\U00020b9f', '\U0002000b', '\U0001d400')
+
+
+def synthetic_novel(size, seed=0):
+    rnd = random.Random(seed)
+    # A small vocabulary, as in real text, where the same words come back
+    words = [''.join(rnd.choice(KANJI) for _ in range(rnd.randint(1, 3)))
+             for _ in range(3000)]
+    parts, total, chapter = [], 0, 0
+    while total < size:
+        if rnd.random() < 0.002:
+            chapter += 1
+            chunk = '第%d章\n\n' % chapter
+        else:
+            sentence = []
+            for _ in range(rnd.randint(4, 20)):
+                r = rnd.random()
+                if r < 0.45:
+                    sentence.append(rnd.choice(words))
+                elif r < 0.85:
+                    sentence.append(''.join(
+                        rnd.choice(HIRAGANA)
+                        for _ in range(rnd.randint(1, 4))))
+                elif r < 0.95:
+                    sentence.append(''.join(
+                        rnd.choice(KATAKANA)
+                        for _ in range(rnd.randint(2, 5))))
+                elif r < 0.99:
+                    sentence.append(rnd.choice(LATIN))
+                else:
+                    sentence.append(rnd.choice(ASTRAL))
+                if rnd.random() < 0.1:
+                    sentence.append(rnd.choice(PUNCTUATION))
+            chunk = ''.join(sentence) + '。'
+            if rnd.random() < 0.2:
+                chunk = '「%s」' % chunk
+            if rnd.random() < 0.15:
+                chunk += '\n'
+        parts.append(chunk)
+        total += len(chunk)
+    return ''.join(parts)
+
+
+def reference_decoder(lang):
+    """Replace code points the way the decoders did before the tables."""
+    codepoints = {}
+    for name in tables.module_names(lang):
+        module = importlib.import_module('%s.%s' % (
+            tables.__package__, name))
+        codepoints.update(module.CODEPOINTS)
+
+    def replace_point(m):
+        c = ord(m.group())
+        try:
+            return codepoints['x%02x' % (c >> 8)][c & 255]
+        except Exception:
+            return '?'
+
+    return lambda text: re.sub('[^\x00-\x7f]', replace_point, text)
+
+
+def timeit(func, arg, repeat):
+    best = result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def build_cold(lang):
+    # Building a table in a new process imports the code point modules
+    for name in tables.module_names(lang):
+        sys.modules.pop('%s.%s' % (tables.__package__, name), None)
+    return tables.build_table(lang)
+
+
+def bench_tables(repeat):
+    cache = tempfile.mkdtemp(prefix='unihandecode-bench-')
+    previous = os.environ.get('XDG_CACHE_HOME')
+    os.environ['XDG_CACHE_HOME'] = cache
+    try:
+        for lang in sorted(tables.LANG_MODULES):
+            build_time, _ = timeit(build_cold, lang, repeat)
+            tables.load_table(lang)
+            load_time, _ = timeit(tables.load_table, lang, repeat)
+            print('  %-22s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx'
+                  % ('%s table' % lang, load_time, build_time,
+                     build_time / max(load_time, 1e-9)))
+    finally:
+        if previous is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = previous
+        shutil.rmtree(cache, ignore_errors=True)
+
+
+def bench(name, text, repeat):
+    print('%s: %d characters' % (name, len(text)))
+    for lang in sorted(tables.LANG_MODULES):
+        table, astral = tables.translation_table(lang)
+        new_time, new_result = timeit(
+            lambda t: tables.transliterate(t, table, astral), text, repeat)
+        old_time, old_result = timeit(reference_decoder(lang), text, repeat)
+        if new_result != old_result:
+            raise SystemExit('%s: %s transliteration differs from the code '
+                             'point lookups' % (name, lang))
+        print('  %-22s new: %9.4fs  reference: %9.4fs  speedup: %6.1fx' % (
+            '%s decode' % lang, new_time, old_time,
+            old_time / max(new_time, 1e-9)))
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('files', nargs='*', help='UTF-8 text files to use as '
+                        'input, a synthetic novel is used if none are given')
+    parser.add_argument('--size', type=int, default=500000,
+                        help='Number of characters of the synthetic novel '
+                        '(default: 500000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args(args)
+
+    print('Translation tables')
+    bench_tables(opts.repeat)
+    if opts.files:
+        for path in opts.files:
+            with open(path, encoding='utf-8') as f:
+                bench(path, f.read(), opts.repeat)
+    else:
+        bench('synthetic novel', synthetic_novel(opts.size), opts.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import mimetypes
-import pkg_resources
+import os
 
 
-mimetypes.init([pkg_resources.
-                resource_filename('ebook_converter', 'data/mime.types')])
+# Not through pkg_resources, which is slow to import
+mimetypes.init([os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'data', 'mime.types')])
@@ -8,6 +8,9 @@ from ebook_converter.customize import FileTypePlugin
 from ebook_converter.customize import InterfaceActionBase
 from ebook_converter.customize import MetadataReaderPlugin
 from ebook_converter.customize import MetadataWriterPlugin
+from ebook_converter.customize.conversion import FormatPluginEntry
+from ebook_converter.customize.conversion import InputFormatPlugin
+from ebook_converter.customize.conversion import OutputFormatPlugin
 from ebook_converter.ebooks.html.to_zip import HTML2ZIP
 from ebook_converter.ebooks.metadata.archive import ArchiveExtract
 from ebook_converter.ebooks.metadata.archive import KPFExtract
@@ -612,92 +615,78 @@ plugins += [x for x in list(locals().values()) if isinstance(x, type) and
 # }}}
 
 # Conversion plugins {{{
-from ebook_converter.ebooks.conversion.plugins.comic_input import ComicInput
-from ebook_converter.ebooks.conversion.plugins.djvu_input import DJVUInput
-from ebook_converter.ebooks.conversion.plugins.epub_input import EPUBInput
-from ebook_converter.ebooks.conversion.plugins.fb2_input import FB2Input
-from ebook_converter.ebooks.conversion.plugins.html_input import HTMLInput
-from ebook_converter.ebooks.conversion.plugins.htmlz_input import HTMLZInput
-from ebook_converter.ebooks.conversion.plugins.lit_input import LITInput
-from ebook_converter.ebooks.conversion.plugins.mobi_input import MOBIInput
-from ebook_converter.ebooks.conversion.plugins.odt_input import ODTInput
-from ebook_converter.ebooks.conversion.plugins.pdb_input import PDBInput
-from ebook_converter.ebooks.conversion.plugins.azw4_input import AZW4Input
-from ebook_converter.ebooks.conversion.plugins.pdf_input import PDFInput
-from ebook_converter.ebooks.conversion.plugins.pml_input import PMLInput
-from ebook_converter.ebooks.conversion.plugins.rb_input import RBInput
-from ebook_converter.ebooks.conversion.plugins.recipe_input import RecipeInput
-from ebook_converter.ebooks.conversion.plugins.rtf_input import RTFInput
-from ebook_converter.ebooks.conversion.plugins.tcr_input import TCRInput
-from ebook_converter.ebooks.conversion.plugins.txt_input import TXTInput
-from ebook_converter.ebooks.conversion.plugins.lrf_input import LRFInput
-from ebook_converter.ebooks.conversion.plugins.chm_input import CHMInput
-from ebook_converter.ebooks.conversion.plugins.snb_input import SNBInput
-from ebook_converter.ebooks.conversion.plugins.docx_input import DOCXInput
-
-from ebook_converter.ebooks.conversion.plugins.epub_output import EPUBOutput
-from ebook_converter.ebooks.conversion.plugins.fb2_output import FB2Output
-from ebook_converter.ebooks.conversion.plugins.lit_output import LITOutput
-from ebook_converter.ebooks.conversion.plugins.lrf_output import LRFOutput
-from ebook_converter.ebooks.conversion.plugins.mobi_output import (MOBIOutput,
-        AZW3Output)
-from ebook_converter.ebooks.conversion.plugins.oeb_output import OEBOutput
-from ebook_converter.ebooks.conversion.plugins.pdb_output import PDBOutput
-from ebook_converter.ebooks.conversion.plugins.pdf_output import PDFOutput
-from ebook_converter.ebooks.conversion.plugins.pml_output import PMLOutput
-from ebook_converter.ebooks.conversion.plugins.rb_output import RBOutput
-from ebook_converter.ebooks.conversion.plugins.rtf_output import RTFOutput
-from ebook_converter.ebooks.conversion.plugins.tcr_output import TCROutput
-from ebook_converter.ebooks.conversion.plugins.txt_output import TXTOutput, TXTZOutput
-from ebook_converter.ebooks.conversion.plugins.html_output import HTMLOutput
-from ebook_converter.ebooks.conversion.plugins.htmlz_output import HTMLZOutput
-from ebook_converter.ebooks.conversion.plugins.snb_output import SNBOutput
-from ebook_converter.ebooks.conversion.plugins.docx_output import DOCXOutput
-
-plugins += [
-    ComicInput,
-    DJVUInput,
-    EPUBInput,
-    FB2Input,
-    HTMLInput,
-    HTMLZInput,
-    LITInput,
-    MOBIInput,
-    ODTInput,
-    PDBInput,
-    AZW4Input,
-    PDFInput,
-    PMLInput,
-    RBInput,
-    RecipeInput,
-    RTFInput,
-    TCRInput,
-    TXTInput,
-    LRFInput,
-    CHMInput,
-    SNBInput,
-    DOCXInput,
-]
-plugins += [
-    EPUBOutput,
-    DOCXOutput,
-    FB2Output,
-    LITOutput,
-    LRFOutput,
-    MOBIOutput, AZW3Output,
-    OEBOutput,
-    PDBOutput,
-    PDFOutput,
-    PMLOutput,
-    RBOutput,
-    RTFOutput,
-    TCROutput,
-    TXTOutput,
-    TXTZOutput,
-    HTMLOutput,
-    HTMLZOutput,
-    SNBOutput,
-]
+# The input and output plugins are described here and only imported when a
+# conversion uses them, see FormatPluginEntry
+
+# (module:class, name, file types)
+input_format_plugins = (
+    ('comic_input:ComicInput', 'Comic Input', {'cbz', 'cbr', 'cbc'}),
+    ('djvu_input:DJVUInput', 'DJVU Input', {'djvu', 'djv'}),
+    ('epub_input:EPUBInput', 'EPUB Input', {'epub'}),
+    ('fb2_input:FB2Input', 'FB2 Input', {'fb2', 'fbz'}),
+    ('html_input:HTMLInput', 'HTML Input',
+     {'opf', 'html', 'htm', 'xhtml', 'xhtm', 'shtm', 'shtml'}),
+    ('htmlz_input:HTMLZInput', 'HTLZ Input', {'htmlz'}),
+    ('lit_input:LITInput', 'LIT Input', {'lit'}),
+    ('mobi_input:MOBIInput', 'MOBI Input',
+     {'mobi', 'prc', 'azw', 'azw3', 'pobi'}),
+    ('odt_input:ODTInput', 'ODT Input', {'odt'}),
+    ('pdb_input:PDBInput', 'PDB Input', {'pdb', 'updb'}),
+    ('azw4_input:AZW4Input', 'AZW4 Input', {'azw4'}),
+    ('pdf_input:PDFInput', 'PDF Input', {'pdf'}),
+    ('pml_input:PMLInput', 'PML Input', {'pml', 'pmlz'}),
+    ('rb_input:RBInput', 'RB Input', {'rb'}),
+    ('recipe_input:RecipeInput', 'Recipe Input',
+     {'recipe', 'downloaded_recipe'}),
+    ('rtf_input:RTFInput', 'RTF Input', {'rtf'}),
+    ('tcr_input:TCRInput', 'TCR Input', {'tcr'}),
+    ('txt_input:TXTInput', 'TXT Input',
+     {'txt', 'txtz', 'text', 'md', 'textile', 'markdown'}),
+    ('lrf_input:LRFInput', 'LRF Input', {'lrf'}),
+    ('chm_input:CHMInput', 'CHM Input', {'chm'}),
+    ('snb_input:SNBInput', 'SNB Input', {'snb'}),
+    ('docx_input:DOCXInput', 'DOCX Input', {'docx', 'docm'}),
+)
+
+# (module:class, name, file type)
+output_format_plugins = (
+    ('epub_output:EPUBOutput', 'EPUB Output', 'epub'),
+    ('docx_output:DOCXOutput', 'DOCX Output', 'docx'),
+    ('fb2_output:FB2Output', 'FB2 Output', 'fb2'),
+    ('lit_output:LITOutput', 'LIT Output', 'lit'),
+    ('lrf_output:LRFOutput', 'LRF Output', 'lrf'),
+    ('mobi_output:MOBIOutput', 'MOBI Output', 'mobi'),
+    ('mobi_output:AZW3Output', 'AZW3 Output', 'azw3'),
+    ('oeb_output:OEBOutput', 'OEB Output', 'oeb'),
+    ('pdb_output:PDBOutput', 'PDB Output', 'pdb'),
+    ('pdf_output:PDFOutput', 'PDF Output', 'pdf'),
+    ('pml_output:PMLOutput', 'PML Output', 'pmlz'),
+    ('rb_output:RBOutput', 'RB Output', 'rb'),
+    ('rtf_output:RTFOutput', 'RTF Output', 'rtf'),
+    ('tcr_output:TCROutput', 'TCR Output', 'tcr'),
+    ('txt_output:TXTOutput', 'TXT Output', 'txt'),
+    ('txt_output:TXTZOutput', 'TXTZ Output', 'txtz'),
+    ('html_output:HTMLOutput', 'HTML Output', 'zip'),
+    ('htmlz_output:HTMLZOutput', 'HTMLZ Output', 'htmlz'),
+    ('snb_output:SNBOutput', 'SNB Output', 'snb'),
+)
+
+_plugins_package = 'ebook_converter.ebooks.conversion.plugins.'
+plugins += [FormatPluginEntry(_plugins_package + plugin, name,
+                              InputFormatPlugin.type, file_types=file_types)
+            for plugin, name, file_types in input_format_plugins]
+plugins += [FormatPluginEntry(_plugins_package + plugin, name,
+                              OutputFormatPlugin.type, file_type=file_type)
+            for plugin, name, file_type in output_format_plugins]
+
+
+def __getattr__(name):
+    # The classes of the format plugins used to be imported in this module
+    for entry in plugins:
+        if isinstance(entry, FormatPluginEntry) and \
+                entry.actual_plugin.endswith(':' + name):
+            return entry.load()
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 # }}}
 
 # Profiles {{{
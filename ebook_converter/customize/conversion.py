@@ -1,7 +1,7 @@
 """
 Defines the plugin system for conversions.
 """
-import re, os, shutil, numbers
+import re, os, shutil, numbers, importlib
 
 from ebook_converter.customize import Plugin
 from ebook_converter.utils import directory
@@ -131,6 +131,11 @@ class InputFormatPlugin(Plugin):
     #: detected individually
     output_encoding = 'utf-8'
 
+    #: The :class:`OEBReader` (or a callable returning one) used to read the
+    #: OPF returned by :meth:`convert`. None means the default reader.
+    #: This can be set dynamically, in the convert method.
+    oeb_reader = None
+
     #: Options shared by all Input format plugins. Do not override
     #: in sub-classes. Use :attr:`options` instead. Every option must be an
     #: instance of :class:`OptionRecommendation`.
@@ -228,6 +233,13 @@ class InputFormatPlugin(Plugin):
         '''
         pass
 
+    def cleanup(self):
+        '''
+        Called once the conversion is over, successful or not, to release
+        the files and other resources the input plugin kept open.
+        '''
+        pass
+
 
 class OutputFormatPlugin(Plugin):
 
@@ -318,3 +330,32 @@ class OutputFormatPlugin(Plugin):
 
         '''
         pass
+
+
+class FormatPluginEntry(object):
+
+    '''
+    A builtin input or output format plugin, described by what is needed to
+    pick it for a conversion: its name, type and file types. The module of
+    the plugin is only imported when the plugin is used, by :meth:`load`.
+    '''
+
+    def __init__(self, actual_plugin, name, type, file_types=(),
+                 file_type=None, priority=1):
+        #: The plugin class, as ``module:ClassName``
+        self.actual_plugin = actual_plugin
+        self.name = name
+        self.type = type
+        self.file_types = set(file_types)
+        self.file_type = file_type
+        self.priority = priority
+
+    def load(self):
+        '''
+        Import and return the plugin class.
+        '''
+        mod, cls = self.actual_plugin.split(':')
+        return getattr(importlib.import_module(mod), cls)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.actual_plugin)
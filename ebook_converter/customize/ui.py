@@ -367,23 +367,45 @@ def can_set_metadata(ftype):
 
 
 # Input/Output format plugins
-def input_format_plugins():
+def _format_plugins(base):
+    # The format plugins of the given type, builtin ones not loaded yet
+    # being FormatPluginEntry objects
     for plugin in _initialized_plugins:
-        if isinstance(plugin, conversion.InputFormatPlugin):
+        if isinstance(plugin, base) or (
+                isinstance(plugin, conversion.FormatPluginEntry) and
+                plugin.type == base.type):
             yield plugin
 
 
+def _load_format_plugin(plugin):
+    if isinstance(plugin, conversion.FormatPluginEntry):
+        entry = plugin
+        plugin = initialize_plugin(entry.load(), None)
+        try:
+            _initialized_plugins[_initialized_plugins.index(entry)] = plugin
+        except ValueError:
+            # The plugins were initialized again meanwhile
+            pass
+    return plugin
+
+
+def input_format_plugins():
+    for plugin in list(_format_plugins(conversion.InputFormatPlugin)):
+        yield _load_format_plugin(plugin)
+
+
 def plugin_for_input_format(fmt):
     customization = config['plugin_customization']
-    for plugin in input_format_plugins():
+    for plugin in _format_plugins(conversion.InputFormatPlugin):
         if fmt.lower() in plugin.file_types:
+            plugin = _load_format_plugin(plugin)
             plugin.site_customization = customization.get(plugin.name, None)
             return plugin
 
 
 def all_input_formats():
     formats = set()
-    for plugin in input_format_plugins():
+    for plugin in _format_plugins(conversion.InputFormatPlugin):
         for format in plugin.file_types:
             formats.add(format)
     return formats
@@ -391,7 +413,7 @@ def all_input_formats():
 
 def available_input_formats():
     formats = set()
-    for plugin in input_format_plugins():
+    for plugin in _format_plugins(conversion.InputFormatPlugin):
         for format in plugin.file_types:
             formats.add(format)
     formats.add('zip')
@@ -400,22 +422,22 @@ def available_input_formats():
 
 
 def output_format_plugins():
-    for plugin in _initialized_plugins:
-        if isinstance(plugin, conversion.OutputFormatPlugin):
-            yield plugin
+    for plugin in list(_format_plugins(conversion.OutputFormatPlugin)):
+        yield _load_format_plugin(plugin)
 
 
 def plugin_for_output_format(fmt):
     customization = config['plugin_customization']
-    for plugin in output_format_plugins():
+    for plugin in _format_plugins(conversion.OutputFormatPlugin):
         if fmt.lower() == plugin.file_type:
+            plugin = _load_format_plugin(plugin)
             plugin.site_customization = customization.get(plugin.name, None)
             return plugin
 
 
 def available_output_formats():
     formats = set()
-    for plugin in output_format_plugins():
+    for plugin in _format_plugins(conversion.OutputFormatPlugin):
         formats.add(plugin.file_type)
     return formats
 
@@ -478,6 +500,10 @@ def initialize_plugins():
     ostdout, ostderr = sys.stdout, sys.stderr
 
     for zfp in list(external_plugins) + builtins.plugins:
+        if isinstance(zfp, conversion.FormatPluginEntry):
+            # Initialized when it is first used
+            _initialized_plugins.append(zfp)
+            continue
         try:
             plugin = initialize_plugin(zfp, None)
             _initialized_plugins.append(plugin)
@@ -493,8 +519,8 @@ initialize_plugins()
 
 
 def initialized_plugins():
-    for plugin in _initialized_plugins:
-        yield plugin
+    for plugin in list(_initialized_plugins):
+        yield _load_format_plugin(plugin)
 
 
 # CLI
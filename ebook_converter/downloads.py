@@ -0,0 +1,145 @@
+"""
+Streaming file downloads for the web interface.
+
+Converted books are sent to the client straight from disk in fixed size
+chunks, with support for HTTP Range requests, instead of being loaded into
+memory and embedded into a JSON document.
+"""
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+from urllib.parse import quote
+
+from flask import Response, request
+
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class WorkDir:
+    """
+    Temporary work directory whose lifetime can outlive the request handler.
+
+    Used as a context manager the directory is removed when the block exits,
+    unless :meth:`release_after` handed it over to a response, in which case
+    it is removed once the response has been fully streamed (or the client
+    went away).
+    """
+
+    def __init__(self, prefix='ebook-converter-'):
+        self.path = tempfile.mkdtemp(prefix=prefix)
+        self._handed_over = False
+
+    def join(self, *parts):
+        return os.path.join(self.path, *parts)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def release_after(self, response):
+        """Defer removal of the directory until the response is closed."""
+        self._handed_over = True
+        response.call_on_close(self.cleanup)
+        return response
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if not self._handed_over:
+            self.cleanup()
+
+
+def content_disposition(filename, disposition='attachment'):
+    """
+    Build a Content-Disposition header value carrying both an ASCII fallback
+    filename and the original (e.g. Chinese) one, encoded as per RFC 5987.
+    """
+    ascii_name = unicodedata.normalize('NFKD', filename)
+    ascii_name = ascii_name.encode('ascii', 'ignore').decode('ascii')
+    ascii_name = re.sub(r'[\\"\r\n]', '', ascii_name).strip()
+    ext = os.path.splitext(filename)[1]
+    if not ascii_name or ascii_name == ext:
+        ascii_name = 'download' + ext
+    value = '%s; filename="%s"' % (disposition, ascii_name)
+    if ascii_name != filename:
+        value += "; filename*=UTF-8''%s" % quote(filename, safe='')
+    return value
+
+
+def parse_range(header, size):
+    """
+    Parse a single range ``Range: bytes=...`` header.
+
+    Returns ``None`` when the whole file should be sent, a ``(start, end)``
+    tuple (end inclusive) for a satisfiable range or raises ValueError for an
+    unsatisfiable one. Multiple ranges are not supported and are answered
+    with the whole file, which is permitted by RFC 7233.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            # Nothing to send from an empty file either
+            raise ValueError('Unsatisfiable range: %s' % header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = size - 1 if not last else min(int(last), size - 1)
+    if start >= size or start > end:
+        raise ValueError('Unsatisfiable range: %s' % header)
+    return start, end
+
+
+def _read_chunks(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def stream_file(path, download_name, mimetype=None):
+    """
+    Return a response streaming the file at ``path`` in chunks, honoring a
+    Range header of the current request.
+    """
+    size = os.path.getsize(path)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(download_name)[0] or \
+            'application/octet-stream'
+    headers = {'Accept-Ranges': 'bytes',
+               'Content-Disposition': content_disposition(download_name)}
+
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        headers['Content-Range'] = 'bytes */%d' % size
+        return Response(status=416, headers=headers)
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+        headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    length = end - start + 1 if size else 0
+    headers['Content-Length'] = str(length)
+
+    return Response(_read_chunks(path, start, length), status=status,
+                    headers=headers, mimetype=mimetype)
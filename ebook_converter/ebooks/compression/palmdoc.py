@@ -1,91 +1,122 @@
-import io
-import sys
-from struct import pack
+"""
+PalmDOC (LZ77 variant) compression as used by MOBI, PDB and eReader files.
+"""
+
+# Maximum distance and length of a back-reference
+MAX_DISTANCE = 2047
+MAX_LENGTH = 10
+MIN_LENGTH = 3
 
 
 def decompress_doc(data):
-    uncompressed = b''
-    skip_next = 0
+    data = bytes(data)
+    ldata = len(data)
+    out = bytearray()
+    i = 0
 
-    for idx, item in enumerate(data):
-        if skip_next:
-            skip_next -= 1
-            continue
+    while i < ldata:
+        item = data[i]
+        i += 1
 
-        if item in range(1, 9):
+        if 1 <= item <= 8:
             # copy amount of bytes as in item
-            skip_next = item
-            for amount in range(1, item + 1):
-                uncompressed += data[idx + amount].to_bytes(1, sys.byteorder)
+            if i + item > ldata:
+                raise IndexError('PalmDOC literal run past the end of data')
+            out += data[i:i + item]
+            i += item
 
         elif item < 128:
             # direct ascii copy
-            uncompressed += item.to_bytes(1, sys.byteorder)
+            out.append(item)
 
         elif item >= 192:
             # merged space and ascii character
-            uncompressed += b' ' + (item ^ 128).to_bytes(1, sys.byteorder)
+            out.append(0x20)
+            out.append(item ^ 128)
 
         else:
             # compressed data, item contains how many characters should be
             # repeated for the next one.
-            skip_next = 1
-            item = (item << 8) + data[idx + 1]
-            character_index = (item & 0x3FFF) >> 3
-            for _ in range((item & 7) + 3):
-                uncompressed += (uncompressed[len(uncompressed) -
-                                              character_index]
-                                 .to_bytes(1, sys.byteorder))
+            item = (item << 8) + data[i]
+            i += 1
+            distance = (item & 0x3FFF) >> 3
+            length = (item & 7) + 3
+            start = len(out) - distance
+            if 0 <= start and distance >= length:
+                out += out[start:start + length]
+            else:
+                # Overlapping copy (or a malformed distance), must be done
+                # byte by byte to repeat freshly written data.
+                for _ in range(length):
+                    out.append(out[len(out) - distance])
 
-    return uncompressed
+    return bytes(out)
 
 
 def compress_doc(data):
-    out = io.BytesIO()
-    i = 0
+    data = bytes(data)
+    out = bytearray()
     ldata = len(data)
+    # Hash chains: each three byte sequence maps to the list of positions it
+    # starts at, in increasing order. Only positions whose sequence ends
+    # before the current position are indexed, since back-references may not
+    # overlap the data being encoded.
+    chains = {}
+    indexed = 0
+    i = 0
     while i < ldata:
         if i > 10 and (ldata - i) > 10:
-            chunk = b''
-            match = -1
-            for j in range(10, 2, -1):
-                chunk = data[i:i+j]
-                try:
-                    match = data.rindex(chunk, 0, i)
-                except ValueError:
-                    continue
-                if (i - match) <= 2047:
-                    break
-                match = -1
-            if match >= 0:
-                n = len(chunk)
-                m = i - match
-                code = 0x8000 + ((m << 3) & 0x3ff8) + (n - 3)
-                out.write(pack('>H', code))
-                i += n
+            while indexed <= i - MIN_LENGTH:
+                key = data[indexed:indexed + MIN_LENGTH]
+                chain = chains.get(key)
+                if chain is None:
+                    chains[key] = [indexed]
+                else:
+                    chain.append(indexed)
+                indexed += 1
+
+            best_len = 0
+            best_pos = -1
+            chain = chains.get(data[i:i + MIN_LENGTH])
+            if chain is not None:
+                lowest = i - MAX_DISTANCE
+                for k in range(len(chain) - 1, -1, -1):
+                    pos = chain[k]
+                    if pos < lowest:
+                        break
+                    limit = min(MAX_LENGTH, i - pos)
+                    n = MIN_LENGTH
+                    while n < limit and data[pos + n] == data[i + n]:
+                        n += 1
+                    if n > best_len:
+                        best_len, best_pos = n, pos
+                        if n == MAX_LENGTH:
+                            break
+            if best_pos >= 0:
+                code = 0x8000 + (((i - best_pos) << 3) & 0x3ff8) + \
+                    (best_len - 3)
+                out.append(code >> 8)
+                out.append(code & 0xff)
+                i += best_len
                 continue
-        ch = data[i:i+1]
-        och = ord(ch)
+        och = data[i]
         i += 1
-        if ch == b' ' and (i + 1) < ldata:
-            onch = ord(data[i:i+1])
+        if och == 0x20 and (i + 1) < ldata:
+            onch = data[i]
             if onch >= 0x40 and onch < 0x80:
-                out.write(pack('>B', onch ^ 0x80))
+                out.append(onch ^ 0x80)
                 i += 1
                 continue
         if och == 0 or (och > 8 and och < 0x80):
-            out.write(ch)
+            out.append(och)
         else:
             j = i
-            binseq = [ch]
-            while j < ldata and len(binseq) < 8:
-                ch = data[j:j+1]
-                och = ord(ch)
+            while j < ldata and j - i < 7:
+                och = data[j]
                 if och == 0 or (och > 8 and och < 0x80):
                     break
-                binseq.append(ch)
                 j += 1
-            out.write(pack('>B', len(binseq)))
-            out.write(b''.join(binseq))
-            i += len(binseq) - 1
-    return out.getvalue()
+            out.append(j - i + 1)
+            out += data[i - 1:j]
+            i = j
+    return bytes(out)
@@ -0,0 +1,166 @@
+"""
+Persistent cache of conversion results.
+
+Outputs are stored on disk, content addressed by a key made from the digest
+and the name of the input file, the input and output formats, the effective
+conversion options and the package version, so that converting the same file to the
+same target again can skip the whole pipeline. The store is bounded in size,
+least recently used entries are evicted first.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from filelock import FileLock
+
+from ebook_converter import constants
+
+
+# Bump when the way keys are computed changes
+CACHE_FORMAT = 2
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# Options that have no effect on the output
+IGNORED_OPTIONS = frozenset({'verbose', 'debug_pipeline',
+                             'mobi_compression_workers',
+                             'transform_workers'})
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def canonical_value(value):
+    """Convert an option value into something stable to serialize."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        ans = [canonical_value(x) for x in value]
+        return sorted(ans, key=repr) if isinstance(value, (set, frozenset)) \
+            else ans
+    if isinstance(value, dict):
+        return {str(k): canonical_value(v) for k, v in value.items()}
+    if isinstance(value, bytes):
+        return value.hex()
+    # Profiles and other plugins
+    short_name = getattr(value, 'short_name', None)
+    if short_name is not None:
+        return '%s:%s' % (type(value).__name__, short_name)
+    return str(value)
+
+
+class ResultCache(object):
+    """
+    Size bounded, on disk store of conversion outputs.
+
+    Entries are written atomically and the store is protected by a lock
+    file, so that it can be shared by several processes, for example the
+    workers of the web interface.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.objects = os.path.join(self.path, 'objects')
+        os.makedirs(self.objects, exist_ok=True)
+        self.lock = FileLock(os.path.join(self.path, 'lock'))
+
+    def key(self, input_path, input_fmt, output_fmt, opts):
+        options = {k: canonical_value(v) for k, v in vars(opts).items()
+                   if k not in IGNORED_OPTIONS and not k.startswith('_')}
+        data = {'format': CACHE_FORMAT,
+                'version': constants.VERSION,
+                'input': file_digest(input_path),
+                # Input plugins take the title and other metadata from the
+                # name of the file
+                'input_name': os.path.basename(input_path),
+                'input_fmt': input_fmt,
+                'output_fmt': output_fmt,
+                'options': options}
+        raw = json.dumps(data, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.objects, key)
+
+    def get(self, key, output_path):
+        """
+        Copy the cached output for key to output_path. Returns False if
+        there is no such entry.
+        """
+        path = self.entry(key)
+        with self.lock:
+            if not os.path.isfile(path):
+                return False
+            atomic_copy(path, output_path)
+            # Mark as recently used
+            os.utime(path)
+        return True
+
+    def put(self, key, output_path):
+        """Store the file at output_path as the result for key."""
+        if not os.path.isfile(output_path):
+            # Output formats that produce a directory are not cached
+            return False
+        size = os.path.getsize(output_path)
+        if size > self.max_size:
+            return False
+        fd, tmp = tempfile.mkstemp(dir=self.objects, prefix='.tmp-')
+        os.close(fd)
+        try:
+            shutil.copyfile(output_path, tmp)
+            with self.lock:
+                os.replace(tmp, self.entry(key))
+                self.evict()
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return True
+
+    def evict(self):
+        """Remove least recently used entries until the store fits."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.objects):
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            for entry in os.scandir(self.objects):
+                if entry.is_file():
+                    os.remove(entry.path)
+
+
+def atomic_copy(src, dest):
+    """Copy src to dest so that dest is never seen half written."""
+    dest = os.path.abspath(dest)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix='.tmp-')
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
@@ -106,7 +106,7 @@ class CHMInput(InputFormatPlugin):
 
     def _create_oebbook_html(self, htmlpath, basedir, opts, log, mi):
         # use HTMLInput plugin to generate book
-        from ebook_converter.customize.builtins import HTMLInput
+        from ebook_converter.ebooks.conversion.plugins.html_input import HTMLInput
         opts.breadth_first = True
         htmlinput = HTMLInput(None)
         oeb = htmlinput.create_oebbook(htmlpath, basedir, opts, log, mi)
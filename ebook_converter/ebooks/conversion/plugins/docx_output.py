@@ -4,6 +4,7 @@ from lxml import etree
 
 from ebook_converter import constants as const
 from ebook_converter.customize import conversion
+from ebook_converter.ebooks.conversion.profiling import stage
 from ebook_converter.ebooks.docx.dump import do_dump
 from ebook_converter.ebooks.docx.writer.container import DOCX
 from ebook_converter.ebooks.docx.writer.from_html import Convert
@@ -79,8 +80,10 @@ class DOCXOutput(conversion.OutputFormatPlugin):
     def convert(self, oeb, output_path, input_plugin, opts, log):
         docx = DOCX(opts, log)
         self.convert_metadata(oeb)
-        Convert(oeb, docx, self.mi, not opts.docx_no_cover,
-                not opts.docx_no_toc)()
-        docx.write(output_path, self.mi)
+        with stage('Convert'):
+            Convert(oeb, docx, self.mi, not opts.docx_no_cover,
+                    not opts.docx_no_toc)()
+        with stage('write'):
+            docx.write(output_path, self.mi)
         if opts.extract_to:
             do_dump(output_path, opts.extract_to)
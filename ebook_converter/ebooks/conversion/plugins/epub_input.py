@@ -1,5 +1,7 @@
+import functools
 import hashlib
 import itertools
+import mmap
 import os
 import re
 import posixpath
@@ -19,6 +21,14 @@ from ebook_converter.customize.conversion import OptionRecommendation
 ADOBE_OBFUSCATION = 'http://ns.adobe.com/pdf/enc#RC'
 IDPF_OBFUSCATION = 'http://www.idpf.org/2008/embedding'
 
+# Resources the input plugin never looks at. They are left in the archive
+# and only decompressed if the conversion actually reads them.
+LAZY_EXTENSIONS = frozenset((
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'tif', 'tiff',
+    'ttf', 'otf', 'woff', 'woff2',
+    'mp3', 'm4a', 'aac', 'ogg', 'oga', 'wav', 'mp4', 'm4v', 'webm',
+))
+
 
 def decrypt_font_data(key, data, algorithm):
     is_adobe = algorithm == ADOBE_OBFUSCATION
@@ -46,6 +56,10 @@ class EPUBInput(InputFormatPlugin):
 
     recommendations = {('page_breaks_before', '/', OptionRecommendation.MED)}
 
+    #: The open ZIP archive of the book being converted, members that were
+    #: not extracted are read from it on demand
+    archive = None
+
     def process_encryption(self, encfile, opf, log):
         idpf_key = opf.raw_unique_identifier
         if idpf_key:
@@ -232,6 +246,7 @@ class EPUBInput(InputFormatPlugin):
                                  href=guide_elem.get('href'),
                                  id='calibre_raster_cover')
             t.set('media-type', 'image/jpeg')
+            self.extract_archive()
             if os.path.exists(guide_cover):
                 renderer = render_html_svg_workaround(guide_cover, log)
                 if renderer is not None:
@@ -263,14 +278,49 @@ class EPUBInput(InputFormatPlugin):
         except Exception:
             traceback.print_exc()
 
-    def convert(self, stream, options, file_ext, log, accelerators):
+    def open_archive(self, stream):
+        """
+        Open the EPUB as a ZIP archive, memory mapping the file if possible,
+        and extract everything but the resources listed in LAZY_EXTENSIONS.
+        """
         from ebook_converter.utils.zipfile import ZipFile
+        try:
+            zf = ZipFile(mmap.mmap(stream.fileno(), 0,
+                                   access=mmap.ACCESS_READ))
+        except Exception:
+            # Not a real file, or too small for a valid archive
+            stream.seek(0)
+            zf = ZipFile(stream)
+        members = [x for x in zf.namelist() if x.endswith('/') or
+                   x.rpartition('.')[-1].lower() not in LAZY_EXTENSIONS]
+        zf.extractall(os.getcwd(), members=members)
+        return zf
+
+    def extract_archive(self):
+        """
+        Extract the members that were left in the archive, for code that
+        needs the whole book on disk.
+        """
+        if self.archive is not None:
+            self.archive.extractall(os.getcwd())
+
+    def cleanup(self):
+        if self.archive is not None:
+            fp = self.archive.fp
+            self.archive.close()
+            if fp is not None:
+                # Not closed by the archive, which was given it
+                fp.close()
+            self.archive = None
+
+    def convert(self, stream, options, file_ext, log, accelerators):
         from ebook_converter.ebooks import DRMError
+        from ebook_converter.ebooks.oeb.reader import OEBReader
 
         _path_or_stream = getattr(stream, 'name', 'stream')
+        self.archive = self.oeb_reader = None
         try:
-            zf = ZipFile(stream)
-            zf.extractall(os.getcwd())
+            self.archive = self.open_archive(stream)
         except Exception:
             log.exception('EPUB appears to be invalid ZIP file, trying a '
                           'more forgiving ZIP parser')
@@ -278,6 +328,9 @@ class EPUBInput(InputFormatPlugin):
             stream.seek(0)
             extractall(stream)
         encfile = os.path.abspath(os.path.join('META-INF', 'encryption.xml'))
+        if os.path.exists(encfile):
+            # Obfuscated fonts are decrypted in place
+            self.extract_archive()
         opf = self.find_opf()
         if opf is None:
             for root, _, fnames in os.walk('.'):
@@ -362,6 +415,13 @@ class EPUBInput(InputFormatPlugin):
         with open('content.opf', 'wb') as nopf:
             nopf.write(opf.render())
 
+        if self.archive is not None:
+            class Reader(OEBReader):
+                Container = functools.partial(base.ZipContainer,
+                                              archive=self.archive,
+                                              root=os.getcwd())
+            self.oeb_reader = Reader
+
         return os.path.abspath('content.opf')
 
     def convert_epub3_nav(self, nav_path, opf, log, opts):
@@ -8,11 +8,20 @@ from ebook_converter.ebooks.oeb import base
 from ebook_converter.ebooks.oeb import parse_utils
 from ebook_converter.customize.conversion import OutputFormatPlugin
 from ebook_converter.customize.conversion import OptionRecommendation
+from ebook_converter.ebooks.conversion.profiling import stage
 from ebook_converter.ptempfile import TemporaryDirectory
 from ebook_converter import polyglot
 from ebook_converter.utils import directory
 
 
+# Media types that are already compressed and gain nothing from being
+# deflated again, they are stored as is in the container
+COMPRESSED_MEDIA_TYPES = frozenset((
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp',
+    'font/woff', 'font/woff2', 'application/font-woff',
+    'application/x-font-woff', 'audio/mpeg', 'audio/mp4', 'video/mp4',
+))
+
 block_level_tags = (
       'address',
       'body',
@@ -183,33 +192,40 @@ class EPUBOutput(OutputFormatPlugin):
             opts.mobi_toc_at_start = not opts.epub_toc_at_end
             opts.mobi_passthrough = False
             opts.no_inline_toc = False
-            TOCAdder(oeb, opts, replace_previous_inline_toc=True, ignore_existing_toc=True)
+            with stage('TOCAdder'):
+                TOCAdder(oeb, opts, replace_previous_inline_toc=True, ignore_existing_toc=True)
 
         if self.opts.epub_flatten:
             from ebook_converter.ebooks.oeb.transforms.filenames import FlatFilenames
-            FlatFilenames()(oeb, opts)
+            with stage('FlatFilenames'):
+                FlatFilenames()(oeb, opts)
         else:
             from ebook_converter.ebooks.oeb.transforms.filenames import UniqueFilenames
-            UniqueFilenames()(oeb, opts)
+            with stage('UniqueFilenames'):
+                UniqueFilenames()(oeb, opts)
 
-        self.workaround_ade_quirks()
-        self.workaround_webkit_quirks()
-        self.upshift_markup()
+        with stage('quirks'):
+            self.workaround_ade_quirks()
+            self.workaround_webkit_quirks()
+            self.upshift_markup()
         from ebook_converter.ebooks.oeb.transforms.rescale import RescaleImages
-        RescaleImages(check_colorspaces=True)(oeb, opts)
+        with stage('RescaleImages'):
+            RescaleImages(check_colorspaces=True)(oeb, opts)
 
         from ebook_converter.ebooks.oeb.transforms.split import Split
         split = Split(not self.opts.dont_split_on_page_breaks,
                 max_flow_size=self.opts.flow_size*1024
                 )
-        split(self.oeb, self.opts)
+        with stage('Split'):
+            split(self.oeb, self.opts)
 
         from ebook_converter.ebooks.oeb.transforms.cover import CoverManager
         cm = CoverManager(
                 no_default_cover=self.opts.no_default_epub_cover,
                 no_svg_cover=self.opts.no_svg_cover,
                 preserve_aspect_ratio=self.opts.preserve_cover_aspect_ratio)
-        cm(self.oeb, self.opts, self.log)
+        with stage('CoverManager'):
+            cm(self.oeb, self.opts, self.log)
 
         self.workaround_sony_quirks()
 
@@ -241,47 +257,82 @@ class EPUBOutput(OutputFormatPlugin):
                 if str(x) == _uuid:
                     x.content = 'urn:uuid:' + _uuid
 
-        with TemporaryDirectory('_epub_output') as tdir:
-            from ebook_converter.customize.ui import plugin_for_output_format
-            metadata_xml = None
-            extra_entries = []
-            if self.is_periodical:
-                if self.opts.output_profile.epub_periodical_format == 'sony':
-                    from ebook_converter.ebooks.epub.periodical import sony_metadata
-                    metadata_xml, atom_xml = sony_metadata(oeb)
-                    extra_entries = [('atom.xml', 'application/atom+xml', atom_xml)]
-            oeb_output = plugin_for_output_format('oeb')
-            oeb_output.convert(oeb, tdir, input_plugin, opts, log)
-            opf = [x for x in os.listdir(tdir) if x.endswith('.opf')][0]
-            self.condense_ncx([os.path.join(tdir, x) for x in os.listdir(tdir)
-                    if x.endswith('.ncx')][0])
-            if self.opts.epub_version == '3':
-                self.upgrade_to_epub3(tdir, opf)
-            encryption = None
-            if encrypted_fonts:
-                encryption = self.encrypt_fonts(encrypted_fonts, tdir, _uuid)
-
-            from ebook_converter.ebooks.epub import initialize_container
-            with initialize_container(output_path, os.path.basename(opf),
-                    extra_entries=extra_entries) as epub:
-                epub.add_dir(tdir)
-                if encryption is not None:
-                    epub.writestr('META-INF/encryption.xml',
-                                  polyglot.as_bytes(encryption))
-                if metadata_xml is not None:
-                    epub.writestr('META-INF/metadata.xml',
-                            metadata_xml.encode('utf-8'))
-            if opts.extract_to is not None:
-                from ebook_converter.utils.zipfile import ZipFile
-                if os.path.exists(opts.extract_to):
-                    if os.path.isdir(opts.extract_to):
-                        shutil.rmtree(opts.extract_to)
-                    else:
-                        os.remove(opts.extract_to)
-                os.mkdir(opts.extract_to)
-                with ZipFile(output_path) as zf:
-                    zf.extractall(path=opts.extract_to)
-                self.log.info('EPUB extracted to %s', opts.extract_to)
+        from ebook_converter.customize.ui import plugin_for_output_format
+        metadata_xml = None
+        extra_entries = []
+        if self.is_periodical:
+            if self.opts.output_profile.epub_periodical_format == 'sony':
+                from ebook_converter.ebooks.epub.periodical import sony_metadata
+                metadata_xml, atom_xml = sony_metadata(oeb)
+                extra_entries = [('atom.xml', 'application/atom+xml', atom_xml)]
+        oeb_output = plugin_for_output_format('oeb')
+
+        if self.opts.epub_version == '3' or encrypted_fonts:
+            # The EPUB 3 upgrade and the font obfuscation work on the files
+            # of an unpacked book
+            with stage('write'), TemporaryDirectory('_epub_output') as tdir:
+                oeb_output.convert(oeb, tdir, input_plugin, opts, log)
+                opf = [x for x in os.listdir(tdir) if x.endswith('.opf')][0]
+                self.condense_ncx([os.path.join(tdir, x) for x in os.listdir(tdir)
+                        if x.endswith('.ncx')][0])
+                if self.opts.epub_version == '3':
+                    self.upgrade_to_epub3(tdir, opf)
+                encryption = None
+                if encrypted_fonts:
+                    encryption = self.encrypt_fonts(encrypted_fonts, tdir, _uuid)
+
+                from ebook_converter.ebooks.epub import initialize_container
+                with initialize_container(output_path, os.path.basename(opf),
+                        extra_entries=extra_entries) as epub:
+                    epub.add_dir(tdir)
+                    if encryption is not None:
+                        epub.writestr('META-INF/encryption.xml',
+                                      polyglot.as_bytes(encryption))
+                    if metadata_xml is not None:
+                        epub.writestr('META-INF/metadata.xml',
+                                metadata_xml.encode('utf-8'))
+        else:
+            with stage('write'):
+                self.write_container(oeb_output, output_path, extra_entries,
+                                     metadata_xml)
+
+        if opts.extract_to is not None:
+            from ebook_converter.utils.zipfile import ZipFile
+            if os.path.exists(opts.extract_to):
+                if os.path.isdir(opts.extract_to):
+                    shutil.rmtree(opts.extract_to)
+                else:
+                    os.remove(opts.extract_to)
+            os.mkdir(opts.extract_to)
+            with ZipFile(output_path) as zf:
+                zf.extractall(path=opts.extract_to)
+            self.log.info('EPUB extracted to %s', opts.extract_to)
+
+    def write_container(self, oeb_output, output_path, extra_entries,
+                        metadata_xml):
+        """
+        Serialize the book straight into the EPUB container, instead of
+        writing it to a temporary directory and zipping that up.
+        """
+        from ebook_converter.ebooks.epub import initialize_container
+        from ebook_converter.utils.zipfile import ZIP_DEFLATED, ZIP_STORED
+        files = oeb_output.iter_files(self.oeb, self.opts, self.log)
+        # The OPF always comes first, container.xml needs its name, then the
+        # NCX and the manifest items, sorted for reproducible archives
+        opf, _, raw, _ = next(files)
+        with initialize_container(output_path, opf,
+                extra_entries=extra_entries) as epub:
+            epub.writestr(opf, raw, permissions=0o644)
+            for path, media_type, raw, item in files:
+                if media_type == base.NCX_MIME:
+                    raw = self.condense_ncx_data(raw)
+                compression = ZIP_STORED if media_type in \
+                    COMPRESSED_MEDIA_TYPES else ZIP_DEFLATED
+                epub.writestr(path, raw, permissions=0o644,
+                              compression=compression)
+            if metadata_xml is not None:
+                epub.writestr('META-INF/metadata.xml',
+                        metadata_xml.encode('utf-8'))
 
     def upgrade_to_epub3(self, tdir, opf):
         self.log.info('Upgrading to EPUB 3...')
@@ -355,17 +406,23 @@ class EPUBOutput(OutputFormatPlugin):
     # }}}
 
     def condense_ncx(self, ncx_path):  # {{{
-        from lxml import etree
         if not self.opts.pretty_print:
-            tree = etree.parse(ncx_path)
-            for tag in tree.getroot().iter(tag=etree.Element):
-                if tag.text:
-                    tag.text = tag.text.strip()
-                if tag.tail:
-                    tag.tail = tag.tail.strip()
-            compressed = etree.tostring(tree.getroot(), encoding='utf-8')
+            with open(ncx_path, 'rb') as f:
+                compressed = self.condense_ncx_data(f.read())
             with open(ncx_path, 'wb') as f:
                 f.write(compressed)
+
+    def condense_ncx_data(self, raw):
+        from lxml import etree
+        if self.opts.pretty_print:
+            return raw
+        root = etree.fromstring(raw)
+        for tag in root.iter(tag=etree.Element):
+            if tag.text:
+                tag.text = tag.text.strip()
+            if tag.tail:
+                tag.tail = tag.tail.strip()
+        return etree.tostring(root, encoding='utf-8')
     # }}}
 
     def workaround_ade_quirks(self):  # {{{
@@ -507,6 +564,7 @@ class EPUBOutput(OutputFormatPlugin):
                     ws = style.getPropertyValue('white-space')
                     if ws == 'pre':
                         style.setProperty('white-space', 'pre-wrap')
+                self.oeb.stylesheet_changed(stylesheet.data)
 
     # }}}
 
@@ -1,4 +1,5 @@
 from ebook_converter.customize.conversion import OutputFormatPlugin
+from ebook_converter.ebooks.conversion.profiling import stage
 
 
 __license__ = 'GPL v3'
@@ -22,13 +23,18 @@ class LITOutput(OutputFormatPlugin):
         from ebook_converter.ebooks.oeb.transforms.split import Split
         split = Split(split_on_page_breaks=True, max_flow_size=0,
                 remove_css_pagebreaks=False)
-        split(self.oeb, self.opts)
+        with stage('Split'):
+            split(self.oeb, self.opts)
 
         tocadder = HTMLTOCAdder()
-        tocadder(oeb, opts)
+        with stage('HTMLTOCAdder'):
+            tocadder(oeb, opts)
         mangler = CaseMangler()
-        mangler(oeb, opts)
+        with stage('CaseMangler'):
+            mangler(oeb, opts)
         rasterizer = SVGRasterizer()
-        rasterizer(oeb, opts)
+        with stage('SVGRasterizer'):
+            rasterizer(oeb, opts)
         lit = LitWriter(self.opts)
-        lit(oeb, output_path)
+        with stage('LitWriter'):
+            lit(oeb, output_path)
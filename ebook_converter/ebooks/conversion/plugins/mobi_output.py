@@ -1,5 +1,6 @@
 from ebook_converter.customize.conversion import (OutputFormatPlugin,
         OptionRecommendation)
+from ebook_converter.ebooks.conversion.profiling import stage
 
 
 def remove_html_cover(oeb, log):
@@ -52,6 +53,12 @@ class MOBIOutput(OutputFormatPlugin):
             recommended_value=False, level=OptionRecommendation.LOW,
             help='Disable compression of the file contents.'
         ),
+        OptionRecommendation(name='mobi_compression_workers',
+            recommended_value=0, level=OptionRecommendation.LOW,
+            help='Number of processes used to compress the text records of '
+                'the MOBI 6 output. The default, 0, uses one process per CPU '
+                'core. Set to 1 to compress in the conversion process only.'
+        ),
         OptionRecommendation(name='personal_doc', recommended_value='[PDOC]',
             help='Tag for MOBI files to be marked as personal documents.'
                    ' This option has no effect on the conversion. It is used'
@@ -193,12 +200,16 @@ class MOBIOutput(OutputFormatPlugin):
             remove_duplicate_anchors(self.oeb)
             # Split on pagebreaks so that the resulting KF8 is faster to load
             from ebook_converter.ebooks.oeb.transforms.split import Split
-            Split()(self.oeb, self.opts)
+            with stage('Split'):
+                Split()(self.oeb, self.opts)
 
-        kf8 = self.create_kf8(resources, for_joint=mobi_type=='both'
-                ) if create_kf8 else None
+        kf8 = None
+        if create_kf8:
+            with stage('KF8'):
+                kf8 = self.create_kf8(resources, for_joint=mobi_type=='both')
         if mobi_type == 'new':
-            kf8.write(output_path)
+            with stage('write'):
+                kf8.write(output_path)
             extract_mobi(output_path, opts)
             return
 
@@ -221,12 +232,15 @@ class MOBIOutput(OutputFormatPlugin):
         if not opts.no_inline_toc:
             tocadder = HTMLTOCAdder(title=opts.toc_title, position='start' if
                     opts.mobi_toc_at_start else 'end')
-            tocadder(oeb, opts)
+            with stage('HTMLTOCAdder'):
+                tocadder(oeb, opts)
         mangler = CaseMangler()
-        mangler(oeb, opts)
+        with stage('CaseMangler'):
+            mangler(oeb, opts)
         try:
             rasterizer = SVGRasterizer()
-            rasterizer(oeb, opts)
+            with stage('SVGRasterizer'):
+                rasterizer(oeb, opts)
         except Unavailable:
             self.log.warning('SVG rasterizer unavailable, SVG will not be '
                              'converted')
@@ -236,12 +250,14 @@ class MOBIOutput(OutputFormatPlugin):
         if hasattr(self.oeb, 'inserted_metadata_jacket'):
             self.workaround_fire_bugs(self.oeb.inserted_metadata_jacket)
         mobimlizer = MobiMLizer(ignore_tables=opts.linearize_tables)
-        mobimlizer(oeb, opts)
+        with stage('MobiMLizer'):
+            mobimlizer(oeb, opts)
         write_page_breaks_after_item = input_plugin is not plugin_for_input_format('cbz')
         from ebook_converter.ebooks.mobi.writer2.main import MobiWriter
         writer = MobiWriter(opts, resources, kf8,
                         write_page_breaks_after_item=write_page_breaks_after_item)
-        writer(oeb, output_path)
+        with stage('MobiWriter'):
+            writer(oeb, output_path)
         extract_mobi(output_path, opts)
 
     def specialize_css_for_output(self, log, opts, item, stylizer):
@@ -318,11 +334,14 @@ class AZW3Output(OutputFormatPlugin):
 
             # Split on pagebreaks so that the resulting KF8 is faster to load
             from ebook_converter.ebooks.oeb.transforms.split import Split
-            Split()(self.oeb, self.opts)
+            with stage('Split'):
+                Split()(self.oeb, self.opts)
 
-        kf8 = create_kf8_book(self.oeb, self.opts, resources, for_joint=False)
-
-        kf8.write(output_path)
+        with stage('KF8'):
+            kf8 = create_kf8_book(self.oeb, self.opts, resources,
+                                  for_joint=False)
+        with stage('write'):
+            kf8.write(output_path)
         extract_mobi(output_path, opts)
 
     def specialize_css_for_output(self, log, opts, item, stylizer):
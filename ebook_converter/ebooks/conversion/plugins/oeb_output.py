@@ -21,51 +21,63 @@ class OEBOutput(OutputFormatPlugin):
     recommendations = {('pretty_print', True, OptionRecommendation.HIGH)}
 
     def convert(self, oeb_book, output_path, input_plugin, opts, log):
-
-        self.log, self.opts = log, opts
         if not os.path.exists(output_path):
             os.makedirs(output_path)
         with directory.CurrentDir(output_path):
-            results = oeb_book.to_opf2(page_map=True)
-            for key in (OPF_MIME, NCX_MIME, PAGE_MAP_MIME):
-                href, root = results.pop(key, [None, None])
-                if root is not None:
-                    if key == OPF_MIME:
-                        try:
-                            self.workaround_nook_cover_bug(root)
-                        except:
-                            self.log.exception('Something went wrong while '
-                                               'trying to workaround Nook '
-                                               'cover bug, ignoring')
-                        try:
-                            self.workaround_pocketbook_cover_bug(root)
-                        except:
-                            self.log.exception('Something went wrong while '
-                                               'trying to workaround '
-                                               'Pocketbook cover bug, '
-                                               'ignoring')
-                        self.migrate_lang_code(root)
-                    raw = etree.tostring(root, pretty_print=True,
-                            encoding='utf-8', xml_declaration=True)
-                    if key == OPF_MIME:
-                        # Needed as I can't get lxml to output opf:role and
-                        # not output <opf:metadata> as well
-                        raw = re.sub(br'(<[/]{0,1})opf:', br'\1', raw)
-                    with open(href, 'wb') as f:
-                        f.write(raw)
-
-            for item in oeb_book.manifest:
-                if (
-                        not self.opts.expand_css and item.media_type in OEB_STYLES and hasattr(
-                            item.data, 'cssText') and 'nook' not in self.opts.output_profile.short_name):
-                    condense_sheet(item.data)
-                path = os.path.abspath(polyglot.unquote(item.href))
+            for href, media_type, raw, item in self.iter_files(oeb_book, opts,
+                                                               log):
+                path = os.path.abspath(href)
                 dir = os.path.dirname(path)
                 if not os.path.exists(dir):
                     os.makedirs(dir)
                 with open(path, 'wb') as f:
-                    f.write(item.bytes_representation)
-                item.unload_data_from_memory(memory=path)
+                    f.write(raw)
+                if item is not None:
+                    item.unload_data_from_memory(memory=path)
+
+    def iter_files(self, oeb_book, opts, log):
+        """
+        Serialize the book, yielding (path, media_type, data, item) tuples,
+        first for the OPF, NCX and page map, for which item is None, then
+        for every manifest item, sorted by href, so that the same book is
+        always written in the same order. Paths are relative to the root of
+        the book.
+        """
+        self.log, self.opts = log, opts
+        results = oeb_book.to_opf2(page_map=True)
+        for key in (OPF_MIME, NCX_MIME, PAGE_MAP_MIME):
+            href, root = results.pop(key, [None, None])
+            if root is not None:
+                if key == OPF_MIME:
+                    try:
+                        self.workaround_nook_cover_bug(root)
+                    except:
+                        self.log.exception('Something went wrong while '
+                                           'trying to workaround Nook '
+                                           'cover bug, ignoring')
+                    try:
+                        self.workaround_pocketbook_cover_bug(root)
+                    except:
+                        self.log.exception('Something went wrong while '
+                                           'trying to workaround '
+                                           'Pocketbook cover bug, '
+                                           'ignoring')
+                    self.migrate_lang_code(root)
+                raw = etree.tostring(root, pretty_print=True,
+                        encoding='utf-8', xml_declaration=True)
+                if key == OPF_MIME:
+                    # Needed as I can't get lxml to output opf:role and
+                    # not output <opf:metadata> as well
+                    raw = re.sub(br'(<[/]{0,1})opf:', br'\1', raw)
+                yield href, key, raw, None
+
+        for item in sorted(oeb_book.manifest, key=lambda x: x.href):
+            if (
+                    not self.opts.expand_css and item.media_type in OEB_STYLES and hasattr(
+                        item.data, 'cssText') and 'nook' not in self.opts.output_profile.short_name):
+                condense_sheet(item.data)
+            yield (polyglot.unquote(item.href), item.media_type,
+                   item.bytes_representation, item)
 
     def workaround_nook_cover_bug(self, root):  # {{{
         cov = root.xpath('//*[local-name() = "meta" and @name="cover" and'
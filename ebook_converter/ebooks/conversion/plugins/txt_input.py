@@ -205,9 +205,20 @@ class TXTInput(InputFormatPlugin):
         # Normalize line endings
         txt = normalize_line_endings(txt)
 
+        # The line statistics of each version of the text, shared by the
+        # passes that look at it during this conversion
+        analyses = {}
+
+        def doc_analysis(txt):
+            ans = analyses.get(txt)
+            if ans is None:
+                ans = analyses[txt] = DocAnalysis('txt', txt)
+            return ans
+
         # Determine the paragraph type of the document.
         if options.paragraph_type == 'auto':
-            options.paragraph_type = detect_paragraph_type(txt)
+            options.paragraph_type = detect_paragraph_type(
+                txt, doc_analysis(txt))
             if options.paragraph_type == 'unknown':
                 log.debug('Could not reliably determine paragraph type using '
                           'block')
@@ -239,8 +250,7 @@ class TXTInput(InputFormatPlugin):
         elif options.paragraph_type == 'unformatted':
             from ebook_converter.ebooks.conversion.utils import HeuristicProcessor
             # unwrap lines based on punctuation
-            docanalysis = DocAnalysis('txt', txt)
-            length = docanalysis.line_length(.5)
+            length = doc_analysis(txt).line_length(.5)
             preprocessor = HeuristicProcessor(options, log=getattr(self, 'log', None))
             txt = preprocessor.punctuation_unwrap(length, txt, 'txt')
             txt = separate_paragraphs_single_line(txt)
@@ -249,9 +259,8 @@ class TXTInput(InputFormatPlugin):
             txt = block_to_single_line(txt)
 
         if getattr(options, 'enable_heuristics', False) and getattr(options, 'dehyphenate', False):
-            docanalysis = DocAnalysis('txt', txt)
             if not length:
-                length = docanalysis.line_length(.5)
+                length = doc_analysis(txt).line_length(.5)
             dehyphenator = Dehyphenator(options.verbose, log=self.log)
             txt = dehyphenator(txt,'txt', length)
 
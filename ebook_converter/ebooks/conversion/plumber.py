@@ -11,6 +11,7 @@ from ebook_converter.customize.ui import input_profiles, output_profiles, \
         available_input_formats, available_output_formats, \
         run_plugins_on_preprocess, run_plugins_on_postprocess
 from ebook_converter.ebooks.conversion.preprocess import HTMLPreProcessor
+from ebook_converter.ebooks.conversion.profiling import stage
 from ebook_converter.ptempfile import PersistentTemporaryDirectory
 from ebook_converter.utils.date import parse_date
 from ebook_converter.utils.zipfile import ZipFile
@@ -82,10 +83,17 @@ class Plumber(object):
 
     def __init__(self, input, output, log, report_progress=DummyReporter(),
             dummy=False, merge_plugin_recs=True, abort_after_input_dump=False,
-            override_input_metadata=False, for_regex_wizard=False, view_kepub=False):
+            override_input_metadata=False, for_regex_wizard=False, view_kepub=False,
+            result_cache=None, profile=None):
         '''
         :param input: Path to input file.
         :param output: Path to output file/directory
+        :param result_cache: An optional
+            :class:`ebook_converter.ebooks.conversion.cache.ResultCache` used
+            to reuse the output of an earlier, identical conversion
+        :param profile: An optional
+            :class:`ebook_converter.ebooks.conversion.profiling.PipelineProfile`
+            recording the time and memory used by each stage of :meth:`run`
         '''
         if isinstance(input, bytes):
             input = input.decode(filesystem_encoding)
@@ -99,6 +107,8 @@ class Plumber(object):
         self.ui_reporter = report_progress
         self.abort_after_input_dump = abort_after_input_dump
         self.override_input_metadata = override_input_metadata
+        self.result_cache = result_cache
+        self.profile = profile
 
         # Pipeline options {{{
         # Initialize the conversion options that are independent of input and
@@ -220,6 +230,13 @@ OptionRecommendation(name='subset_embedded_fonts',
             'particularly large font with lots of unused glyphs.'
         ),
 
+OptionRecommendation(name='transform_workers',
+        recommended_value=0, level=OptionRecommendation.LOW,
+        help='Number of processes used to flatten the CSS of books with many '
+            'files. The default, 0, uses one process per CPU core. Set to 1 '
+            'to do all the work in the conversion process.'
+        ),
+
 OptionRecommendation(name='linearize_tables',
             recommended_value=False, level=OptionRecommendation.LOW,
             help='Some badly designed documents use tables to control the '
@@ -976,6 +993,32 @@ OptionRecommendation(name='search_replace',
         '''
         Run the conversion pipeline
         '''
+        try:
+            if self.profile is None:
+                return self.run_pipeline()
+            with self.profile.activate():
+                self.profile.metadata.update({
+                    'input': self.input, 'output': self.output,
+                    'input_format': self.input_fmt,
+                    'output_format': self.output_fmt})
+                return self.run_pipeline()
+        finally:
+            if not self.for_regex_wizard:
+                # The regex wizard goes on using the parsed book
+                self.cleanup()
+
+    def cleanup(self):
+        '''
+        Release what the book and the input plugin keep open, so that long
+        running processes do not leak file handles, whether the conversion
+        succeeded or not.
+        '''
+        oeb = getattr(self, 'oeb', None)
+        if hasattr(oeb, 'clean_temp_files'):
+            oeb.clean_temp_files()
+        self.input_plugin.cleanup()
+
+    def run_pipeline(self):
         # Setup baseline option values
         self.setup_options()
         if self.opts.verbose:
@@ -1005,6 +1048,20 @@ OptionRecommendation(name='search_replace',
         from ebook_converter.customize.ui import run_plugins_on_preprocess
         self.input = run_plugins_on_preprocess(self.input)
 
+        cache_key = None
+        if self.result_cache is not None and self.input_fmt != 'recipe':
+            with stage('ResultCache'):
+                cache_key = self.result_cache.key(self.input, self.input_fmt,
+                                                  self.output_fmt, self.opts)
+                found = self.result_cache.get(cache_key, self.output)
+            if found:
+                self.log.info('%s output found in the conversion cache, '
+                              'written to %s', self.output_fmt.upper(),
+                              self.output)
+                self.ui_reporter(1.)
+                self.flush()
+                return
+
         self.flush()
         # Create an OEBBook from the input file. The input plugin does all the
         # heavy lifting.
@@ -1035,10 +1092,12 @@ OptionRecommendation(name='search_replace',
         if self.for_regex_wizard:
             self.input_plugin.for_viewer = True
         self.output_plugin.specialize_options(self.log, self.opts, self.input_fmt)
-        with self.input_plugin:
+        with stage('input') as st, self.input_plugin:
             self.oeb = self.input_plugin(stream, self.opts,
                                         self.input_fmt, self.log,
                                         accelerators, tdir)
+            if st is not None:
+                st.oeb = self.oeb
             if self.opts.debug_pipeline is not None:
                 self.dump_input(self.oeb, tdir)
                 if self.abort_after_input_dump:
@@ -1048,8 +1107,11 @@ OptionRecommendation(name='search_replace',
             if not hasattr(self.oeb, 'manifest'):
                 self.oeb = create_oebbook(
                     self.log, self.oeb, self.opts,
+                    reader=self.input_plugin.oeb_reader,
                     encoding=self.input_plugin.output_encoding,
                     for_regex_wizard=self.for_regex_wizard, removed_items=getattr(self.input_plugin, 'removed_items_to_ignore', ()))
+                if st is not None:
+                    st.oeb = self.oeb
             if self.for_regex_wizard:
                 return
             self.input_plugin.postprocess_book(self.oeb, self.opts, self.log)
@@ -1068,9 +1130,11 @@ OptionRecommendation(name='search_replace',
         self.oeb.plumber_output_format = self.output_fmt or ''
 
         from ebook_converter.ebooks.oeb.transforms.data_url import DataURL
-        DataURL()(self.oeb, self.opts)
+        with stage('DataURL', self.oeb):
+            DataURL()(self.oeb, self.opts)
         from ebook_converter.ebooks.oeb.transforms.guide import Clean
-        Clean()(self.oeb, self.opts)
+        with stage('Clean', self.oeb):
+            Clean()(self.oeb, self.opts)
         pr(0.1)
         self.flush()
 
@@ -1078,15 +1142,18 @@ OptionRecommendation(name='search_replace',
         self.opts.dest = self.opts.output_profile
 
         from ebook_converter.ebooks.oeb.transforms.jacket import RemoveFirstImage
-        RemoveFirstImage()(self.oeb, self.opts, self.user_metadata)
+        with stage('RemoveFirstImage', self.oeb):
+            RemoveFirstImage()(self.oeb, self.opts, self.user_metadata)
         from ebook_converter.ebooks.oeb.transforms.metadata import MergeMetadata
-        MergeMetadata()(self.oeb, self.user_metadata, self.opts,
-                override_input_metadata=self.override_input_metadata)
+        with stage('MergeMetadata', self.oeb):
+            MergeMetadata()(self.oeb, self.user_metadata, self.opts,
+                    override_input_metadata=self.override_input_metadata)
         pr(0.2)
         self.flush()
 
         from ebook_converter.ebooks.oeb.transforms.structure import DetectStructure
-        DetectStructure()(self.oeb, self.opts)
+        with stage('DetectStructure', self.oeb):
+            DetectStructure()(self.oeb, self.opts)
         pr(0.35)
         self.flush()
 
@@ -1132,11 +1199,13 @@ OptionRecommendation(name='search_replace',
         if self.opts.linearize_tables and \
                 self.output_plugin.file_type not in ('mobi', 'lrf'):
             from ebook_converter.ebooks.oeb.transforms.linearize_tables import LinearizeTables
-            LinearizeTables()(self.oeb, self.opts)
+            with stage('LinearizeTables', self.oeb):
+                LinearizeTables()(self.oeb, self.opts)
 
         if self.opts.unsmarten_punctuation:
             from ebook_converter.ebooks.oeb.transforms.unsmarten import UnsmartenPunctuation
-            UnsmartenPunctuation()(self.oeb, self.opts)
+            with stage('UnsmartenPunctuation', self.oeb):
+                UnsmartenPunctuation()(self.oeb, self.opts)
 
         mobi_file_type = getattr(self.opts, 'mobi_file_type', 'old')
         needs_old_markup = (self.output_plugin.file_type == 'lit' or (
@@ -1155,7 +1224,8 @@ OptionRecommendation(name='search_replace',
                 transform_css_rules=transform_css_rules,
                 specializer=functools.partial(self.output_plugin.specialize_css_for_output,
                     self.log, self.opts))
-        flattener(self.oeb, self.opts)
+        with stage('CSSFlattener', self.oeb):
+            flattener(self.oeb, self.opts)
         self.opts._final_base_font_size = fbase
 
         self.opts.insert_blank_line = oibl
@@ -1163,16 +1233,20 @@ OptionRecommendation(name='search_replace',
 
         from ebook_converter.ebooks.oeb.transforms.page_margin import \
             RemoveFakeMargins, RemoveAdobeMargins
-        RemoveFakeMargins()(self.oeb, self.log, self.opts)
-        RemoveAdobeMargins()(self.oeb, self.log, self.opts)
+        with stage('RemoveFakeMargins', self.oeb):
+            RemoveFakeMargins()(self.oeb, self.log, self.opts)
+        with stage('RemoveAdobeMargins', self.oeb):
+            RemoveAdobeMargins()(self.oeb, self.log, self.opts)
 
         if self.opts.embed_all_fonts:
             from ebook_converter.ebooks.oeb.transforms.embed_fonts import EmbedFonts
-            EmbedFonts()(self.oeb, self.log, self.opts)
+            with stage('EmbedFonts', self.oeb):
+                EmbedFonts()(self.oeb, self.log, self.opts)
 
         if self.opts.subset_embedded_fonts and self.output_plugin.file_type != 'pdf':
             from ebook_converter.ebooks.oeb.transforms.subset import SubsetFonts
-            SubsetFonts()(self.oeb, self.log, self.opts)
+            with stage('SubsetFonts', self.oeb):
+                SubsetFonts()(self.oeb, self.log, self.opts)
 
         pr(0.9)
         self.flush()
@@ -1181,7 +1255,8 @@ OptionRecommendation(name='search_replace',
 
         self.log.info('Cleaning up manifest...')
         trimmer = ManifestTrimmer()
-        trimmer(self.oeb, self.opts)
+        with stage('ManifestTrimmer', self.oeb):
+            trimmer(self.oeb, self.opts)
 
         self.oeb.toc.rationalize_play_orders()
         pr(1.)
@@ -1196,12 +1271,13 @@ OptionRecommendation(name='search_replace',
         our = CompositeProgressReporter(0.67, 1., self.ui_reporter)
         self.output_plugin.report_progress = our
         our(0., 'Running %s plugin' % self.output_plugin.name)
-        with self.output_plugin:
+        with stage('output', self.oeb), self.output_plugin:
             self.output_plugin.convert(self.oeb, self.output, self.input_plugin,
                 self.opts, self.log)
-        self.oeb.clean_temp_files()
         self.ui_reporter(1.)
         run_plugins_on_postprocess(self.output, self.output_fmt)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, self.output)
 
         self.log.info('%s output written to %s', self.output_fmt.upper(),
                       self.output)
@@ -1,7 +1,11 @@
+import array
+import collections
 import functools
+import itertools
 import json
 import math
 import re
+from bisect import bisect_left, bisect_right
 
 from ebook_converter.utils import entities
 
@@ -82,8 +86,18 @@ class DocAnalysis(object):
     structured. format is the type of document analysis will be done against.
     raw is the raw text to determine the line length to use for wrapping.
     Blank lines are excluded from analysis
+
+    The lines are measured once, into the distinct line lengths and the
+    number of lines of each length, so that the queries do not have to walk
+    the lines again. Keep the analysis to share it between the passes that
+    look at the same text.
     """
 
+    HISTOGRAM_BUCKETS = 20  # Each line is divided into a bucket based on length
+    HISTOGRAM_BUCKET_SIZE = 100
+    HISTOGRAM_MIN = 20  # Ignore lines under 20 chars (typical of spaces)
+    HISTOGRAM_MAX = 1900  # Discard larger than this to stay in range
+
     def __init__(self, format='html', raw=''):
         raw = raw.replace('&nbsp;', ' ')
         if format == 'html':
@@ -96,6 +110,21 @@ class DocAnalysis(object):
         elif format == 'txt':
             linere = re.compile('.*?\n')
         self.lines = linere.findall(raw)
+        counts = collections.Counter(map(len, self.lines))
+        # Distinct line lengths in increasing order, and the number of lines
+        # shorter than each of them
+        self.lengths = array.array('L', sorted(counts))
+        self.cumulative = array.array('L', itertools.accumulate(
+            map(counts.__getitem__, self.lengths), initial=0))
+        # Empty lines are not counted in the line length
+        self.first = 1 if self.lengths and self.lengths[0] == 0 else 0
+        self.distinct_total = sum(self.lengths)
+        self._histogram = None
+
+    def count_lines(self, shortest, longest):
+        """Number of lines of length shortest to longest included."""
+        return (self.cumulative[bisect_right(self.lengths, longest)] -
+                self.cumulative[bisect_left(self.lengths, shortest)])
 
     def line_length(self, percent):
         """
@@ -105,32 +134,37 @@ class DocAnalysis(object):
         ordered smallest to largest and does not include duplicates. 0.5 is the
         median value.
         """
-        lengths = []
-        for line in self.lines:
-            if len(line) > 0:
-                lengths.append(len(line))
-
-        if not lengths:
+        distinct = len(self.lengths) - self.first
+        if not distinct:
             return 0
 
-        lengths = list(set(lengths))
-        total = sum(lengths)
-        avg = total / len(lengths)
+        avg = self.distinct_total / distinct
         max_line = math.ceil(avg * 2)
-
-        lengths = sorted(lengths)
-        for i in range(len(lengths) - 1, -1, -1):
-            if lengths[i] > max_line:
-                del lengths[i]
+        # The lengths up to max_line
+        end = bisect_right(self.lengths, max_line)
 
         if percent > 1:
             percent = 1
         if percent < 0:
             percent = 0
 
-        index = int(len(lengths) * percent) - 1
+        index = int((end - self.first) * percent) - 1
+        if index < 0:
+            return self.lengths[end - 1]
+        return self.lengths[self.first + index]
 
-        return lengths[index]
+    def histogram(self):
+        """
+        The number of lines in each of the HISTOGRAM_BUCKETS buckets of line
+        lengths, not counting the lines too short or too long.
+        """
+        if self._histogram is None:
+            size = self.HISTOGRAM_BUCKET_SIZE
+            self._histogram = [
+                self.count_lines(max(i * size, self.HISTOGRAM_MIN + 1),
+                                 min((i + 1) * size, self.HISTOGRAM_MAX) - 1)
+                for i in range(self.HISTOGRAM_BUCKETS)]
+        return self._histogram
 
     def line_histogram(self, percent):
         """
@@ -140,40 +174,11 @@ class DocAnalysis(object):
         a single bucket to return true The majority of the lines will exist in
         1-2 buckets in typical docs with hard line breaks
         """
-        minLineLength = 20  # Ignore lines under 20 chars (typical of spaces)
-        maxLineLength = 1900  # Discard larger than this to stay in range
-        buckets = 20  # Each line is divided into a bucket based on length
-
-        # print("there are "+str(len(lines))+" lines")
-        # max = 0
-        # for line in self.lines:
-        #    _l = len(line)
-        #    if _l > max:
-        #        max = _l
-        # print("max line found is "+str(max))
-        # Build the line length histogram
-        hRaw = [0 for i in range(0, buckets)]
-        for line in self.lines:
-            _l = len(line)
-            if _l > minLineLength and _l < maxLineLength:
-                _l = int(_l // 100)
-                # print("adding "+str(_l))
-                hRaw[_l] += 1
-
-        # Normalize the histogram into percents
+        # Normalize the biggest bucket into a percentage of the lines
         totalLines = len(self.lines)
-        if totalLines > 0:
-            h = [float(count)/totalLines for count in hRaw]
-        else:
-            h = []
-        # print("\nhRaw histogram lengths are: "+str(hRaw))
-        # print("              percents are: "+str(h)+"\n")
-
-        # Find the biggest bucket
         maxValue = 0
-        for i in range(0, len(h)):
-            if h[i] > maxValue:
-                maxValue = h[i]
+        if totalLines > 0:
+            maxValue = max(self.histogram()) / totalLines
 
         if maxValue < percent:
             # print("Line lengths are too variable. Not unwrapping.")
@@ -183,6 +188,53 @@ class DocAnalysis(object):
             return True
 
 
+class WordIndex(object):
+    """
+    The words of a text, to look up the words and hyphenated words the
+    Dehyphenator builds without searching the whole text each time. For
+    strings of word characters, optionally joined by a single hyphen,
+    ``s in index`` is the same as ``text.find(s) != -1``.
+    """
+
+    WORD_PAT = re.compile(r'\w+')
+    HYPHENATED_PAT = re.compile(r'\w+-\w+')
+    # Every pair of whole words joined by a hyphen, overlapping ones too
+    PAIRS_PAT = re.compile(r'(?<!\w)(?=(\w+-\w+))')
+
+    def __init__(self, text):
+        self.text = text
+        self.words = set(self.WORD_PAT.findall(text))
+        self.hyphenated = set(self.PAIRS_PAT.findall(text))
+        self._suffixes = None
+        self.cache = {}
+
+    @property
+    def suffixes(self):
+        # A string of word characters (and hyphen) appears in the text only
+        # as the start of a suffix of one of the words (or pairs), sorted
+        # these are searched with a bisection
+        if self._suffixes is None:
+            self._suffixes = sorted({w[i:] for words in (self.words,
+                                                         self.hyphenated)
+                                     for w in words for i in range(len(w))})
+        return self._suffixes
+
+    def __contains__(self, s):
+        ans = self.cache.get(s)
+        if ans is None:
+            if s in self.words or s in self.hyphenated:
+                ans = True
+            elif (self.WORD_PAT.fullmatch(s) is not None or
+                    self.HYPHENATED_PAT.fullmatch(s) is not None):
+                suffixes = self.suffixes
+                i = bisect_left(suffixes, s)
+                ans = i < len(suffixes) and suffixes[i].startswith(s)
+            else:
+                ans = s in self.text
+            self.cache[s] = ans
+        return ans
+
+
 class Dehyphenator(object):
     """
     Analyzes words to determine whether hyphens should be retained/removed.
@@ -232,17 +284,20 @@ class Dehyphenator(object):
         if self.verbose > 2:
             self.log.info("lookup word is: %s, orig is: %s", lookupword,
                           hyphenated)
+        if self.words is None:
+            # Built on the first hyphen, as many documents have none
+            self.words = WordIndex(self.html)
         try:
-            searchresult = self.html.find(lookupword.lower())
+            searchresult = lookupword.lower() in self.words
         except Exception:
             return hyphenated
         if self.format == 'html_cleanup' or self.format == 'txt_cleanup':
-            if self.html.find(lookupword) != -1 or searchresult != -1:
+            if lookupword in self.words or searchresult:
                 if self.verbose > 2:
                     self.log.info("    Cleanup:returned dehyphenated word: %s",
                                   dehyphenated)
                 return dehyphenated
-            elif self.html.find(hyphenated) != -1:
+            elif hyphenated in self.words:
                 if self.verbose > 2:
                     self.log.info("        Cleanup:returned hyphenated word: "
                                   "%s", hyphenated)
@@ -266,7 +321,7 @@ class Dehyphenator(object):
                     self.log.info("too short, returned hyphenated word: %s",
                                   hyphenated)
                 return hyphenated
-            if self.html.find(lookupword) != -1 or searchresult != -1:
+            if lookupword in self.words or searchresult:
                 if self.verbose > 2:
                     self.log.info("     returned dehyphenated word: ",
                                   dehyphenated)
@@ -279,6 +334,7 @@ class Dehyphenator(object):
 
     def __call__(self, html, format, length=1):
         self.html = html
+        self.words = None
         self.format = format
         if format == 'html':
             intextmatch = re.compile(r'(?<=.{%i})(?P<firstpart>[^\W\-]+)'
@@ -495,6 +551,44 @@ class HTMLPreProcessor(object):
         self.extra_opts = extra_opts
         self.regex_wizard_callback = regex_wizard_callback
         self.current_href = None
+        # Results computed in worker processes by prefetch(), by input HTML
+        self.prefetched = {}
+        self.recorded = None
+
+    def prefetch(self, items):
+        """
+        Preprocess the HTML of the manifest items in worker processes, one
+        flow per item, when the heuristics, by far the slowest part of the
+        preprocessing, are enabled. The results are used when the items are
+        parsed.
+        """
+        if (not getattr(self.extra_opts, 'enable_heuristics', False) or
+                self.regex_wizard_callback is not None):
+            return
+        from ebook_converter.ebooks.oeb import parallel
+        workers = parallel.worker_count(
+            items, getattr(self.extra_opts, 'transform_workers', 0))
+        if workers < 2:
+            return
+        try:
+            with parallel.ItemWorkers(self, items, workers) as w:
+                for results in w.call('preprocess_item'):
+                    self.prefetched.update(results)
+        except parallel.WorkerError as e:
+            # The items are simply preprocessed when they are parsed
+            self.log.warning('Failed to preprocess HTML in parallel: %s', e)
+
+    def preprocess_item(self, item):
+        # Runs in the worker processes, parses the item recording the
+        # preprocessing of its HTML
+        self.recorded = []
+        try:
+            item.data
+        except Exception:
+            # Reported when the item is parsed in the conversion process
+            pass
+        ans, self.recorded = self.recorded, None
+        return ans
 
     def is_baen(self, src):
         return re.compile(r'<meta\s+name="Publisher"\s+content=".*?Baen.*?"',
@@ -508,6 +602,16 @@ class HTMLPreProcessor(object):
 
     def __call__(self, html, remove_special_chars=None,
                  get_preprocess_html=False):
+        plain = remove_special_chars is None and not get_preprocess_html
+        if plain and html in self.prefetched:
+            return self.prefetched.pop(html)
+        ans = self.preprocess(html, remove_special_chars, get_preprocess_html)
+        if plain and self.recorded is not None:
+            self.recorded.append((html, ans))
+        return ans
+
+    def preprocess(self, html, remove_special_chars=None,
+                   get_preprocess_html=False):
         if remove_special_chars is not None:
             html = remove_special_chars.sub('', html)
         html = html.replace('\0', '')
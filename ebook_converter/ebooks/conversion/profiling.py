@@ -0,0 +1,193 @@
+"""
+Per stage timing of the conversion pipeline.
+
+A :class:`PipelineProfile` records, for every stage of :meth:`Plumber.run`,
+the wall clock and CPU time spent, the growth of the peak memory use of the
+process and the number of manifest and spine items of the book afterwards.
+Output plugins report the transforms they run as nested stages with
+:func:`stage`, which does nothing unless a profile is active. Optionally
+each top level stage is run under cProfile and its most expensive functions
+are added to the report.
+"""
+import io
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Format of the report, bump on incompatible changes
+REPORT_VERSION = 1
+
+_active = threading.local()
+
+
+def peak_rss():
+    """Peak resident set size of the process in bytes, None if unknown."""
+    if resource is None:
+        return None
+    ans = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return ans if sys.platform == 'darwin' else ans * 1024
+
+
+def book_counts(oeb):
+    if oeb is None or not hasattr(oeb, 'manifest'):
+        return None
+    return {'manifest': len(oeb.manifest), 'spine': len(oeb.spine)}
+
+
+def top_functions(profiler, limit):
+    """The limit functions with the largest cumulative time."""
+    import pstats
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    ans = []
+    for (filename, line, name), (cc, nc, tt, ct, callers) in sorted(
+            stats.stats.items(), key=lambda x: x[1][3], reverse=True)[:limit]:
+        ans.append({'function': '%s:%d(%s)' % (filename, line, name),
+                    'calls': nc, 'primitive_calls': cc,
+                    'tottime': round(tt, 6), 'cumtime': round(ct, 6)})
+    return ans
+
+
+class Stage(object):
+
+    def __init__(self, name, oeb=None):
+        self.name = name
+        self.oeb = oeb
+        self.stages = []
+        self.wall = self.cpu = self.rss_delta = None
+        self.items_before = self.items_after = None
+        self.functions = None
+        self.error = None
+
+    def as_dict(self):
+        ans = {'name': self.name,
+               'wall_time': self.wall,
+               'cpu_time': self.cpu,
+               'peak_rss_delta': self.rss_delta,
+               'items_before': self.items_before,
+               'items_after': self.items_after}
+        if self.error is not None:
+            ans['error'] = self.error
+        if self.functions is not None:
+            ans['functions'] = self.functions
+        if self.stages:
+            ans['stages'] = [s.as_dict() for s in self.stages]
+        return ans
+
+
+class PipelineProfile(object):
+    """
+    Timing report of a conversion.
+
+    :param cprofile: Run each top level stage under cProfile and report its
+        ``functions`` most expensive functions
+    """
+
+    def __init__(self, cprofile=False, functions=25):
+        self.cprofile = cprofile
+        self.functions = functions
+        self.stages = []
+        self.stack = []
+        self.started = self.wall = self.cpu = None
+        self.peak_rss = None
+        self.metadata = {}
+
+    @contextmanager
+    def activate(self):
+        """Make this the profile :func:`stage` reports to in this thread."""
+        previous = getattr(_active, 'profile', None)
+        _active.profile = self
+        self.started = time.time()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield self
+        finally:
+            self.wall = time.perf_counter() - wall
+            self.cpu = time.process_time() - cpu
+            self.peak_rss = peak_rss()
+            _active.profile = previous
+
+    @contextmanager
+    def stage(self, name, oeb=None):
+        """
+        Time the code run in the block as the stage name. oeb is the book
+        being converted, inherited from the enclosing stage if not given;
+        it can also be set on the yielded :class:`Stage` once it exists.
+        """
+        parent = self.stack[-1] if self.stack else None
+        if oeb is None and parent is not None:
+            oeb = parent.oeb
+        st = Stage(name, oeb)
+        (self.stages if parent is None else parent.stages).append(st)
+        st.items_before = book_counts(oeb)
+        profiler = None
+        if self.cprofile and parent is None:
+            # Only one profiler can be active at a time, nested stages are
+            # part of the profile of their top level stage
+            import cProfile
+            profiler = cProfile.Profile()
+        self.stack.append(st)
+        rss = peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield st
+        except BaseException as e:
+            st.error = '%s: %s' % (type(e).__name__, e)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            st.wall = round(time.perf_counter() - wall, 6)
+            st.cpu = round(time.process_time() - cpu, 6)
+            if rss is not None:
+                st.rss_delta = peak_rss() - rss
+            st.items_after = book_counts(st.oeb)
+            self.stack.pop()
+            if profiler is not None:
+                st.functions = top_functions(profiler, self.functions)
+
+    def as_dict(self):
+        return {'version': REPORT_VERSION,
+                'started': self.started,
+                'wall_time': None if self.wall is None else round(self.wall, 6),
+                'cpu_time': None if self.cpu is None else round(self.cpu, 6),
+                'peak_rss': self.peak_rss,
+                'metadata': self.metadata,
+                'stages': [s.as_dict() for s in self.stages]}
+
+    def dump(self, path):
+        """Write the report as JSON to path."""
+        data = json.dumps(self.as_dict(), indent=2, sort_keys=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def current_profile():
+    return getattr(_active, 'profile', None)
+
+
+@contextmanager
+def stage(name, oeb=None):
+    """
+    Time the block as a stage of the active profile, if any. Meant to be
+    used by plugins around the transforms they run.
+    """
+    profile = current_profile()
+    if profile is None:
+        yield None
+    else:
+        with profile.stage(name, oeb) as st:
+            yield st
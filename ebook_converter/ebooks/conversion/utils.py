@@ -1,3 +1,4 @@
+import functools
 import re
 from math import ceil
 from ebook_converter.ebooks.conversion.preprocess import DocAnalysis, Dehyphenator
@@ -7,6 +8,142 @@ from ebook_converter.utils.wordcount import get_wordcount_obj
 
 LOG = logging.default_log
 
+# Patterns {{{
+# The patterns built from the line length or the line markup of a document
+# vary, they are compiled once per variant
+compile_pattern = functools.lru_cache(maxsize=256)(re.compile)
+
+LINE_PAT = re.compile('(?<=<p).*?(?=</p>)', re.IGNORECASE|re.DOTALL)
+BLANK_PAT = re.compile(r'\s*(?P<openline><p(?!\sclass=\"(softbreak|whitespace)\")[^>]*>)\s*(?P<closeline></p>)', re.IGNORECASE)
+ANY_BLANK_PAT = re.compile(r'\s*(?P<openline><p[^>]*>)\s*(?P<closeline></p>)', re.IGNORECASE)
+MULTI_BLANK_PAT = re.compile(r'(\s*<p[^>]*>\s*</p>(\s*<div[^>]*>\s*</div>\s*)*){2,}(?!\s*<h\d)', re.IGNORECASE)
+ANY_MULTI_BLANK_PAT = re.compile(r'(\s*<p[^>]*>\s*</p>(\s*<div[^>]*>\s*</div>\s*)*){2,}', re.IGNORECASE)
+SINGLE_BLANK_PAT = re.compile(r'(\s*<(p|div)[^>]*>\s*</(p|div)>)', re.IGNORECASE)
+
+HEAD_PAT = re.compile(r'(?s)<head[^>]*>.*?</head>')
+TAG_PAT = re.compile(r'<[^>]*>')
+HEADING_PAT = re.compile('<h[1-3][^>]*>', re.IGNORECASE)
+PARAGRAPH_PAT = re.compile('<p[^>]*>', re.IGNORECASE)
+SPAN_PAT = re.compile('<span[^>]*>', re.IGNORECASE)
+HTM_END_PAT = re.compile('</(p|div)>', re.DOTALL)
+LINE_FEED_PAT = re.compile('(\n|\r|\r\n)', re.DOTALL)
+
+ITALICIZE_WORDS = [
+    'Etc.', 'etc.', 'viz.', 'ie.', 'i.e.', 'Ie.', 'I.e.', 'eg.',
+    'e.g.', 'Eg.', 'E.g.', 'et al.', 'et cetera', 'n.b.', 'N.b.',
+    'nota bene', 'Nota bene', 'Ste.', 'Mme.', 'Mdme.',
+    'Mlle.', 'Mons.', 'PS.', 'PPS.',
+]
+# None of the words can match where another one does, so they are all
+# italicized in a single pass
+ITALICIZE_WORDS_PAT = re.compile(
+    r'(?<=\s|>)(' + '|'.join(map(re.escape, ITALICIZE_WORDS)) + r')(?=\s|<)')
+ITALICIZE_STYLE_PATS = [re.compile(pat) for pat in (
+    str(r'(?msu)(?<=[\s>"“\'‘])_\*/(?P<words>[^\*_]+)/\*_'),
+    str(r'(?msu)(?<=[\s>"“\'‘])~~(?P<words>[^~]+)~~'),
+    str(r'(?msu)(?<=[\s>"“\'‘])_/(?P<words>[^/_]+)/_'),
+    str(r'(?msu)(?<=[\s>"“\'‘])_\*(?P<words>[^\*_]+)\*_'),
+    str(r'(?msu)(?<=[\s>"“\'‘])\*/(?P<words>[^/\*]+)/\*'),
+    str(r'(?msu)(?<=[\s>"“\'‘])/:(?P<words>[^:/]+):/'),
+    str(r'(?msu)(?<=[\s>"“\'‘])\|:(?P<words>[^:\|]+):\|'),
+    str(r'(?msu)(?<=[\s>"“\'‘])\*(?P<words>[^\*]+)\*'),
+    str(r'(?msu)(?<=[\s>"“\'‘])~(?P<words>[^~]+)~'),
+    str(r'(?msu)(?<=[\s>"“\'‘])/(?P<words>[^/\*><]+)/'),
+    str(r'(?msu)(?<=[\s>"“\'‘])_(?P<words>[^_]+)_'),
+)]
+
+PRE_PAT = re.compile(r'<pre>', re.IGNORECASE)
+PRE_TEXT_PAT = re.compile(r'.*?(?<=<pre>)(?P<text>.*?)</pre>', re.IGNORECASE|re.DOTALL)
+ENTITY_PAT = re.compile(r'&(\S+?);')
+UNMARKED_LINE_END_PAT = re.compile('(?<!>)(\n)')
+ANCHOR_PAT = re.compile('</?a[^>]*>')
+ABBYY_LINE_PAT = re.compile('((?P<linestart><p\\sstyle="(?P<styles>[^\"]*?);?">)(?P<content>.*?)(?P<lineend></p>)|(?P<image><img[^>]*>))', re.IGNORECASE)
+
+CLOSE_LINE_PAT = re.compile(r"\s*</(?P<tag>p|div)>")
+OPEN_LINE_PAT = re.compile(r"\s*<(?P<tag>p|div)(?P<style>[^>]*)>\s*")
+NBSP_INDENT_PAT = re.compile(str(r'<(?P<tagtype>p|div)(?P<formatting>[^>]*)>\s*(?P<span>(<span[^>]*>\s*)+)?\s*(\u00a0){2,}'), re.IGNORECASE)
+NBSP_PAT = re.compile(str(r'\u00a0'))
+EMPTY_OP_PAT = re.compile(str(r'\s*<o:p>\s*</o:p>'))
+SMART_TAG_PAT = re.compile('(?i)</?st1:\\w+>')
+SELF_CLOSED_P_PAT = re.compile('<p[^>/]*/>')
+FMT_TAGS = 'font|[ibu]|em|strong'
+OPEN_FMT_PAT, CLOSE_FMT_PAT = r'<(?:{})(?:\s[^>]*)?>'.format(FMT_TAGS), '</(?:{})>'.format(FMT_TAGS)
+EMPTY_SPAN_PAT = re.compile(r"\s*<span[^>]*>\s*(<span[^>]*>\s*</span>){0,2}\s*</span>\s*")
+EMPTY_FMT_PAT = re.compile(
+    r"\s*{open}\s*({open}\s*{close}\s*){{0,2}}\s*{close}".format(open=OPEN_FMT_PAT, close=CLOSE_FMT_PAT))
+EMPTY_DIV_P_PAT = re.compile('<div[^>]*>\\s*<p[^>]*>\\s*</p>\\s*</div>')
+EMPTY_HEADING_PAT = re.compile(r'(?i)<h\d+>\s*</h\d+>')
+
+CHAPTER_BREAK_PAT = re.compile(
+    r'<(?P<styles>(p|div)[^>]*)>\s*(?P<section>(<span[^>]*>)?\s*(?!([\W]+\s*)+)'
+    r'(<[ibu][^>]*>){0,2}\s*(<span[^>]*>)?\s*(<[ibu][^>]*>){0,2}\s*(<span[^>]*>)?\s*'
+    r'.?(?=[a-z#\-*\s]+<)([a-z#-*]+\s*){1,5}\s*\s*(</span>)?(</[ibu]>){0,2}\s*'
+    r'(</span>)?\s*(</[ibu]>){0,2}\s*(</span>)?\s*</(p|div)>)', re.IGNORECASE)
+DOUBLE_HEADING_PAT = re.compile(
+    r'(?P<firsthead><h(1|2)[^>]*>.+?</h(1|2)>\s*(<(?!h\d)[^>]*>\s*)*)<h(1|2)(?P<secondhead>[^>]*>.+?)</h(1|2)>', re.IGNORECASE)
+DIV_BR_PAT = re.compile('(?i)<div[^>]*>\\s*<br(\\s?/)?>\\s*</div>')
+SCENE_BREAK_PAT = re.compile(r'<p class="scenebreak"[^>]*>.*?</p>')
+SOFT_BREAK_PAT = re.compile('<p\\s+class="softbreak"[^>]*>\\s*</p>')
+BLANKS_AROUND_HEADINGS_PAT = re.compile(
+    r'(?P<initparas>(<(p|div)[^>]*>\s*</(p|div)>\s*){1,}\s*)?'
+    r'(?P<content><h(?P<hnum>\d+)[^>]*>.*?</h(?P=hnum)>)(?P<endparas>\s*(<(p|div)[^>]*>\s*</(p|div)>\s*){1,})?', re.IGNORECASE|re.DOTALL)
+BLANKS_AROUND_SCENE_BREAKS_PAT = re.compile(
+    r'(?P<initparas>(<(p|div)[^>]*>\s*</(p|div)>\s*){1,}\s*)?'
+    r'(?P<content><p class="scenebreak"[^>]*>.*?</p>)(?P<endparas>\s*(<(p|div)[^>]*>\s*</(p|div)>\s*){1,})?', re.IGNORECASE|re.DOTALL)
+BLANKS_N_NOPUNCT_PAT = re.compile(
+    r'(?P<initparas>(<p[^>]*>\s*</p>\s*){1,}\s*)?<p[^>]*>\s*(<(span|[ibu]|em|strong|font)[^>]*>\s*)*'
+    r'.{1,100}?[^\W](</(span|[ibu]|em|strong|font)>\s*)*</p>(?P<endparas>\s*(<p[^>]*>\s*</p>\s*){1,})?', re.IGNORECASE|re.DOTALL)
+HEADING_OPEN_PAT = re.compile('(?i)<h(?P<hnum>\\d+)[^>]*>')
+BEFORE_HEADING_PAT = re.compile('(?si)^.*?(?=<h\\d)')
+SPAN_TAG_PAT = re.compile('\\s*</?span[^>]*>\\s*')
+PARAGRAPH_END_PAT = re.compile('.*[\"\'.!?:]$')
+# }}}
+
+
+class FlowStatistics(object):
+    """
+    Statistics of the HTML of a flow, as analysed by the heuristics. The
+    document is split in lines once and each statistic is computed on first
+    use, so the passes that look at the same version of the HTML share
+    them.
+    """
+
+    def __init__(self, html):
+        self.html = html
+        self.analyses = {}
+
+    @functools.cached_property
+    def lines(self):
+        # The content of the paragraphs
+        return LINE_PAT.findall(self.html)
+
+    @functools.cached_property
+    def blank_lines(self):
+        # Number of empty paragraphs, not counting those already marked as
+        # soft breaks or whitespace
+        return len(BLANK_PAT.findall(self.html))
+
+    @functools.cached_property
+    def word_count(self):
+        text = TAG_PAT.sub('', HEAD_PAT.sub('', self.html))
+        return get_wordcount_obj(text).words
+
+    @functools.cached_property
+    def line_format(self):
+        """The markup used for lines, 'html' or 'spanned_html'."""
+        paras = len(PARAGRAPH_PAT.findall(self.html))
+        spans = len(SPAN_PAT.findall(self.html))
+        if spans > 1 and float(paras) / float(spans) < 0.75:
+            return 'spanned_html'
+        return 'html'
+
+    def analysis(self, format):
+        """The :class:`DocAnalysis` of the lines in the given format."""
+        ans = self.analyses.get(format)
+        if ans is None:
+            ans = self.analyses[format] = DocAnalysis(format, self.html)
+        return ans
+
 
 class HeuristicProcessor(object):
 
@@ -22,16 +159,17 @@ class HeuristicProcessor(object):
         self.chapters_with_title = 0
         self.blanks_deleted = False
         self.blanks_between_paragraphs = False
-        self.linereg = re.compile('(?<=<p).*?(?=</p>)', re.IGNORECASE|re.DOTALL)
-        self.blankreg = re.compile(r'\s*(?P<openline><p(?!\sclass=\"(softbreak|whitespace)\")[^>]*>)\s*(?P<closeline></p>)', re.IGNORECASE)
-        self.anyblank = re.compile(r'\s*(?P<openline><p[^>]*>)\s*(?P<closeline></p>)', re.IGNORECASE)
-        self.multi_blank = re.compile(r'(\s*<p[^>]*>\s*</p>(\s*<div[^>]*>\s*</div>\s*)*){2,}(?!\s*<h\d)', re.IGNORECASE)
-        self.any_multi_blank = re.compile(r'(\s*<p[^>]*>\s*</p>(\s*<div[^>]*>\s*</div>\s*)*){2,}', re.IGNORECASE)
+        self.flow_stats = None
+        self.linereg = LINE_PAT
+        self.blankreg = BLANK_PAT
+        self.anyblank = ANY_BLANK_PAT
+        self.multi_blank = MULTI_BLANK_PAT
+        self.any_multi_blank = ANY_MULTI_BLANK_PAT
         self.line_open = (
             r"<(?P<outer>p|div)[^>]*>\s*(<(?P<inner1>font|span|[ibu])[^>]*>)?\s*"
             r"(<(?P<inner2>font|span|[ibu])[^>]*>)?\s*(<(?P<inner3>font|span|[ibu])[^>]*>)?\s*")
         self.line_close = "(</(?P=inner3)>)?\\s*(</(?P=inner2)>)?\\s*(</(?P=inner1)>)?\\s*</(?P=outer)>"
-        self.single_blank = re.compile(r'(\s*<(p|div)[^>]*>\s*</(p|div)>)', re.IGNORECASE)
+        self.single_blank = SINGLE_BLANK_PAT
         self.scene_break_open = '<p class="scenebreak" style="text-align:center; text-indent:0%; margin-top:1em; margin-bottom:1em; page-break-before:avoid">'
         self.common_in_text_endings = '[\"\'—’”,\\.!\\?\\…\\)„\\w]'
         self.common_in_text_beginnings = '[\\w\'\"“‘‛]'
@@ -103,10 +241,8 @@ class HeuristicProcessor(object):
         inspect.  Percent is the minimum percent of line endings which should
         be marked up to return true.
         '''
-        htm_end_ere = re.compile('</(p|div)>', re.DOTALL)
-        line_end_ere = re.compile('(\n|\r|\r\n)', re.DOTALL)
-        htm_end = htm_end_ere.findall(raw)
-        line_end = line_end_ere.findall(raw)
+        htm_end = HTM_END_PAT.findall(raw)
+        line_end = LINE_FEED_PAT.findall(raw)
         tot_htm_ends = len(htm_end)
         tot_ln_fds = len(line_end)
 
@@ -136,44 +272,38 @@ class HeuristicProcessor(object):
                 with open(os.path.join(odir, name), 'wb') as f:
                     f.write(raw.encode('utf-8'))
 
+    def stats(self, html):
+        """
+        The :class:`FlowStatistics` of html, kept for as long as the passes
+        leave the HTML unchanged.
+        """
+        if self.flow_stats is None or (self.flow_stats.html is not html and
+                                       self.flow_stats.html != html):
+            self.flow_stats = FlowStatistics(html)
+        return self.flow_stats
+
     def get_word_count(self, html):
-        word_count_text = re.sub(r'(?s)<head[^>]*>.*?</head>', '', html)
-        word_count_text = re.sub(r'<[^>]*>', '', word_count_text)
-        wordcount = get_wordcount_obj(word_count_text)
-        return wordcount.words
+        return self.stats(html).word_count
 
     def markup_italicis(self, html):
-        ITALICIZE_WORDS = [
-            'Etc.', 'etc.', 'viz.', 'ie.', 'i.e.', 'Ie.', 'I.e.', 'eg.',
-            'e.g.', 'Eg.', 'E.g.', 'et al.', 'et cetera', 'n.b.', 'N.b.',
-            'nota bene', 'Nota bene', 'Ste.', 'Mme.', 'Mdme.',
-            'Mlle.', 'Mons.', 'PS.', 'PPS.',
-        ]
-
-        ITALICIZE_STYLE_PATS = [
-            str(r'(?msu)(?<=[\s>"“\'‘])_\*/(?P<words>[^\*_]+)/\*_'),
-            str(r'(?msu)(?<=[\s>"“\'‘])~~(?P<words>[^~]+)~~'),
-            str(r'(?msu)(?<=[\s>"“\'‘])_/(?P<words>[^/_]+)/_'),
-            str(r'(?msu)(?<=[\s>"“\'‘])_\*(?P<words>[^\*_]+)\*_'),
-            str(r'(?msu)(?<=[\s>"“\'‘])\*/(?P<words>[^/\*]+)/\*'),
-            str(r'(?msu)(?<=[\s>"“\'‘])/:(?P<words>[^:/]+):/'),
-            str(r'(?msu)(?<=[\s>"“\'‘])\|:(?P<words>[^:\|]+):\|'),
-            str(r'(?msu)(?<=[\s>"“\'‘])\*(?P<words>[^\*]+)\*'),
-            str(r'(?msu)(?<=[\s>"“\'‘])~(?P<words>[^~]+)~'),
-            str(r'(?msu)(?<=[\s>"“\'‘])/(?P<words>[^/\*><]+)/'),
-            str(r'(?msu)(?<=[\s>"“\'‘])_(?P<words>[^_]+)_'),
-        ]
-
-        for word in ITALICIZE_WORDS:
-            html = re.sub(r'(?<=\s|>)' + re.escape(word) + r'(?=\s|<)', '<i>%s</i>' % word, html)
-
-        search_text = re.sub(r'(?s)<head[^>]*>.*?</head>', '', html)
-        search_text = re.sub(r'<[^>]*>', '', search_text)
+        html = ITALICIZE_WORDS_PAT.sub(r'<i>\1</i>', html)
+
+        search_text = HEAD_PAT.sub('', html)
+        search_text = TAG_PAT.sub('', search_text)
+        done = set()
         for pat in ITALICIZE_STYLE_PATS:
-            for match in re.finditer(pat, search_text):
+            for match in pat.finditer(search_text):
+                text = match.group(0)
+                if text in done:
+                    # Every occurrence was replaced already
+                    continue
+                done.add(text)
                 ital_string = str(match.group('words'))
+                if '\\' not in ital_string:
+                    html = html.replace(text, '<i>%s</i>' % ital_string)
+                    continue
                 try:
-                    html = re.sub(re.escape(str(match.group(0))), '<i>%s</i>' % ital_string, html)
+                    html = re.sub(re.escape(str(text)), '<i>%s</i>' % ital_string, html)
                 except OverflowError:
                     # match.group(0) was too large to be compiled into a regex
                     continue
@@ -199,8 +329,7 @@ class HeuristicProcessor(object):
                 typical_chapters = 15000.
             self.min_chapters = int(ceil(wordcount / typical_chapters))
         self.log.debug("minimum chapters required are: %s", self.min_chapters)
-        heading = re.compile('<h[1-3][^>]*>', re.IGNORECASE)
-        self.html_preprocess_sections = len(heading.findall(html))
+        self.html_preprocess_sections = len(HEADING_PAT.findall(html))
         self.log.debug("found %s pre-existing headings",
                        self.html_preprocess_sections)
 
@@ -297,12 +426,13 @@ class HeuristicProcessor(object):
 
                 chapter_marker = arg_ignorecase+init_lookahead+full_chapter_line+blank_lines+lp_n_lookahead_open+n_lookahead+lp_n_lookahead_close+ \
                     lp_opt_title_open+title_line_open+title_header_open+lp_title+title_header_close+title_line_close+lp_opt_title_close
-                chapdetect = re.compile(r'%s' % chapter_marker)
+                chapdetect = compile_pattern(r'%s' % chapter_marker)
 
                 if analyze:
-                    hits = len(chapdetect.findall(html))
+                    for match in chapdetect.finditer(html):
+                        hits += 1
+                        self.analyze_title_matches(match)
                     if hits:
-                        chapdetect.sub(self.analyze_title_matches, html)
                         if float(self.chapters_with_title) / float(hits) > .5:
                             title_req = True
                             strict_title = False
@@ -377,9 +507,9 @@ class HeuristicProcessor(object):
             em_en_unwrap_regex = em_en_lookahead+line_ending+blanklines+line_opening
             shy_unwrap_regex = soft_hyphen+line_ending+blanklines+line_opening
 
-        unwrap = re.compile("%s" % unwrap_regex, re.UNICODE)
-        em_en_unwrap = re.compile("%s" % em_en_unwrap_regex, re.UNICODE)
-        shy_unwrap = re.compile("%s" % shy_unwrap_regex, re.UNICODE)
+        unwrap = compile_pattern("%s" % unwrap_regex, re.UNICODE)
+        em_en_unwrap = compile_pattern("%s" % em_en_unwrap_regex, re.UNICODE)
+        shy_unwrap = compile_pattern("%s" % shy_unwrap_regex, re.UNICODE)
 
         if format == 'txt':
             content = unwrap.sub(' ', content)
@@ -400,29 +530,25 @@ class HeuristicProcessor(object):
         return content
 
     def markup_pre(self, html):
-        pre = re.compile(r'<pre>', re.IGNORECASE)
-        if len(pre.findall(html)) >= 1:
+        if len(PRE_PAT.findall(html)) >= 1:
             self.log.debug("Running Text Processing")
-            outerhtml = re.compile(r'.*?(?<=<pre>)(?P<text>.*?)</pre>', re.IGNORECASE|re.DOTALL)
-            html = outerhtml.sub(self.txt_process, html)
+            html = PRE_TEXT_PAT.sub(self.txt_process, html)
             from ebook_converter.ebooks.conversion.preprocess import convert_entities
-            html = re.sub(r'&(\S+?);', convert_entities, html)
+            html = ENTITY_PAT.sub(convert_entities, html)
         else:
             # Add markup naively
             # TODO - find out if there are cases where there are more than one <pre> tag or
             # other types of unmarked html and handle them in some better fashion
-            add_markup = re.compile('(?<!>)(\n)')
-            html = add_markup.sub('</p>\n<p>', html)
+            html = UNMARKED_LINE_END_PAT.sub('</p>\n<p>', html)
         return html
 
     def arrange_htm_line_endings(self, html):
-        html = re.sub(r"\s*</(?P<tag>p|div)>", "</"+"\\g<tag>"+">\n", html)
-        html = re.sub(r"\s*<(?P<tag>p|div)(?P<style>[^>]*)>\s*", "\n<"+"\\g<tag>"+"\\g<style>"+">", html)
+        html = CLOSE_LINE_PAT.sub("</"+"\\g<tag>"+">\n", html)
+        html = OPEN_LINE_PAT.sub("\n<"+"\\g<tag>"+"\\g<style>"+">", html)
         return html
 
     def fix_nbsp_indents(self, html):
-        txtindent = re.compile(str(r'<(?P<tagtype>p|div)(?P<formatting>[^>]*)>\s*(?P<span>(<span[^>]*>\s*)+)?\s*(\u00a0){2,}'), re.IGNORECASE)
-        html = txtindent.sub(self.insert_indent, html)
+        html = NBSP_INDENT_PAT.sub(self.insert_indent, html)
         if self.found_indents > 1:
             self.log.debug("replaced %s nbsp indents with inline styles",
                            self.found_indents)
@@ -430,25 +556,22 @@ class HeuristicProcessor(object):
 
     def cleanup_markup(self, html):
         # remove remaining non-breaking spaces
-        html = re.sub(str(r'\u00a0'), ' ', html)
+        html = NBSP_PAT.sub(' ', html)
         # Get rid of various common microsoft specific tags which can cause issues later
         # Get rid of empty <o:p> tags to simplify other processing
-        html = re.sub(str(r'\s*<o:p>\s*</o:p>'), ' ', html)
+        html = EMPTY_OP_PAT.sub(' ', html)
         # Delete microsoft 'smart' tags
-        html = re.sub('(?i)</?st1:\\w+>', '', html)
+        html = SMART_TAG_PAT.sub('', html)
         # Re-open self closing paragraph tags
-        html = re.sub('<p[^>/]*/>', '<p> </p>', html)
+        html = SELF_CLOSED_P_PAT.sub('<p> </p>', html)
         # Get rid of empty span, bold, font, em, & italics tags
-        fmt_tags = 'font|[ibu]|em|strong'
-        open_fmt_pat, close_fmt_pat = r'<(?:{})(?:\s[^>]*)?>'.format(fmt_tags), '</(?:{})>'.format(fmt_tags)
         for i in range(2):
-            html = re.sub(r"\s*<span[^>]*>\s*(<span[^>]*>\s*</span>){0,2}\s*</span>\s*", " ", html)
-            html = re.sub(
-                r"\s*{open}\s*({open}\s*{close}\s*){{0,2}}\s*{close}".format(open=open_fmt_pat, close=close_fmt_pat) , " ", html)
+            html = EMPTY_SPAN_PAT.sub(" ", html)
+            html = EMPTY_FMT_PAT.sub(" ", html)
         # delete surrounding divs from empty paragraphs
-        html = re.sub('<div[^>]*>\\s*<p[^>]*>\\s*</p>\\s*</div>', '<p> </p>', html)
+        html = EMPTY_DIV_P_PAT.sub('<p> </p>', html)
         # Empty heading tags
-        html = re.sub(r'(?i)<h\d+>\s*</h\d+>', '', html)
+        html = EMPTY_HEADING_PAT.sub('', html)
         self.deleted_nbsps = True
         return html
 
@@ -457,26 +580,17 @@ class HeuristicProcessor(object):
         determines the type of html line ending used most commonly in a document
         use before calling docanalysis functions
         '''
-        paras_reg = re.compile('<p[^>]*>', re.IGNORECASE)
-        spans_reg = re.compile('<span[^>]*>', re.IGNORECASE)
-        paras = len(paras_reg.findall(html))
-        spans = len(spans_reg.findall(html))
-        if spans > 1:
-            if float(paras) / float(spans) < 0.75:
-                return 'spanned_html'
-            else:
-                return 'html'
-        else:
-            return 'html'
+        return self.stats(html).line_format
 
     def analyze_blanks(self, html):
-        blanklines = self.blankreg.findall(html)
-        lines = self.linereg.findall(html)
+        stats = self.stats(html)
+        blanklines = stats.blank_lines
+        lines = stats.lines
         if len(lines) > 1:
             self.log.debug("There are %s blank lines. %s percent blank",
-                           len(blanklines), len(blanklines) / len(lines))
+                           blanklines, blanklines / len(lines))
 
-            if float(len(blanklines)) / float(len(lines)) > 0.40:
+            if float(blanklines) / float(len(lines)) > 0.40:
                 return True
             else:
                 return False
@@ -507,16 +621,6 @@ class HeuristicProcessor(object):
         return html
 
     def detect_whitespace(self, html):
-        blanks_around_headings = re.compile(
-            r'(?P<initparas>(<(p|div)[^>]*>\s*</(p|div)>\s*){1,}\s*)?'
-            r'(?P<content><h(?P<hnum>\d+)[^>]*>.*?</h(?P=hnum)>)(?P<endparas>\s*(<(p|div)[^>]*>\s*</(p|div)>\s*){1,})?', re.IGNORECASE|re.DOTALL)
-        blanks_around_scene_breaks = re.compile(
-            r'(?P<initparas>(<(p|div)[^>]*>\s*</(p|div)>\s*){1,}\s*)?'
-            r'(?P<content><p class="scenebreak"[^>]*>.*?</p>)(?P<endparas>\s*(<(p|div)[^>]*>\s*</(p|div)>\s*){1,})?', re.IGNORECASE|re.DOTALL)
-        blanks_n_nopunct = re.compile(
-            r'(?P<initparas>(<p[^>]*>\s*</p>\s*){1,}\s*)?<p[^>]*>\s*(<(span|[ibu]|em|strong|font)[^>]*>\s*)*'
-            r'.{1,100}?[^\W](</(span|[ibu]|em|strong|font)>\s*)*</p>(?P<endparas>\s*(<p[^>]*>\s*</p>\s*){1,})?', re.IGNORECASE|re.DOTALL)
-
         def merge_header_whitespace(match):
             initblanks = match.group('initparas')
             endblanks = match.group('endparas')
@@ -533,20 +637,20 @@ class HeuristicProcessor(object):
             elif content.find('scenebreak') != -1:
                 return content
             else:
-                content = re.sub('(?i)<h(?P<hnum>\\d+)[^>]*>', '\n\n<h'+'\\g<hnum>'+' style="'+top_margin+bottom_margin+'">', content)
+                content = HEADING_OPEN_PAT.sub('\n\n<h'+'\\g<hnum>'+' style="'+top_margin+bottom_margin+'">', content)
             return content
 
-        html = blanks_around_headings.sub(merge_header_whitespace, html)
-        html = blanks_around_scene_breaks.sub(merge_header_whitespace, html)
+        html = BLANKS_AROUND_HEADINGS_PAT.sub(merge_header_whitespace, html)
+        html = BLANKS_AROUND_SCENE_BREAKS_PAT.sub(merge_header_whitespace, html)
 
         def markup_whitespaces(match):
             blanks = match.group(0)
             blanks = self.blankreg.sub('\n<p class="whitespace" style="text-align:center; margin-top:0em; margin-bottom:0em"> </p>', blanks)
             return blanks
 
-        html = blanks_n_nopunct.sub(markup_whitespaces, html)
+        html = BLANKS_N_NOPUNCT_PAT.sub(markup_whitespaces, html)
         if self.html_preprocess_sections > self.min_chapters:
-            html = re.sub('(?si)^.*?(?=<h\\d)', markup_whitespaces, html)
+            html = BEFORE_HEADING_PAT.sub(markup_whitespaces, html)
 
         return html
 
@@ -555,7 +659,7 @@ class HeuristicProcessor(object):
         line_two = '(?P<line_two>'+re.sub('(ou|in|cha)', 'linetwo_', self.line_open)+ \
                      '\\s*(?P<line_two_content>.*?)'+re.sub('(ou|in|cha)', 'linetwo_', self.line_close)+')'
         div_break_candidate_pattern = line+'\\s*<div[^>]*>\\s*</div>\\s*'+line_two
-        div_break_candidate = re.compile(r'%s' % div_break_candidate_pattern, re.IGNORECASE|re.UNICODE)
+        div_break_candidate = compile_pattern(r'%s' % div_break_candidate_pattern, re.IGNORECASE|re.UNICODE)
 
         def convert_div_softbreaks(match):
             init_is_paragraph = self.check_paragraph(match.group('init_content'))
@@ -578,7 +682,7 @@ class HeuristicProcessor(object):
     def detect_scene_breaks(self, html):
         scene_break_regex = self.line_open+'(?!('+self.common_in_text_beginnings+'|.*?'+self.common_in_text_endings+ \
                                              '<))(?P<break>((?P<break_char>((?!\\s)\\W))\\s*(?P=break_char)?)+)\\s*'+self.line_close
-        scene_breaks = re.compile(r'%s' % scene_break_regex, re.IGNORECASE|re.UNICODE)
+        scene_breaks = compile_pattern(r'%s' % scene_break_regex, re.IGNORECASE|re.UNICODE)
         html = scene_breaks.sub(self.scene_break_open+'\\g<break>'+'</p>', html)
         return html
 
@@ -621,19 +725,18 @@ class HeuristicProcessor(object):
         return scene_break
 
     def check_paragraph(self, content):
-        content = re.sub('\\s*</?span[^>]*>\\s*', '', content)
-        if re.match('.*[\"\'.!?:]$', content):
+        content = SPAN_TAG_PAT.sub('', content)
+        if PARAGRAPH_END_PAT.match(content):
             # print "detected this as a paragraph"
             return True
         else:
             return False
 
     def abbyy_processor(self, html):
-        abbyy_line = re.compile('((?P<linestart><p\\sstyle="(?P<styles>[^\"]*?);?">)(?P<content>.*?)(?P<lineend></p>)|(?P<image><img[^>]*>))', re.IGNORECASE)
         empty_paragraph = '\n<p> </p>\n'
         self.in_blockquote = False
         self.previous_was_paragraph = False
-        html = re.sub('</?a[^>]*>', '', html)
+        html = ANCHOR_PAT.sub('', html)
 
         def convert_styles(match):
             # print "raw styles are: "+match.group('styles')
@@ -722,7 +825,7 @@ class HeuristicProcessor(object):
                 # print "previous_was_paragraph is now set to "+str(self.previous_was_paragraph)+"\n\n\n"
                 return blockquote_open_loop+blockquote_close_loop+paragraph_before+'<p style="'+text_indent+text_align+'">'+content+'</p>'+paragraph_after
 
-        html = abbyy_line.sub(convert_styles, html)
+        html = ABBYY_LINE_PAT.sub(convert_styles, html)
         return html
 
     def __call__(self, html):
@@ -800,7 +903,7 @@ class HeuristicProcessor(object):
 
         # Check Line histogram to determine if the document uses hard line breaks, If 50% or
         # more of the lines break in the same region of the document then unwrapping is required
-        docanalysis = DocAnalysis(format, html)
+        docanalysis = self.stats(html).analysis(format)
         hardbreaks = docanalysis.line_histogram(.50)
         self.log.debug("Hard line breaks check returned %s", hardbreaks)
 
@@ -832,20 +935,13 @@ class HeuristicProcessor(object):
             self.log.debug("Looking for more split points based on "
                            "punctuation, currently have %s",
                            self.html_preprocess_sections)
-            chapdetect3 = re.compile(
-                r'<(?P<styles>(p|div)[^>]*)>\s*(?P<section>(<span[^>]*>)?\s*(?!([\W]+\s*)+)'
-                r'(<[ibu][^>]*>){0,2}\s*(<span[^>]*>)?\s*(<[ibu][^>]*>){0,2}\s*(<span[^>]*>)?\s*'
-                r'.?(?=[a-z#\-*\s]+<)([a-z#-*]+\s*){1,5}\s*\s*(</span>)?(</[ibu]>){0,2}\s*'
-                r'(</span>)?\s*(</[ibu]>){0,2}\s*(</span>)?\s*</(p|div)>)', re.IGNORECASE)
-            html = chapdetect3.sub(self.chapter_break, html)
+            html = CHAPTER_BREAK_PAT.sub(self.chapter_break, html)
 
         if getattr(self.extra_opts, 'renumber_headings', False):
             # search for places where a first or second level heading is immediately followed by another
             # top level heading.  demote the second heading to h3 to prevent splitting between chapter
             # headings and titles, images, etc
-            doubleheading = re.compile(
-                r'(?P<firsthead><h(1|2)[^>]*>.+?</h(1|2)>\s*(<(?!h\d)[^>]*>\s*)*)<h(1|2)(?P<secondhead>[^>]*>.+?)</h(1|2)>', re.IGNORECASE)
-            html = doubleheading.sub('\\g<firsthead>'+'\n<h3'+'\\g<secondhead>'+'</h3>', html)
+            html = DOUBLE_HEADING_PAT.sub('\\g<firsthead>'+'\n<h3'+'\\g<secondhead>'+'</h3>', html)
 
         # If scene break formatting is enabled, find all blank paragraphs that definitely aren't scenebreaks,
         # style it with the 'whitespace' class.  All remaining blank lines are styled as softbreaks.
@@ -853,15 +949,14 @@ class HeuristicProcessor(object):
         # If non-blank scene breaks exist they are center aligned and styled with appropriate margins.
         if getattr(self.extra_opts, 'format_scene_breaks', False):
             self.log.debug('Formatting scene breaks')
-            html = re.sub('(?i)<div[^>]*>\\s*<br(\\s?/)?>\\s*</div>', '<p></p>', html)
+            html = DIV_BR_PAT.sub('<p></p>', html)
             html = self.detect_scene_breaks(html)
             html = self.detect_whitespace(html)
             html = self.detect_soft_breaks(html)
             blanks_count = len(self.any_multi_blank.findall(html))
             if blanks_count >= 1:
                 html = self.merge_blanks(html, blanks_count)
-            detected_scene_break = re.compile(r'<p class="scenebreak"[^>]*>.*?</p>')
-            scene_break_count = len(detected_scene_break.findall(html))
+            scene_break_count = len(SCENE_BREAK_PAT.findall(html))
             # If the user has enabled scene break replacement, then either softbreaks
             # or 'hard' scene breaks are replaced, depending on which is in use
             # Otherwise separator lines are centered, use a bit larger margin in this case
@@ -869,10 +964,10 @@ class HeuristicProcessor(object):
             if replacement_break:
                 replacement_break = self.markup_user_break(replacement_break)
                 if scene_break_count >= 1:
-                    html = detected_scene_break.sub(replacement_break, html)
-                    html = re.sub('<p\\s+class="softbreak"[^>]*>\\s*</p>', replacement_break, html)
+                    html = SCENE_BREAK_PAT.sub(replacement_break, html)
+                    html = SOFT_BREAK_PAT.sub(replacement_break, html)
                 else:
-                    html = re.sub('<p\\s+class="softbreak"[^>]*>\\s*</p>', replacement_break, html)
+                    html = SOFT_BREAK_PAT.sub(replacement_break, html)
 
         if self.deleted_nbsps:
             # put back non-breaking spaces in empty paragraphs so they render correctly
@@ -6,11 +6,17 @@ import os
 import re
 import sys
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 from ebook_converter.ebooks.chardet import detect_xml_encoding
 from ebook_converter.utils import entities
 
 
+# Below this number of new files in a level of the link tree, reading them
+# in a pool of threads costs more than it saves
+MIN_PARALLEL_FILES = 8
+
+
 class Link(object):
     """
     Represents a link in a HTML file.
@@ -76,6 +82,7 @@ class HTMLFile(object):
     '''
 
     HTML_PAT = re.compile(r'<\s*html', re.IGNORECASE)
+    HTML_PAT_BIN = re.compile(br'<\s*html', re.IGNORECASE)
     TITLE_PAT = re.compile('<title>([^<>]+)</title>', re.IGNORECASE)
     LINK_PAT = re.compile(r'<\s*a\s+.*?href\s*=\s*(?:(?:"(?P<url1>[^"]+)")|'
                           r'(?:\'(?P<url2>[^\']+)\')|(?P<url3>[^\s>]+))',
@@ -104,9 +111,11 @@ class HTMLFile(object):
                         header = header.decode(encoding)
                     except ValueError:
                         pass
-                self.is_binary = level > 0 and not bool(self
-                                                        .HTML_PAT
-                                                        .search(header))
+                # The header stays undecoded if it is not valid in the
+                # detected encoding
+                pat = (self.HTML_PAT_BIN if isinstance(header, bytes) else
+                       self.HTML_PAT)
+                self.is_binary = level > 0 and not bool(pat.search(header))
                 if not self.is_binary:
                     src += f.read()
         except IOError as err:
@@ -148,6 +157,8 @@ class HTMLFile(object):
         return str(self)
 
     def find_links(self, src):
+        # Links are equal when their paths are
+        seen = set()
         for match in self.LINK_PAT.finditer(src):
             url = None
             for i in ('url1', 'url2', 'url3'):
@@ -160,7 +171,8 @@ class HTMLFile(object):
             except ValueError:
                 # Unparseable URL, ignore
                 continue
-            if link not in self.links:
+            if link.path not in seen:
+                seen.add(link.path)
                 self.links.append(link)
 
     def resolve(self, url):
@@ -168,24 +180,45 @@ class HTMLFile(object):
 
 
 def depth_first(root, flat, visited=None):
-    yield root
+    """
+    Yield the files in flat reachable from root, in depth first order.
+    visited is the set of paths of the files already yielded.
+    """
+    files = {hf.path: hf for hf in flat}
     if visited is None:
         visited = set()
-    visited.add(root)
-    for link in root.links:
-        if link.path is not None and link not in visited:
-            try:
-                index = flat.index(link)
-            except ValueError:  # Can happen if max_levels is used
+    yield root
+    visited.add(root.path)
+    # An explicit stack of the links left to follow in each file, so that
+    # deeply nested sites do not hit the recursion limit
+    stack = [iter(root.links)]
+    while stack:
+        for link in stack[-1]:
+            if link.path is None or link.path in visited:
+                continue
+            hf = files.get(link.path)
+            if hf is None:  # Can happen if max_levels is used
                 continue
-            hf = flat[index]
-            if hf not in visited:
-                yield hf
-                visited.add(hf)
-                for hf in depth_first(hf, flat, visited):
-                    if hf not in visited:
-                        yield hf
-                        visited.add(hf)
+            yield hf
+            visited.add(hf.path)
+            stack.append(iter(hf.links))
+            break
+        else:
+            stack.pop()
+
+
+def read_html_file(path, level, encoding, verbose, referrer):
+    """
+    Return the :class:`HTMLFile` for path, or the :class:`IgnoreFile` error
+    if it cannot be read or is not a HTML file.
+    """
+    try:
+        nf = HTMLFile(path, level, encoding, verbose, referrer=referrer)
+        if nf.is_binary:
+            raise IgnoreFile('%s is a binary file' % nf.path, -1)
+    except IgnoreFile as err:
+        return err
+    return nf
 
 
 def traverse(path_to_html_file, max_levels=sys.maxsize, verbose=0,
@@ -204,36 +237,50 @@ def traverse(path_to_html_file, max_levels=sys.maxsize, verbose=0,
     assert max_levels >= 0
     level = 0
     flat = [HTMLFile(path_to_html_file, level, encoding, verbose)]
+    # Paths of the files in flat and of the files that could not be used
+    seen, rejected = {flat[0].path}, set()
     next_level = list(flat)
     while level < max_levels and len(next_level) > 0:
         level += 1
-        nl = []
+        # The files first linked to from this level, each with the first
+        # file that refers to it
+        referrers = {}
         for hf in next_level:
-            rejects = []
             for link in hf.links:
-                if link.path is None or link.path in flat:
+                if (link.path is None or link.path in seen or
+                        link.path in rejected):
                     continue
-                try:
-                    nf = HTMLFile(link.path, level, encoding, verbose,
-                                  referrer=hf)
-                    if nf.is_binary:
-                        raise IgnoreFile('%s is a binary file' % nf.path, -1)
-                    nl.append(nf)
-                    flat.append(nf)
-                except IgnoreFile as err:
-                    rejects.append(link)
-                    if not err.doesnt_exist or verbose > 1:
-                        print(repr(err))
-            for link in rejects:
-                hf.links.remove(link)
-
-        next_level = list(nl)
-    orec = sys.getrecursionlimit()
-    sys.setrecursionlimit(500000)
-    try:
-        return flat, list(depth_first(flat[0], flat))
-    finally:
-        sys.setrecursionlimit(orec)
+                referrers.setdefault(link.path, hf)
+
+        def read(path):
+            return read_html_file(path, level, encoding, verbose,
+                                  referrers[path])
+
+        if len(referrers) < MIN_PARALLEL_FILES:
+            results = list(map(read, referrers))
+        else:
+            # Reading and scanning files for links is independent for each
+            # file
+            with ThreadPoolExecutor() as executor:
+                results = list(executor.map(read, referrers))
+
+        nl = []
+        for path, nf in zip(referrers, results):
+            if isinstance(nf, IgnoreFile):
+                rejected.add(path)
+                if not nf.doesnt_exist or verbose > 1:
+                    print(repr(nf))
+            else:
+                seen.update((path, nf.path))
+                nl.append(nf)
+        flat.extend(nl)
+        for hf in next_level:
+            if any(link.path in rejected for link in hf.links):
+                hf.links = [link for link in hf.links
+                            if link.path not in rejected]
+
+        next_level = nl
+    return flat, list(depth_first(flat[0], flat))
 
 
 def get_filelist(htmlfile, dir, opts, log):
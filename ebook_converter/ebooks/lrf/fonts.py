@@ -26,8 +26,10 @@ def get_font(name, size, encoding='unic'):
     """
     if name in LIBERATION_FONT_MAP:
         if not _LIB_CACHE:
-            for key in font_scanner.cache['fonts']:
-                record = font_scanner.cache['fonts'][key]
+            font_scanner.join()
+            for record in font_scanner.cached_fonts.values():
+                if not record:
+                    continue
                 _LIB_CACHE[record['family_name'] + ' ' +
                            record['subfamily_name']] = record['path']
 
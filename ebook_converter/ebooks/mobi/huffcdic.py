@@ -2,7 +2,9 @@
 Decompress MOBI files compressed with the Huff/cdic algorithm. Code thanks to
 darkninja and igorsk.
 """
+import os
 import struct
+from concurrent.futures import ProcessPoolExecutor
 
 from ebook_converter.ebooks.mobi import MobiError
 
@@ -11,11 +13,22 @@ __license__ = 'GPL v3'
 __copyright__ = '2011, Kovid Goyal <kovid@kovidgoyal.net>'
 __docformat__ = 'restructuredtext en'
 
+# Number of leading bits of a code used as the key of the decoding table.
+# Longer codes are rare and go through the canonical Huffman lookup.
+TABLE_BITS = 16
+# Books with fewer text records than this are decoded serially
+MIN_PARALLEL_SECTIONS = 64
+
+unpack_q = struct.Struct(b'>Q').unpack_from
+
 
 class Reader(object):
 
     def __init__(self):
-        self.q = struct.Struct(b'>Q').unpack_from
+        self.dictionary = []
+        self.table = None
+        self.expanded = None
+        self._expanding = set()
 
     def load_huff(self, huff):
         if huff[0:8] != b'HUFF\x00\x00\x00\x18':
@@ -39,6 +52,7 @@ class Reader(object):
             self.maxcode += (((maxcode + 1) << (32 - codelen)) - 1, )
 
         self.dictionary = []
+        self.table = self.expanded = None
 
     def load_cdic(self, cdic):
         if cdic[0:8] != b'CDIC\x00\x00\x00\x10':
@@ -52,9 +66,77 @@ class Reader(object):
             slice = cdic[18+off:18+off+(blen&0x7fff)]
             return (slice, blen&0x8000)
         self.dictionary += map(getslice, struct.unpack_from(b'>%dH' % n, cdic, 16))
+        self.table = self.expanded = None
+
+    def lookup(self, code):
+        '''
+        Return (codelen, dictionary index) for the code in the top bits of
+        the 32 bit integer code, using the canonical Huffman tables.
+        '''
+        codelen, term, maxcode = self.dict1[code >> 24]
+        if not term:
+            while code < self.mincode[codelen]:
+                codelen += 1
+            maxcode = self.maxcode[codelen]
+        return codelen, (maxcode - code) >> (32 - codelen)
+
+    def build_tables(self):
+        '''
+        Precompute the decoding table, mapping every TABLE_BITS wide prefix
+        to the (codelen, dictionary index) of the code it starts with (or None
+        if the code is longer than TABLE_BITS), and expand all dictionary
+        entries, so that decoding never has to recurse.
+        '''
+        shift = 32 - TABLE_BITS
+        table = []
+        for prefix in range(1 << TABLE_BITS):
+            code = prefix << shift
+            codelen, term, maxcode = self.dict1[prefix >> (TABLE_BITS - 8)]
+            if not term:
+                # Comparing against mincode only involves the top codelen
+                # bits, so codes up to TABLE_BITS long are fully determined
+                # by the prefix
+                while codelen <= TABLE_BITS and code < self.mincode[codelen]:
+                    codelen += 1
+                if codelen > TABLE_BITS:
+                    table.append(None)
+                    continue
+                maxcode = self.maxcode[codelen]
+            table.append((codelen, (maxcode - code) >> (32 - codelen)))
+        self.table = table
+
+        self.expanded = [None] * len(self.dictionary)
+        for i in range(len(self.dictionary)):
+            try:
+                self.expand(i)
+            except Exception:
+                # Broken entries only matter if they are actually used, in
+                # which case expand() raises again while decoding
+                pass
+
+    def expand(self, index):
+        '''
+        Return the fully decompressed dictionary entry at index.
+        '''
+        ans = self.expanded[index]
+        if ans is not None:
+            return ans
+        slice_, flag = self.dictionary[index]
+        if not flag:
+            if index in self._expanding:
+                raise MobiError('Recursive HUFF/CDIC dictionary entry')
+            self._expanding.add(index)
+            try:
+                slice_ = self.unpack(slice_)
+            finally:
+                self._expanding.discard(index)
+        self.expanded[index] = slice_
+        return slice_
 
     def unpack(self, data):
-        q = self.q
+        if self.table is None:
+            self.build_tables()
+        q, table, expanded = unpack_q, self.table, self.expanded
 
         bitsleft = len(data) * 8
         data += b'\x00\x00\x00\x00\x00\x00\x00\x00'
@@ -68,29 +150,38 @@ class Reader(object):
                 pos += 4
                 x, = q(data, pos)
                 n += 32
-            code = (x >> n) & ((1 << 32) - 1)
+            code = (x >> n) & 0xffffffff
 
-            codelen, term, maxcode = self.dict1[code >> 24]
-            if not term:
-                while code < self.mincode[codelen]:
-                    codelen += 1
-                maxcode = self.maxcode[codelen]
+            entry = table[code >> 16]
+            if entry is None:
+                codelen, r = self.lookup(code)
+            else:
+                codelen, r = entry
 
             n -= codelen
             bitsleft -= codelen
             if bitsleft < 0:
                 break
 
-            r = (maxcode - code) >> (32 - codelen)
-            slice_, flag = self.dictionary[r]
-            if not flag:
-                self.dictionary[r] = None
-                slice_ = self.unpack(slice_)
-                self.dictionary[r] = (slice_, 1)
+            slice_ = expanded[r]
+            if slice_ is None:
+                slice_ = self.expand(r)
             s.append(slice_)
         return b''.join(s)
 
 
+_worker_reader = None
+
+
+def _init_worker(reader):
+    global _worker_reader
+    _worker_reader = reader
+
+
+def _unpack_section(section):
+    return _worker_reader.unpack(section)
+
+
 class HuffReader(object):
 
     def __init__(self, huffs):
@@ -98,6 +189,22 @@ class HuffReader(object):
         self.reader.load_huff(huffs[0])
         for cdic in huffs[1:]:
             self.reader.load_cdic(cdic)
+        self.reader.build_tables()
 
     def unpack(self, section):
         return self.reader.unpack(section)
+
+    def unpack_sections(self, sections, workers=None):
+        '''
+        Decompress a list of text records, in a pool of worker processes if
+        there are many of them. The order of the records is preserved.
+        '''
+        workers = workers or os.cpu_count() or 1
+        if workers < 2 or len(sections) < MIN_PARALLEL_SECTIONS:
+            return list(map(self.unpack, sections))
+        chunksize = max(1, len(sections) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.reader,)) as executor:
+            return list(executor.map(_unpack_section, sections,
+                                     chunksize=chunksize))
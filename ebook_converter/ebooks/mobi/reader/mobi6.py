@@ -862,17 +862,18 @@ class MobiReader(object):
                                             self.book_header.huff_offset +
                                             self.book_header.huff_number))
             huff = HuffReader(huffs)
-            unpack = huff.unpack
+            # Records are independent, decode them in parallel
+            text_sections = huff.unpack_sections(text_sections)
 
         elif self.book_header.compression_type == b'\x00\x02':
-            unpack = decompress_doc
+            text_sections = map(decompress_doc, text_sections)
 
         elif self.book_header.compression_type == b'\x00\x01':
-            unpack = lambda x: x  # noqa
+            pass
         else:
             raise MobiError('Unknown compression algorithm: %r' %
                             self.book_header.compression_type)
-        self.mobi_html = b''.join(map(unpack, text_sections))
+        self.mobi_html = b''.join(text_sections)
         if self.mobi_html.endswith(b'#'):
             self.mobi_html = self.mobi_html[:-1]
 
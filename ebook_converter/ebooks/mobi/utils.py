@@ -575,6 +575,20 @@ def create_text_record(text):
     return data, overlap
 
 
+def split_text_records(text):
+    '''
+    Split the text (a byte string) into uncompressed Palmdoc records of size
+    RECORD_SIZE. Returns a list of (data, overlap) tuples, as produced by
+    :func:`create_text_record`.
+    '''
+    text_length = len(text)
+    text = BytesIO(text)
+    records = []
+    while text.tell() < text_length:
+        records.append(create_text_record(text))
+    return records
+
+
 class CNCX(object):  # {{{
 
     '''
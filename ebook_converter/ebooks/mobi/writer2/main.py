@@ -1,4 +1,5 @@
-import io, random, time
+import io, os, random, time
+from concurrent.futures import ProcessPoolExecutor
 from struct import pack
 
 from ebook_converter.ebooks import normalize
@@ -8,13 +9,16 @@ from ebook_converter.ebooks.mobi.langcodes import iana2mobi
 from ebook_converter.utils.filenames import ascii_filename
 from ebook_converter.ebooks.mobi.writer2 import (PALMDOC, UNCOMPRESSED)
 from ebook_converter.ebooks.mobi.utils import (encint, encode_trailing_data,
-        align_block, detect_periodical, RECORD_SIZE, create_text_record)
+        align_block, detect_periodical, RECORD_SIZE, split_text_records)
 from ebook_converter.ebooks.mobi.writer2.indexer import Indexer
 
 
 # Disabled as I dont care about uncrossable breaks
 WRITE_UNCROSSABLE_BREAKS = False
 NULL_INDEX = 0xffffffff
+# Books with fewer text records than this are compressed serially, as
+# starting worker processes would cost more than it saves
+MIN_PARALLEL_RECORDS = 64
 
 FLIS = (b'FLIS\0\0\0\x08\0\x41\0\0\0\0\0\0\xff\xff\xff\xff\0\x01\0\x03\0\0\0\x03\0\0\0\x01'+
             b'\xff'*4)
@@ -36,6 +40,7 @@ class MobiWriter(object):
         self.for_joint = kf8 is not None
         self.write_page_breaks_after_item = write_page_breaks_after_item
         self.compression = UNCOMPRESSED if opts.dont_compress else PALMDOC
+        self.compression_workers = opts.mobi_compression_workers
         self.prefer_author_sort = opts.prefer_author_sort
         self.last_text_record_idx = 1
 
@@ -153,18 +158,19 @@ class MobiWriter(object):
                 write_page_breaks_after_item=self.write_page_breaks_after_item)
         text = self.serializer()
         self.text_length = len(text)
-        text = io.BytesIO(text)
+        text_records = split_text_records(text)
+        del text
         nrecords = 0
         records_size = 0
 
         if self.compression != UNCOMPRESSED:
             self.oeb.logger.info('  Compressing markup content...')
+            compressed = self.compress_text_records(
+                [data for data, overlap in text_records])
+        else:
+            compressed = [data for data, overlap in text_records]
 
-        while text.tell() < self.text_length:
-            data, overlap = create_text_record(text)
-            if self.compression == PALMDOC:
-                data = compress_doc(data)
-
+        for data, (_, overlap) in zip(compressed, text_records):
             data += overlap
             data += pack(b'>B', len(overlap))
 
@@ -180,6 +186,22 @@ class MobiWriter(object):
             self.first_non_text_record_idx += 1
     # }}}
 
+    def compress_text_records(self, records):
+        '''
+        Palmdoc compress the text records. Records are independent of each
+        other, so for large books they are compressed in a pool of worker
+        processes. The order of the returned records is always the order of
+        the input.
+        '''
+        workers = self.compression_workers or os.cpu_count() or 1
+        if workers < 2 or len(records) < MIN_PARALLEL_RECORDS:
+            return [compress_doc(data) for data in records]
+        self.oeb.logger.debug('  Using %d processes for compression', workers)
+        chunksize = max(1, len(records) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(compress_doc, records,
+                                     chunksize=chunksize))
+
     def generate_record0(self):  # MOBI header {{{
         metadata = self.oeb.metadata
         bt = 0x002
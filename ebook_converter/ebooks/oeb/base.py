@@ -11,6 +11,7 @@ import os
 import re
 import string
 import sys
+import threading
 import urllib.parse
 
 from lxml import etree
@@ -565,6 +566,92 @@ class DirContainer(object):
         return names
 
 
+def zip_member_name(name):
+    """
+    Normalize the name of a ZIP archive member to the path, relative to the
+    extraction directory, that ZipFile.extract() would write it to.
+    """
+    name = os.path.splitdrive(name.replace(os.sep, '/'))[1]
+    return '/'.join(x for x in name.split('/')
+                    if x not in {'', os.path.curdir, os.path.pardir})
+
+
+class ZipContainer(DirContainer):
+    """
+    Filesystem directory container backed by a ZIP archive.
+
+    Files present in the directory, because they were extracted or written
+    there by the input plugin, take precedence. All other members are only
+    decompressed from the archive when they are actually read, so resources
+    that end up unused are never extracted.
+
+    :param:`archive` is an open ZipFile and :param:`root` the directory the
+    archive would have been extracted into.
+    """
+
+    def __init__(self, path, log, archive, root, ignore_opf=False):
+        self.archive = archive
+        self.root = root
+        self.lock = threading.Lock()
+        self.members = {}
+        for info in archive.infolist():
+            if not info.filename.endswith('/'):
+                name = zip_member_name(info.filename)
+                if name:
+                    self.members.setdefault(name, info)
+        super(ZipContainer, self).__init__(path, log, ignore_opf=ignore_opf)
+
+    def member(self, path):
+        """
+        Return the archive member for :param:`path` if it has not been
+        extracted, None otherwise.
+        """
+        if not path:
+            return None
+        try:
+            path = os.path.join(self.rootdir, urllib.parse.unquote(path))
+        except ValueError:
+            return None
+        if os.path.isfile(path):
+            return None
+        name = os.path.relpath(path, self.root).replace(os.sep, '/')
+        return self.members.get(name)
+
+    def read(self, path):
+        if path is None:
+            path = self.opfname
+        info = self.member(path)
+        if info is None:
+            return super(ZipContainer, self).read(path)
+        # The archive has a single file pointer
+        with self.lock:
+            return self.archive.read(info)
+
+    def exists(self, path):
+        return (super(ZipContainer, self).exists(path) or
+                self.member(path) is not None)
+
+    def namelist(self):
+        names = super(ZipContainer, self).namelist()
+        seen = set(names)
+        for name in self.members:
+            name = os.path.join(self.root, name).replace('\\', '/')
+            if name not in seen:
+                names.append(name)
+        return names
+
+    def close(self):
+        """
+        Close the archive, and the file or memory map it reads from, which
+        the archive leaves open when it was given one.
+        """
+        with self.lock:
+            fp = self.archive.fp
+            self.archive.close()
+            if fp is not None:
+                fp.close()
+
+
 class Metadata(object):
     """A collection of OEB data model metadata.
 
@@ -1011,10 +1098,14 @@ class Manifest(object):
 
         @data.setter
         def data(self, value):
+            if self._data is not None:
+                self.oeb.stylesheet_changed(self._data)
             self._data = value
 
         @data.deleter
         def data(self):
+            if self._data is not None:
+                self.oeb.stylesheet_changed(self._data)
             self._data = None
 
         def unload_data_from_memory(self, memory=None):
@@ -1147,6 +1238,8 @@ class Manifest(object):
         if item.href in self.hrefs:
             del self.hrefs[item.href]
         self.items.remove(item)
+        if item._data is not None:
+            self.oeb.stylesheet_changed(item._data)
         if item in self.oeb.spine:
             self.oeb.spine.remove(item)
 
@@ -1783,12 +1876,25 @@ class OEBBook(object):
         self.auto_generated_toc = True
         self._temp_files = []
 
+    def stylesheet_changed(self, stylesheet):
+        """
+        Forget what the Stylizers computed from :param:`stylesheet`, which
+        was changed in place, replaced or removed from the book.
+        """
+        cache = getattr(self, 'stylesheet_cache', None)
+        if cache is not None:
+            cache.invalidate(stylesheet)
+
     def clean_temp_files(self):
         for path in self._temp_files:
             try:
                 os.remove(path)
             except Exception:
                 pass
+        # Containers reading from an archive keep it open
+        close = getattr(self.container, 'close', None)
+        if close is not None:
+            close()
 
     @classmethod
     def generate(cls, opts):
@@ -0,0 +1,128 @@
+"""
+Run the per item part of transforms in worker processes.
+
+Transforms which process every item of the spine on its own can hand that
+work to :class:`ItemWorkers`. The workers are forked from the conversion
+process, so they start with a copy of the whole book and nothing has to be
+sent to them. Each worker owns a fixed share of the items and keeps the
+state it builds for them from one call to the next. The results come back
+in the order of the items, so that the transform can merge the global parts
+(collected CSS, class names, ...) exactly as a serial run would.
+"""
+import multiprocessing
+import os
+import traceback
+
+
+# Below this many items the cost of forking is not worth it
+MIN_PARALLEL_ITEMS = 32
+
+
+class WorkerError(Exception):
+    """Raised in the conversion process when the work failed in a worker."""
+
+
+def worker_count(items, workers=None):
+    """
+    Number of processes to use for items, 1 meaning that the work should be
+    done in the conversion process. workers is the number requested, 0 or
+    None for one per CPU core.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(items) < MIN_PARALLEL_ITEMS or \
+            'fork' not in multiprocessing.get_all_start_methods():
+        return 1
+    return min(workers, len(items))
+
+
+def serve(conn, handler, items, indexes):
+    # Runs in the worker, answer calls until told to stop
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            name, args = msg
+            func = getattr(handler, name)
+            try:
+                ans = True, [func(items[i], *args) for i in indexes]
+            except Exception:
+                ans = False, traceback.format_exc()
+            conn.send(ans)
+    finally:
+        conn.close()
+
+
+class ItemWorkers(object):
+    """
+    A set of forked processes, each owning every n-th item. Calling
+    :meth:`call` runs a method of handler on every item, in the worker
+    owning it. Use as a context manager.
+    """
+
+    def __init__(self, handler, items, workers):
+        self.handler = handler
+        self.items = list(items)
+        self.workers = workers
+        self.shares = [range(i, len(self.items), workers)
+                       for i in range(workers)]
+        self.processes = []
+        self.conns = []
+
+    def __enter__(self):
+        ctx = multiprocessing.get_context('fork')
+        try:
+            for indexes in self.shares:
+                conn, child_conn = ctx.Pipe()
+                p = ctx.Process(target=serve, args=(
+                    child_conn, self.handler, self.items, indexes),
+                    daemon=True)
+                p.start()
+                child_conn.close()
+                self.processes.append(p)
+                self.conns.append(conn)
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def call(self, name, *args):
+        """
+        Call handler.name(item, *args) for every item and return the
+        results, in the order of the items.
+        """
+        for conn in self.conns:
+            conn.send((name, args))
+        ans = [None] * len(self.items)
+        errors = []
+        for conn, indexes in zip(self.conns, self.shares):
+            try:
+                ok, result = conn.recv()
+            except EOFError:
+                ok, result = False, 'Worker process died'
+            if not ok:
+                errors.append(result)
+                continue
+            for i, x in zip(indexes, result):
+                ans[i] = x
+        if errors:
+            raise WorkerError('Failed to %s in worker process:\n%s' % (
+                name, errors[0]))
+        return ans
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for p in self.processes:
+            p.join(5)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        self.conns, self.processes = [], []
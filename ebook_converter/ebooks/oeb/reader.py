@@ -165,6 +165,11 @@ class OEBReader(object):
         '''
         bad = []
         check = base.OEB_DOCS.union(base.OEB_STYLES)
+        prefetch = getattr(self.oeb.html_preprocessor, 'prefetch', None)
+        if prefetch is not None:
+            prefetch([item for item in self.oeb.manifest.values()
+                      if item.media_type in base.OEB_DOCS and
+                      isinstance(item._data, (type(None), str, bytes))])
         for item in list(self.oeb.manifest.values()):
             if item.media_type in check:
                 try:
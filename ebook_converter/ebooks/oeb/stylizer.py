@@ -1,8 +1,9 @@
 """
 CSS property propagation class.
 """
-import os, re, logging, copy, unicodedata, numbers
+import os, re, logging, copy, unicodedata, numbers, hashlib
 import pkg_resources
+from collections import defaultdict, OrderedDict
 from operator import itemgetter
 from weakref import WeakKeyDictionary
 from xml.dom import SyntaxErr as CSSSyntaxError
@@ -15,7 +16,8 @@ from ebook_converter import constants as const
 from ebook_converter.ebooks import unit_convert
 from ebook_converter.ebooks.oeb import base
 from ebook_converter.ebooks.oeb.normalize_css import DEFAULTS, normalizers
-from ebook_converter.css_selectors import Select, SelectorError, INAPPROPRIATE_PSEUDO_CLASSES
+from ebook_converter.css_selectors import Select, SelectorError, INAPPROPRIATE_PSEUDO_CLASSES, parse as parse_selector
+from ebook_converter.css_selectors.parser import CombinedSelector, Element, Hash, Class, Pseudo, ascii_lower
 from ebook_converter.tinycss.media3 import CSSMedia3Parser
 from ebook_converter.utils import encoding as uenc
 
@@ -94,48 +96,265 @@ def test_media_ok():
     assert not media_ok('screen and (device-width:10px)')
 
 
+def rightmost_key(parsed_selector):
+    """
+    Return the most selective (kind, name) key of the rightmost compound
+    selector, that is, of the element the selector actually matches, or None
+    if the selector can match any element. Kind is one of 'id', 'class' or
+    'tag', preferred in that order.
+    """
+    tree = parsed_selector.parsed_tree
+    while isinstance(tree, CombinedSelector):
+        tree = tree.subselector
+    id_ = cls = tag = None
+    while tree is not None:
+        if isinstance(tree, Hash):
+            id_ = tree.id
+        elif isinstance(tree, Class):
+            cls = tree.class_name
+        elif isinstance(tree, Pseudo) and tree.ident == 'root':
+            # :root matches the root element whatever the rest of the
+            # compound selector says
+            return None
+        elif isinstance(tree, Element):
+            if tree.element and tree.element != '*':
+                tag = tree.element
+            break
+        tree = getattr(tree, 'selector', None)
+    if id_:
+        return 'id', ascii_lower(id_)
+    if cls:
+        return 'class', ascii_lower(cls)
+    if tag:
+        return 'tag', ascii_lower(tag)
+    return None
+
+
+class RuleIndex(object):
+    """
+    Index of style rules by the id, class or tag name their selectors
+    require on the matched element. Selectors are parsed once, and a rule is
+    only evaluated against a tree that contains its key, so that documents
+    are not matched against every rule of a large stylesheet.
+    """
+
+    def __init__(self, rules, parsed_selectors=None):
+        self.parsed = []
+        self.universal = []
+        self.keyed = {'id': defaultdict(list), 'class': defaultdict(list),
+                      'tag': defaultdict(list)}
+        if parsed_selectors is None:
+            parsed_selectors = {}
+        for i, rule in enumerate(rules):
+            text = rule[3]
+            parsed = parsed_selectors.get(text)
+            if parsed is None:
+                try:
+                    parsed = parse_selector(text)
+                except SelectorError as err:
+                    parsed = err
+                parsed_selectors[text] = parsed
+            if isinstance(parsed, SelectorError):
+                # Reported when the rule is evaluated, like before
+                self.parsed.append(parsed)
+                self.universal.append(i)
+                continue
+            self.parsed.append(parsed)
+            keys = {rightmost_key(x) for x in parsed}
+            if None in keys or not keys:
+                self.universal.append(i)
+            else:
+                for kind, name in keys:
+                    self.keyed[kind][name].append(i)
+
+    def candidates(self, select):
+        """
+        Indices of the rules that can match an element in the tree of
+        `select`, in their original (specificity) order.
+        """
+        ans = set(self.universal)
+        for kind, elem_map in (('id', select.id_map),
+                               ('class', select.class_map),
+                               ('tag', select.element_map)):
+            index = self.keyed[kind]
+            if len(index) < len(elem_map):
+                names = (n for n in index if elem_map.get(n))
+            else:
+                names = (n for n, elems in elem_map.items()
+                         if elems and n in index)
+            for name in names:
+                ans.update(index[name])
+        return sorted(ans)
+
+    def matches(self, select, i):
+        """
+        The elements matched by rule `i`, in document order. Raises
+        SelectorError for invalid selectors.
+        """
+        parsed = self.parsed[i]
+        if isinstance(parsed, SelectorError):
+            raise parsed
+        seen = set()
+        ans = []
+        for parsed_selector in parsed:
+            for item in select.iterparsedselector(parsed_selector):
+                if item not in seen:
+                    seen.add(item)
+                    ans.append(item)
+        return tuple(ans)
+
+
+class CompiledStylesheet(object):
+    """
+    The flattened rules of a single stylesheet. Rule positions are relative
+    to the start of the stylesheet, so that it can be reused wherever the
+    stylesheet appears in the cascade.
+    """
+
+    def __init__(self, href):
+        self.href = href
+        self.rules = []
+        self.page_rule = {}
+        self.font_face_rules = []
+        self.count = 0
+
+
+class StylesheetCache(object):
+    """
+    Per book cache of parsed and flattened stylesheets, shared by all the
+    Stylizers created for the book. Each distinct stylesheet is parsed and
+    flattened once, instead of once per transform and document.
+
+    Flattened stylesheets are kept by identity, serializing a stylesheet to
+    compare contents costs as much as flattening it. Code that changes a
+    stylesheet of the manifest in place, or replaces or removes it, must
+    call :meth:`OEBBook.stylesheet_changed`, which calls :meth:`invalidate`.
+    """
+
+    # Number of combined rule sets (one per distinct list of stylesheets)
+    # to keep. The expensive per stylesheet work is always kept.
+    MAX_RULE_SETS = 16
+
+    def __init__(self):
+        self.parsed = {}
+        self.compiled = {}
+        self.selectors = {}
+        self.rule_sets = OrderedDict()
+
+    def parse(self, text, key, parse):
+        """
+        Return the stylesheet created by parse(text), cached by the content
+        hash of text and key, which must identify everything else the result
+        depends on.
+        """
+        key = (hashlib.sha1(text.encode('utf-8')).digest(), key)
+        stylesheet = self.parsed.get(key)
+        if stylesheet is None:
+            stylesheet = self.parsed[key] = parse(text)
+        return stylesheet
+
+    def compile(self, stylesheet, rules):
+        # Keep references to the key objects, so that their ids cannot be
+        # reused by other objects
+        sheet_entry = self.compiled.get(id(stylesheet))
+        if sheet_entry is None or sheet_entry[0] is not stylesheet:
+            sheet_entry = self.compiled[id(stylesheet)] = (stylesheet, {})
+        key = (id(rules.opts), id(rules.profile))
+        entry = sheet_entry[1].get(key)
+        if entry is None or entry[0] is not rules.opts or \
+                entry[1] is not rules.profile:
+            entry = sheet_entry[1][key] = (
+                rules.opts, rules.profile,
+                rules.compile_stylesheet(stylesheet))
+        return entry[2]
+
+    def invalidate(self, stylesheet):
+        """
+        Forget the flattened rules of stylesheet, and the rule sets using
+        it, as it was changed or is no longer used.
+        """
+        sheet_entry = self.compiled.pop(id(stylesheet), None)
+        if sheet_entry is None:
+            return
+        if sheet_entry[0] is not stylesheet:
+            self.compiled[id(stylesheet)] = sheet_entry
+            return
+        for key, rules in list(self.rule_sets.items()):
+            if any(x is stylesheet for x in rules.stylesheets):
+                del self.rule_sets[key]
+
+    def rules(self, opts, profile, stylesheets):
+        key = (id(opts), id(profile)) + tuple(map(id, stylesheets))
+        rules = self.rule_sets.get(key)
+        if rules is None or not rules.same_rules(opts, profile, stylesheets):
+            rules = self.rule_sets[key] = StylizerRules(opts, profile,
+                                                        stylesheets,
+                                                        cache=self)
+        self.rule_sets.move_to_end(key)
+        while len(self.rule_sets) > self.MAX_RULE_SETS:
+            self.rule_sets.popitem(last=False)
+        return rules
+
+
 class StylizerRules(object):
 
-    def __init__(self, opts, profile, stylesheets):
+    def __init__(self, opts, profile, stylesheets, cache=None):
         self.opts, self.profile, self.stylesheets = opts, profile, stylesheets
+        self.cache = cache
+        self._index = None
 
         index = 0
         self.rules = []
         self.page_rule = {}
         self.font_face_rules = []
         for sheet_index, stylesheet in enumerate(stylesheets):
-            href = stylesheet.href
-            for rule in stylesheet.cssRules:
-                if rule.type == rule.MEDIA_RULE:
-                    if media_ok(rule.media.mediaText):
-                        for subrule in rule.cssRules:
-                            self.rules.extend(self.flatten_rule(subrule, href, index, is_user_agent_sheet=sheet_index==0))
-                            index += 1
-                else:
-                    self.rules.extend(self.flatten_rule(rule, href, index, is_user_agent_sheet=sheet_index==0))
-                    index = index + 1
+            if cache is None:
+                compiled = self.compile_stylesheet(stylesheet)
+            else:
+                compiled = cache.compile(stylesheet, self)
+            # The user agent stylesheet comes first and loses against all
+            # the others
+            origin = 0 if sheet_index == 0 else 1
+            for specificity, pos, selector, style, text in compiled.rules:
+                specificity = (origin,) + specificity + (index + pos,)
+                self.rules.append((specificity, selector, style, text,
+                                   compiled.href))
+            index += compiled.count
+            self.page_rule.update(compiled.page_rule)
+            self.font_face_rules.extend(compiled.font_face_rules)
         self.rules.sort(key=itemgetter(0))  # sort by specificity
 
-    def flatten_rule(self, rule, href, index, is_user_agent_sheet=False):
-        results = []
-        sheet_index = 0 if is_user_agent_sheet else 1
+    def compile_stylesheet(self, stylesheet):
+        compiled = CompiledStylesheet(stylesheet.href)
+        index = 0
+        for rule in stylesheet.cssRules:
+            if rule.type == rule.MEDIA_RULE:
+                if media_ok(rule.media.mediaText):
+                    for subrule in rule.cssRules:
+                        self.flatten_rule(compiled, subrule, index)
+                        index += 1
+            else:
+                self.flatten_rule(compiled, rule, index)
+                index = index + 1
+        compiled.count = index
+        return compiled
+
+    def flatten_rule(self, compiled, rule, index):
         if isinstance(rule, CSSStyleRule):
             style = self.flatten_style(rule.style)
             for selector in rule.selectorList:
-                specificity = (sheet_index,) + selector.specificity + (index,)
                 text = selector.selectorText
-                selector = list(selector.seq)
-                results.append((specificity, selector, style, text, href))
+                compiled.rules.append((selector.specificity, index,
+                                       list(selector.seq), style, text))
         elif isinstance(rule, CSSPageRule):
             style = self.flatten_style(rule.style)
-            self.page_rule.update(style)
+            compiled.page_rule.update(style)
         elif isinstance(rule, CSSFontFaceRule):
             if rule.style.length > 1:
                 # Ignore the meaningless font face rules generated by the
                 # benighted MS Word that contain only a font-family declaration
                 # and nothing else
-                self.font_face_rules.append(rule)
-        return results
+                compiled.font_face_rules.append(rule)
 
     def flatten_style(self, cssstyle):
         style = {}
@@ -166,6 +385,15 @@ class StylizerRules(object):
             text = self.opts.change_justification
         return text
 
+    @property
+    def index(self):
+        # Built on first use, then shared by all documents using the same
+        # set of stylesheets
+        if self._index is None:
+            self._index = RuleIndex(self.rules, None if self.cache is None
+                                    else self.cache.selectors)
+        return self._index
+
     def same_rules(self, opts, profile, stylesheets):
         if self.opts != opts:
             # it's unlikely to happen, but better safe than sorry
@@ -204,9 +432,14 @@ class Stylizer(object):
         item = oeb.manifest.hrefs[path]
         basename = os.path.basename(path)
         cssname = os.path.splitext(basename)[0] + '.css'
+        cache = getattr(oeb, 'stylesheet_cache', None)
+        if cache is None:
+            cache = oeb.stylesheet_cache = StylesheetCache()
         stylesheets = [html_css_stylesheet()]
         if base_css:
-            stylesheets.append(parseString(base_css, validate=False))
+            stylesheets.append(cache.parse(
+                base_css, 'base_css',
+                lambda text: parseString(text, validate=False)))
         style_tags = base.xpath(tree, '//*[local-name()="style" or local-name()="link"]')
 
         # Add css_parser parsing profiles from output_profile
@@ -228,12 +461,21 @@ class Stylizer(object):
                     if t:
                         text += '\n\n' + uenc.force_unicode(t, 'utf-8')
                 if text:
-                    text = oeb.css_preprocessor(text)
-                    # We handle @import rules separately
-                    parser.setFetcher(lambda x: ('utf-8', b''))
-                    stylesheet = parser.parseString(text, href=cssname,
-                            validate=False)
-                    parser.setFetcher(self._fetch_css_file)
+                    def parse_style(text):
+                        text = oeb.css_preprocessor(text)
+                        # We handle @import rules separately
+                        parser.setFetcher(lambda x: ('utf-8', b''))
+                        stylesheet = parser.parseString(text, href=cssname,
+                                validate=False)
+                        parser.setFetcher(self._fetch_css_file)
+                        # Make links to resources absolute, since these rules
+                        # will be folded into a stylesheet at the root
+                        replaceUrls(stylesheet, item.abshref,
+                                ignoreImportRules=True)
+                        return stylesheet
+                    # Relative URLs are resolved against the document, so
+                    # the parsed sheet is specific to it
+                    stylesheet = cache.parse(text, item.href, parse_style)
                     for rule in stylesheet.cssRules:
                         if rule.type == rule.IMPORT_RULE:
                             ihref = item.abshref(rule.href)
@@ -251,10 +493,6 @@ class Stylizer(object):
                                                     'file %r', rule.href)
                                 continue
                             stylesheets.append(sitem.data)
-                    # Make links to resources absolute, since these rules will
-                    # be folded into a stylesheet at the root
-                    replaceUrls(stylesheet, item.abshref,
-                            ignoreImportRules=True)
                     stylesheets.append(stylesheet)
             elif (elem.tag == base.tag('xhtml', 'link') and elem.get('href') and elem.get(
                     'rel', 'stylesheet').lower() == 'stylesheet' and elem.get(
@@ -276,19 +514,18 @@ class Stylizer(object):
         for w, x in csses.items():
             if x:
                 try:
-                    text = x
-                    stylesheet = parser.parseString(text, href=cssname,
-                            validate=False)
+                    stylesheet = cache.parse(x, w, lambda text:
+                            parser.parseString(text, href=cssname,
+                                               validate=False))
                     stylesheets.append(stylesheet)
                 except Exception:
                     self.logger.exception('Failed to parse %s, ignoring.', w)
                     self.logger.debug('Bad css: %s', x)
 
-        # using oeb to store the rules, page rule and font face rules
-        # and generating them again if opts, profile or stylesheets are different
-        if (not hasattr(self.oeb, 'stylizer_rules')) \
-            or not self.oeb.stylizer_rules.same_rules(self.opts, self.profile, stylesheets):
-            self.oeb.stylizer_rules = StylizerRules(self.opts, self.profile, stylesheets)
+        # using oeb to cache the rules, page rule and font face rules, they
+        # are only generated again if opts, profile or stylesheets differ
+        self.oeb.stylizer_rules = cache.rules(self.opts, self.profile,
+                                              stylesheets)
         self.rules = self.oeb.stylizer_rules.rules
         self.page_rule = self.oeb.stylizer_rules.page_rule
         self.font_face_rules = self.oeb.stylizer_rules.font_face_rules
@@ -298,10 +535,13 @@ class Stylizer(object):
         pseudo_pat = re.compile(':{1,2}(%s)' % ('|'.join(INAPPROPRIATE_PSEUDO_CLASSES)), re.I)
         select = Select(tree, ignore_inappropriate_pseudo_classes=True)
 
-        for _, _, cssdict, text, _ in self.rules:
+        rule_index = self.oeb.stylizer_rules.index
+
+        for i in rule_index.candidates(select):
+            _, _, cssdict, text, _ = self.rules[i]
             fl = pseudo_pat.search(text)
             try:
-                matches = tuple(select(text))
+                matches = rule_index.matches(select, i)
             except SelectorError as err:
                 self.logger.error('Ignoring CSS rule with invalid selector: '
                                   '%r (%s)', text, err)
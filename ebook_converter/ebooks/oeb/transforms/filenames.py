@@ -29,6 +29,7 @@ class RenameFiles(object):  # {{{
                 rewrite_links(self.current_item.data, self.url_replacer)
             elif hasattr(item.data, 'cssText'):
                 css_parser.replaceUrls(item.data, self.url_replacer)
+                oeb.stylesheet_changed(item.data)
 
         if self.oeb.guide:
             for ref in self.oeb.guide.values():
@@ -16,10 +16,12 @@ from css_parser import css as cp_css
 from ebook_converter import constants as const
 from ebook_converter.ebooks import unit_convert
 from ebook_converter.ebooks.oeb import base
+from ebook_converter.ebooks.oeb import parallel
 from ebook_converter.ebooks.oeb import parse_utils
 
 from ebook_converter.ebooks.oeb.stylizer import Stylizer
 from ebook_converter.utils.filenames import ascii_filename, ascii_text
+from ebook_converter.utils.xml_parse import safe_xml_fromstring
 
 
 COLLAPSE = re.compile(r'[ \t\r\n\v]+')
@@ -131,6 +133,65 @@ class EmbedFontsCSSRules(object):
         return self.href
 
 
+class ClassNames(object):
+    '''
+    Name the classes of the flattened styles. Identical styles share a
+    class, names are given in the order the styles are first seen.
+    '''
+
+    def __init__(self):
+        self.names = collections.defaultdict(int)
+        self.styles = {}
+        self.pseudo_styles = collections.defaultdict(dict)
+
+    def assign(self, node, klass, css, pseudo):
+        '''
+        Set the class of node. css is its style, named after klass, or None
+        and pseudo a list of (pseudo class, style) pairs.
+        '''
+        keep_classes = set()
+        if css is not None:
+            if css in self.styles:
+                match = self.styles[css]
+            else:
+                match = klass + str(self.names[klass] or '')
+                self.styles[css] = match
+                self.names[klass] += 1
+            node.attrib['class'] = match
+            keep_classes.add(match)
+
+        for psel, css in pseudo:
+            pstyles = self.pseudo_styles[psel]
+            if css in pstyles:
+                match = pstyles[css]
+            else:
+                # We have to use a different class for each psel as
+                # otherwise you can have incorrect styles for a situation
+                # like: a:hover { color: red } a:link { color: blue } a.x:hover { color: green }
+                # If the pcalibre class for a:hover and a:link is the same,
+                # then the class attribute for a.x tags will contain both
+                # that class and the class for a.x:hover, which is wrong.
+                klass = 'pcalibre'
+                match = klass + str(self.names[klass] or '')
+                pstyles[css] = match
+                self.names[klass] += 1
+            keep_classes.add(match)
+            node.attrib['class'] = ' '.join(keep_classes)
+
+
+class ClassRecorder(object):
+    '''
+    Stands in for :class:`ClassNames` in worker processes, the names depend
+    on all the items before, so they are given in the conversion process.
+    '''
+
+    def __init__(self):
+        self.requests = []
+
+    def assign(self, node, klass, css, pseudo):
+        self.requests.append((node, klass, css, pseudo))
+
+
 class CSSFlattener(object):
 
     def __init__(self, fbase=None, fkey=None, lineh=None, unfloat=False,
@@ -191,6 +252,7 @@ class CSSFlattener(object):
             if item.media_type in base.OEB_STYLES:
                 css_parser.replaceUrls(item.data, item.abshref,
                         ignoreImportRules=True)
+                self.oeb.stylesheet_changed(item.data)
 
         self.body_font_family, self.embed_font_rules = self.get_embed_font_info(
                 self.opts.embed_font_family)
@@ -198,10 +260,20 @@ class CSSFlattener(object):
         # like the AZW3 output inline ToC.
         self.oeb.store_embed_font_rules = EmbedFontsCSSRules(self.body_font_family,
                 self.embed_font_rules)
-        self.stylize_spine()
-        self.sbase = self.baseline_spine() if self.fbase else None
-        self.fmap = FontMapper(self.sbase, self.fbase, self.fkey)
-        self.flatten_spine()
+        self.stylizers = {}
+        self.page_styles = {}
+        workers = parallel.worker_count(
+            self.items, getattr(self.opts, 'transform_workers', 0))
+        if workers > 1:
+            names = self.flatten_in_workers(workers)
+        else:
+            self.stylize_spine()
+            self.sbase = self.baseline_spine() if self.fbase else None
+            self.fmap = FontMapper(self.sbase, self.fbase, self.fkey)
+            names = ClassNames()
+            for item in self.items:
+                self.flatten_item(item, names)
+        self.flatten_spine(names)
         if epub3_nav is not None:
             self.opts.epub3_nav_parsed = epub3_nav.data
 
@@ -209,14 +281,15 @@ class CSSFlattener(object):
 
     def store_page_margins(self):
         self.opts._stored_page_margins = {}
-        for item, stylizer in self.stylizers.items():
+        profile = self.context.source
+        for item, (page_rule, _, body_font_size) in self.page_styles.items():
             margins = self.opts._stored_page_margins[item.href] = {}
-            for prop, val in stylizer.page_rule.items():
+            for prop, val in page_rule.items():
                 p, w = prop.partition('-')[::2]
                 if p == 'margin':
                     margins[w] = unit_convert(
-                            val, stylizer.profile.width_pts, stylizer.body_font_size,
-                            stylizer.profile.dpi, body_font_size=stylizer.body_font_size)
+                            val, profile.width_pts, body_font_size,
+                            profile.dpi, body_font_size=body_font_size)
 
     def get_embed_font_info(self, family, failure_critical=True):
         efi = []
@@ -270,37 +343,39 @@ class CSSFlattener(object):
         return body_font_family, efi
 
     def stylize_spine(self):
-        self.stylizers = {}
+        for item in self.items:
+            self.stylize_item(item)
+
+    def stylize_item(self, item):
         profile = self.context.source
         css = ''
-        for item in self.items:
-            html = item.data
-            body = html.find(base.tag('xhtml', 'body'))
-            if 'style' in html.attrib:
-                b = body.attrib.get('style', '')
-                body.set('style',  html.get('style') + ';' + b)
-                del html.attrib['style']
-            bs = body.get('style', '').split(';')
-            bs.append('margin-top: 0pt')
-            bs.append('margin-bottom: 0pt')
-            if float(self.context.margin_left) >= 0:
-                bs.append('margin-left : %gpt'%
-                        float(self.context.margin_left))
-            if float(self.context.margin_right) >= 0:
-                bs.append('margin-right : %gpt'%
-                        float(self.context.margin_right))
-            bs.extend(['padding-left: 0pt', 'padding-right: 0pt'])
-            if self.page_break_on_body:
-                bs.extend(['page-break-before: always'])
-            if self.context.change_justification != 'original':
-                bs.append('text-align: '+ self.context.change_justification)
-            if self.body_font_family:
-                bs.append('font-family: '+self.body_font_family)
-            body.set('style', '; '.join(bs))
-            stylizer = Stylizer(html, item.href, self.oeb, self.context, profile,
-                    user_css=self.context.extra_css,
-                    extra_css=css)
-            self.stylizers[item] = stylizer
+        html = item.data
+        body = html.find(base.tag('xhtml', 'body'))
+        if 'style' in html.attrib:
+            b = body.attrib.get('style', '')
+            body.set('style',  html.get('style') + ';' + b)
+            del html.attrib['style']
+        bs = body.get('style', '').split(';')
+        bs.append('margin-top: 0pt')
+        bs.append('margin-bottom: 0pt')
+        if float(self.context.margin_left) >= 0:
+            bs.append('margin-left : %gpt'%
+                    float(self.context.margin_left))
+        if float(self.context.margin_right) >= 0:
+            bs.append('margin-right : %gpt'%
+                    float(self.context.margin_right))
+        bs.extend(['padding-left: 0pt', 'padding-right: 0pt'])
+        if self.page_break_on_body:
+            bs.extend(['page-break-before: always'])
+        if self.context.change_justification != 'original':
+            bs.append('text-align: '+ self.context.change_justification)
+        if self.body_font_family:
+            bs.append('font-family: '+self.body_font_family)
+        body.set('style', '; '.join(bs))
+        stylizer = Stylizer(html, item.href, self.oeb, self.context, profile,
+                user_css=self.context.extra_css,
+                extra_css=css)
+        self.stylizers[item] = stylizer
 
     def baseline_node(self, node, stylizer, sizes, csize):
         csize = stylizer.style(node)['font-size']
@@ -314,11 +389,18 @@ class CSSFlattener(object):
     def baseline_spine(self):
         sizes = collections.defaultdict(float)
         for item in self.items:
-            html = item.data
-            stylizer = self.stylizers[item]
-            body = html.find(base.tag('xhtml', 'body'))
-            fsize = self.context.source.fbase
-            self.baseline_node(body, stylizer, sizes, fsize)
+            self.baseline_item(item, sizes)
+        return self.source_base_size(sizes)
+
+    def baseline_item(self, item, sizes):
+        html = item.data
+        stylizer = self.stylizers[item]
+        body = html.find(base.tag('xhtml', 'body'))
+        fsize = self.context.source.fbase
+        self.baseline_node(body, stylizer, sizes, fsize)
+
+    def source_base_size(self, sizes):
+        '''The font size used for most of the text.'''
         try:
             sbase = max(list(sizes.items()), key=operator.itemgetter(1))[0]
         except:
@@ -349,7 +431,7 @@ class CSSFlattener(object):
                         value = 0.0
                     cssdict[property] = "%0.5fem" % (value / fsize)
 
-    def flatten_node(self, node, stylizer, names, styles, pseudo_styles, psize, item_id, recurse=True):
+    def flatten_node(self, node, stylizer, names, psize, item_id, recurse=True):
         if not isinstance(node.tag, (str, bytes)) \
            or parse_utils.namespace(node.tag) != const.XHTML_NS:
             return
@@ -524,8 +606,7 @@ class CSSFlattener(object):
 
         pseudo_classes = style.pseudo_classes(self.filter_css)
         if cssdict or pseudo_classes:
-            keep_classes = set()
-
+            klass = css = None
             if cssdict:
                 items = sorted(cssdict.items())
                 css = ';\n'.join(u'%s: %s' % (key, val) for key, val in items)
@@ -535,34 +616,13 @@ class CSSFlattener(object):
                 # name with different case, both cases will apply, leading
                 # to incorrect results.
                 klass = ascii_text(STRIPNUM.sub('', classes_list[0])).lower().strip().replace(' ', '_')
-                if css in styles:
-                    match = styles[css]
-                else:
-                    match = klass + str(names[klass] or '')
-                    styles[css] = match
-                    names[klass] += 1
-                node.attrib['class'] = match
-                keep_classes.add(match)
 
+            pseudo = []
             for psel, cssdict in pseudo_classes.items():
                 items = sorted(cssdict.items())
-                css = ';\n'.join('%s: %s' % (key, val) for key, val in items)
-                pstyles = pseudo_styles[psel]
-                if css in pstyles:
-                    match = pstyles[css]
-                else:
-                    # We have to use a different class for each psel as
-                    # otherwise you can have incorrect styles for a situation
-                    # like: a:hover { color: red } a:link { color: blue } a.x:hover { color: green }
-                    # If the pcalibre class for a:hover and a:link is the same,
-                    # then the class attribute for a.x tags will contain both
-                    # that class and the class for a.x:hover, which is wrong.
-                    klass = 'pcalibre'
-                    match = klass + str(names[klass] or '')
-                    pstyles[css] = match
-                    names[klass] += 1
-                keep_classes.add(match)
-                node.attrib['class'] = ' '.join(keep_classes)
+                pseudo.append((psel, ';\n'.join('%s: %s' % (key, val)
+                                                for key, val in items)))
+            names.assign(node, klass, css, pseudo)
 
         elif 'class' in node.attrib:
             del node.attrib['class']
@@ -570,7 +630,7 @@ class CSSFlattener(object):
             del node.attrib['style']
         if recurse:
             for child in node:
-                self.flatten_node(child, stylizer, names, styles, pseudo_styles, psize, item_id)
+                self.flatten_node(child, stylizer, names, psize, item_id)
 
     def flatten_head(self, item, href, global_href):
         html = item.data
@@ -618,17 +678,17 @@ class CSSFlattener(object):
     def collect_global_css(self):
         global_css = collections.defaultdict(list)
         for item in self.items:
-            stylizer = self.stylizers[item]
+            page_rule, font_face_rules, _ = self.page_styles[item]
             if float(self.context.margin_top) >= 0:
-                stylizer.page_rule['margin-top'] = '%gpt'%\
+                page_rule['margin-top'] = '%gpt'%\
                         float(self.context.margin_top)
             if float(self.context.margin_bottom) >= 0:
-                stylizer.page_rule['margin-bottom'] = '%gpt'%\
+                page_rule['margin-bottom'] = '%gpt'%\
                         float(self.context.margin_bottom)
-            items = sorted(stylizer.page_rule.items())
+            items = sorted(page_rule.items())
             css = ';\n'.join("%s: %s" % (key, val) for key, val in items)
             css = ('@page {\n%s\n}\n'%css) if items else ''
-            rules = [base.css_text(r) for r in stylizer.font_face_rules + self.embed_font_rules]
+            rules = font_face_rules + [base.css_text(r) for r in self.embed_font_rules]
             raw = '\n\n'.join(rules)
             css += '\n\n' + raw
             global_css[css].append(item)
@@ -652,17 +712,69 @@ class CSSFlattener(object):
                 ans[item] = gc_map[css]
         return ans
 
-    def flatten_spine(self):
-        names = collections.defaultdict(int)
-        styles, pseudo_styles = {}, collections.defaultdict(dict)
-        for item in self.items:
-            html = item.data
-            stylizer = self.stylizers[item]
-            if self.specializer is not None:
-                self.specializer(item, stylizer)
-            fsize = self.context.dest.fbase
-            self.flatten_node(html, stylizer, names, styles, pseudo_styles, fsize, item.id, recurse=False)
-            self.flatten_node(html.find(base.tag('xhtml', 'body')), stylizer, names, styles, pseudo_styles, fsize, item.id)
+    def flatten_item(self, item, names):
+        html = item.data
+        stylizer = self.stylizers[item]
+        if self.specializer is not None:
+            self.specializer(item, stylizer)
+        fsize = self.context.dest.fbase
+        self.flatten_node(html, stylizer, names, fsize, item.id, recurse=False)
+        self.flatten_node(html.find(base.tag('xhtml', 'body')), stylizer, names, fsize, item.id)
+        self.page_styles[item] = (stylizer.page_rule,
+                                  [base.css_text(r) for r in stylizer.font_face_rules],
+                                  stylizer.body_font_size)
+
+    # Parallel flattening {{{
+
+    def flatten_in_workers(self, workers):
+        '''
+        Style and flatten the items in worker processes, in two passes as
+        the base font size depends on the text of all the items. The
+        flattened trees are sent back and their classes named here, in the
+        order of the items, so that the result is the same as when done in
+        this process.
+        '''
+        self.oeb.logger.debug('Using %d processes to flatten %d items',
+                              workers, len(self.items))
+        sizes = collections.defaultdict(float)
+        with parallel.ItemWorkers(self, self.items, workers) as pool:
+            for item_sizes in pool.call('stylize_in_worker'):
+                for size, count in item_sizes.items():
+                    sizes[size] += count
+            self.sbase = self.source_base_size(sizes) if self.fbase else None
+            self.fmap = FontMapper(self.sbase, self.fbase, self.fkey)
+            results = pool.call('flatten_in_worker', self.sbase)
+        names = ClassNames()
+        for item, (raw, requests, page_style) in zip(self.items, results):
+            html = safe_xml_fromstring(raw, recover=False)
+            nodes = list(html.iter())
+            for pos, klass, css, pseudo in requests:
+                names.assign(nodes[pos], klass, css, pseudo)
+            item.data = html
+            self.page_styles[item] = page_style
+        return names
+
+    def stylize_in_worker(self, item):
+        self.stylize_item(item)
+        sizes = collections.defaultdict(float)
+        if self.fbase:
+            self.baseline_item(item, sizes)
+        return dict(sizes)
+
+    def flatten_in_worker(self, item, sbase):
+        self.sbase = sbase
+        self.fmap = FontMapper(self.sbase, self.fbase, self.fkey)
+        recorder = ClassRecorder()
+        self.flatten_item(item, recorder)
+        html = item.data
+        positions = {node: i for i, node in enumerate(html.iter())}
+        requests = [(positions[node], klass, css, pseudo)
+                    for node, klass, css, pseudo in recorder.requests]
+        return etree.tostring(html), requests, self.page_styles[item]
+    # }}}
+
+    def flatten_spine(self, names):
+        styles, pseudo_styles = names.styles, names.pseudo_styles
         items = sorted(((key, val) for (val, key) in styles.items()))
         # :hover must come after link and :active must come after :hover
         psels = sorted(pseudo_styles, key=lambda x :
@@ -679,5 +791,4 @@ class CSSFlattener(object):
         href = self.replace_css(css)
         global_css = self.collect_global_css()
         for item in self.items:
-            stylizer = self.stylizers[item]
             self.flatten_head(item, href, global_css[item])
@@ -16,7 +16,8 @@ from lxml import etree
 from ebook_converter import constants as const
 from ebook_converter.ebooks.epub import rules
 from ebook_converter.ebooks.oeb import base
-from ebook_converter.ebooks.oeb.polish.split import do_split
+from ebook_converter.ebooks.oeb.polish.split import adjust_split_point, \
+    do_split, get_body
 from ebook_converter import polyglot
 from ebook_converter.css_selectors import Select, SelectorError
 from ebook_converter.utils import encoding as uenc
@@ -25,12 +26,88 @@ from ebook_converter.utils import encoding as uenc
 XPath = functools.partial(_XPath, namespaces=const.XPNSMAP)
 
 SPLIT_POINT_ATTR = 'csp'
+SPLIT_INDEX_ATTR = 'csi'
+
+# Elements at which flows can be split to size, best first
+SPLIT_POINT_PATHS = (
+    '//*[re:match(name(), "h[1-6]", "i")]',
+    '/h:html/h:body/h:div',
+    '//h:pre',
+    '//h:hr',
+    '//h:p',
+    '//h:div',
+    '//h:br',
+    '//h:li',
+)
 
 
 def tostring(root):
     return etree.tostring(root, encoding='utf-8')
 
 
+def _utf8_len(text):
+    return len(text.encode('utf-8')) if text else 0
+
+
+def serialized_offsets(root):
+    """
+    Estimate the byte offsets at which every element starts and ends in the
+    UTF-8 serialization of root, in a single walk over the tree. Returns the
+    start and end offsets and the total size.
+    """
+    starts, ends = {}, {}
+    pos = 0
+    for event, elem in etree.iterwalk(root, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            starts[elem] = pos
+            if not isinstance(tag, str):
+                # Comments and processing instructions
+                pos += len(etree.tostring(elem, encoding='utf-8',
+                                          with_tail=False))
+                continue
+            pos += len(etree.QName(tag).localname) + 2 + _utf8_len(elem.text)
+            for key, val in elem.items():
+                pos += len(etree.QName(key).localname) + 4 + _utf8_len(val)
+        else:
+            if isinstance(tag, str):
+                pos += len(etree.QName(tag).localname) + 3
+            ends[elem] = pos
+            pos += _utf8_len(elem.tail)
+    return starts, ends, pos
+
+
+def split_before(split_point, log):
+    """
+    Same as ``do_split(split_point, log, before=True)``, but the content on
+    either side of the split point is removed with one slice per ancestor
+    rather than one element at a time, which is quadratic in the number of
+    siblings.
+    """
+    split_point = adjust_split_point(split_point, log)
+    tree = split_point.getroottree()
+    path = tree.getpath(split_point)
+    trees = copy.deepcopy(tree), copy.deepcopy(tree)
+    for keep_after, t in enumerate(trees):
+        root = t.getroot()
+        body = get_body(root)
+        node = root.xpath(path)[0]
+        first = True
+        while node is not body and node.getparent() is not None:
+            parent = node.getparent()
+            idx = parent.index(node)
+            if keep_after:
+                del parent[:idx]
+                # Ancestors are kept for the styles they could apply, but
+                # not their text
+                parent.text = '\n'
+            else:
+                # Drop the split point and everything after it
+                del parent[idx if first else idx + 1:]
+            node, first = parent, False
+    return trees
+
+
 class SplitError(ValueError):
 
     def __init__(self, path, root):
@@ -106,6 +183,9 @@ class Split(object):
                             rule.style.removeProperty('page-break-after')
                 except Exception:
                     pass
+            if self.remove_css_pagebreaks:
+                for stylesheet in stylesheets:
+                    self.oeb.stylesheet_changed(stylesheet)
         page_breaks = set()
         select = Select(item.data)
         if not self.page_break_selectors:
@@ -336,9 +416,7 @@ class FlowSplitter(object):
                 buf = part
         return ans
 
-    def split_to_size(self, tree):
-        self.log.debug('\t\tSplitting...')
-        root = tree.getroot()
+    def split_large_pres(self, root):
         # Split large <pre> tags if they contain only text
         for pre in XPath('//h:pre')(root):
             if len(tuple(pre.iterchildren(etree.Element))) > 0:
@@ -358,6 +436,118 @@ class FlowSplitter(object):
                 i = p.index(pre)
                 p[i:i+1] = new_pres
 
+    def split_to_size(self, tree):
+        """
+        Split tree into parts smaller than max_flow_size. The offset of every
+        element in the serialized tree is computed once, all split points
+        are chosen from it in a single pass and the tree is then cut at
+        them, instead of serializing every intermediate part to find out if
+        it needs splitting again.
+        """
+        self.log.debug('\t\tSplitting...')
+        root = tree.getroot()
+        self.split_large_pres(root)
+        points = self.find_split_points(root)
+        if not points:
+            self.bisect_to_size(tree)
+            return
+        for i, elem in enumerate(points):
+            elem.set(SPLIT_INDEX_ATTR, str(i))
+        parts = []
+        self.cut_at(tree, list(range(len(points))), parts)
+
+        for t in parts:
+            r = t.getroot()
+            for elem in XPath('//*[@%s]' % SPLIT_INDEX_ATTR)(r):
+                del elem.attrib[SPLIT_INDEX_ATTR]
+            if self.is_page_empty(r):
+                continue
+            size = len(tostring(r))
+            if size <= self.max_flow_size:
+                self.split_trees.append(t)
+                self.log.debug('\t\t\tCommitted sub-tree #%d (%d KB)',
+                               len(self.split_trees), size/1024.)
+            else:
+                self.log.debug('\t\t\tSplit tree still too large: %d KB',
+                               size/1024)
+                self.bisect_to_size(t)
+
+    def find_split_points(self, root):
+        """
+        Choose the elements to split the tree rooted at root before, in
+        document order. Each part is filled up to the size limit and ends
+        before the best kind of element (as ordered in
+        :meth:`find_split_point`) found in the second half of the part.
+        """
+        body = self.get_body(root)
+        if body is None:
+            return []
+        starts, ends, total = serialized_offsets(root)
+        start, end = starts[body], ends[body]
+        # The markup outside the body is repeated in every part
+        budget = int((self.max_flow_size - (total - end + start)) * 0.95)
+        if budget < 5*1024:
+            return []
+
+        ranks = {}
+        for rank, path in enumerate(SPLIT_POINT_PATHS):
+            for elem in root.xpath(path, namespaces=const.XPNSMAP):
+                if elem is not body and elem not in ranks:
+                    ranks[elem] = rank
+        candidates = sorted(((starts[elem], rank, elem)
+                             for elem, rank in ranks.items()),
+                            key=lambda x: (x[0], x[1]))
+
+        points = []
+        i, n = 0, len(candidates)
+        while i < n and end - start > budget:
+            best = best_key = None
+            j = i
+            while j < n and candidates[j][0] - start <= budget:
+                offset, rank, elem = candidates[j]
+                if offset - start >= 5*1024:
+                    key = (offset - start >= budget // 2, -rank, offset)
+                    if best_key is None or key > best_key:
+                        best, best_key = j, key
+                j += 1
+            if best is None:
+                # Nothing to split at in range, this part is too large and
+                # gets split further once cut
+                best = j
+                if best >= n:
+                    break
+            i = best + 1
+            offset, rank, elem = candidates[best]
+            try:
+                XPath(elem.getroottree().getpath(elem))
+            except Exception:
+                continue
+            points.append(elem)
+            start = offset
+        return points
+
+    def cut_at(self, tree, indices, parts):
+        """
+        Cut tree before the split points in indices, always at the middle
+        one, so that each element is copied only a logarithmic number of
+        times.
+        """
+        if not indices:
+            parts.append(tree)
+            return
+        mid = len(indices) // 2
+        elem = XPath('//*[@%s="%d"]' % (SPLIT_INDEX_ATTR, indices[mid]))(
+            tree.getroot())
+        if not elem:
+            self.cut_at(tree, indices[:mid] + indices[mid+1:], parts)
+            return
+        before, after = split_before(elem[0], self.log)
+        self.cut_at(before, indices[:mid], parts)
+        self.cut_at(after, indices[mid+1:], parts)
+
+    def bisect_to_size(self, tree):
+        self.log.debug('\t\tSplitting...')
+        root = tree.getroot()
         split_point, before = self.find_split_point(root)
         if split_point is None:
             raise SplitError(self.item.href, root)
@@ -368,7 +558,7 @@ class FlowSplitter(object):
         sizes = [len(tostring(t.getroot())) for t in trees]
         if min(sizes) < 5*1024:
             self.log.debug('\t\t\tSplit tree too small')
-            self.split_to_size(tree)
+            self.bisect_to_size(tree)
             return
 
         for t, size in zip(trees, sizes):
@@ -382,7 +572,7 @@ class FlowSplitter(object):
             else:
                 self.log.debug('\t\t\tSplit tree still too large: %d KB',
                                size/1024)
-                self.split_to_size(t)
+                self.bisect_to_size(t)
 
     def find_split_point(self, root):
         '''
@@ -407,16 +597,7 @@ class FlowSplitter(object):
                     elems[i].set(SPLIT_POINT_ATTR, '1')
                     return elems[i]
 
-        for path in (
-                     '//*[re:match(name(), "h[1-6]", "i")]',
-                     '/h:html/h:body/h:div',
-                     '//h:pre',
-                     '//h:hr',
-                     '//h:p',
-                     '//h:div',
-                     '//h:br',
-                     '//h:li',
-                     ):
+        for path in SPLIT_POINT_PATHS:
             elems = root.xpath(path, namespaces=const.XPNSMAP)
             elem = pick_elem(elems)
             if elem is not None:
@@ -1,7 +1,7 @@
 from collections import defaultdict
 
 from ebook_converter.ebooks.oeb.base import urlnormalize, css_text
-from ebook_converter.utils.fonts.sfnt.subset import subset, NoGlyphs, UnsupportedFont
+from ebook_converter.utils.fonts.sfnt.subset import subset_many, NoGlyphs, UnsupportedFont
 from ebook_converter.tinycss.fonts3 import parse_font_family
 
 
@@ -132,7 +132,9 @@ class SubsetFonts(object):
         def remove(font):
             totals[1] += len(font['item'].data)
             self.oeb.manifest.remove(font['item'])
-            font['rule'].parentStyleSheet.deleteRule(font['rule'])
+            sheet = font['rule'].parentStyleSheet
+            sheet.deleteRule(font['rule'])
+            self.oeb.stylesheet_changed(sheet)
 
         fonts = {}
         for font in self.embedded_fonts:
@@ -142,25 +144,32 @@ class SubsetFonts(object):
             else:
                 fonts[item.href] = font
 
+        used = []
         for font in fonts.values():
             if not font['chars']:
                 self.log('The font %s is unused. Removing it.', font['src'])
                 remove(font)
                 continue
-            try:
-                raw, old_stats, new_stats = subset(font['item'].data, font['chars'])
-            except NoGlyphs:
+            used.append(font)
+
+        # Fonts are subset concurrently and repeated subsets of the same
+        # font are served from a cache
+        results = subset_many([(font['item'].data, font['chars'])
+                               for font in used])
+        for font, result in zip(used, results):
+            if isinstance(result, NoGlyphs):
                 self.log('The font %s has no used glyphs. Removing it.',
                          font['src'])
                 remove(font)
                 continue
-            except UnsupportedFont as e:
+            if isinstance(result, UnsupportedFont):
                 self.log.warning('The font %s is unsupported for subsetting. '
-                                 '%s', font['src'], e)
+                                 '%s', font['src'], result)
                 sz = len(font['item'].data)
                 totals[0] += sz
                 totals[1] += sz
             else:
+                raw, old_stats, new_stats = result
                 font['item'].data = raw
                 nlen = sum(new_stats.values())
                 olen = sum(old_stats.values())
@@ -26,7 +26,7 @@ from ebook_converter.ebooks.rtf2xml import headings_to_sections, \
     inline
 from ebook_converter.ebooks.rtf2xml.old_rtf import OldRtf
 
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove, MemoryFiles
 
 """
 Here is an example script using the ParseRTF module directly
@@ -91,6 +91,10 @@ class ParseRtf:
     Main class for controlling the rest of the parsing.
     """
 
+    # Hand the output of each pass to the next one in memory instead of
+    # through temporary files, unless a debug directory is set
+    in_memory = True
+
     def __init__(self,
                 in_file,
                 out_file='',
@@ -189,6 +193,13 @@ class ParseRtf:
             A parsed file in XML, either to standard output or to a file,
             depending on the value of 'output' when the instance was created.
         """
+        if self.__debug_dir or not self.in_memory:
+            # Every pass leaves its output on disk to be examined
+            return self.__parse_rtf()
+        with MemoryFiles():
+            return self.__parse_rtf()
+
+    def __parse_rtf(self):
         self.__temp_file = self.__make_temp_file(self.__file)
         # if the self.__deb_dir is true, then create a copy object,
         # set the directory to write to, remove files, and copy
@@ -254,7 +265,7 @@ class ParseRtf:
                                     else self.__file.encode('utf-8')
                 msg +='\nFile %s does not appear to be correctly encoded.\n' % file_name
             try:
-                os.remove(self.__temp_file)
+                remove(self.__temp_file)
             except OSError:
                 pass
             raise InvalidRtfException(msg)
@@ -542,7 +553,7 @@ class ParseRtf:
                 out_file=self.__out_file,
             )
         output_obj.output()
-        os.remove(self.__temp_file)
+        remove(self.__temp_file)
         return self.__exit_level
 
     def __bracket_match(self, file_name):
@@ -563,7 +574,7 @@ class ParseRtf:
 
     def __make_temp_file(self,file):
         """Make a temporary file to parse"""
-        write_file="rtf_write_file"
+        write_file = mktemp()
         read_obj = file if hasattr(file, 'read') else open_for_read(file)
         with open_for_write(write_file) as write_obj:
             for line in read_obj:
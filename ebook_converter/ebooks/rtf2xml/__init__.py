@@ -1,10 +1,158 @@
+import functools
 import io
+import os
+import shutil
+import threading
+
+from ebook_converter.ptempfile import better_mktemp
+
+
+_active = threading.local()
+
+# Characters other than \n that str.splitlines() treats as line boundaries
+_other_line_breaks = ('\r', '\x0b', '\x0c', '\x1c', '\x1d', '\x1e', '\x85',
+                      '\u2028', '\u2029')
+
+
+class MemoryFiles(object):
+    """
+    Keep the intermediate files of the rtf2xml passes in memory.
+
+    While active (as a context manager) temporary files created with
+    :func:`mktemp` are plain strings held by this object instead of files on
+    disk, so that each pass hands its output to the next one without writing,
+    copying and re-reading it. Other paths are not affected.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.names = set()
+
+    def mktemp(self):
+        name = '<rtf2xml memory file %d>' % len(self.names)
+        self.names.add(name)
+        self.files[name] = ''
+        return name
+
+    def __enter__(self):
+        self.previous = getattr(_active, 'files', None)
+        _active.files = self
+        return self
+
+    def __exit__(self, *args):
+        _active.files = self.previous
+        self.files.clear()
+        self.names.clear()
+
+
+class MemoryWriter(object):
+    """Collect what is written and store it in the memory file on close."""
+
+    def __init__(self, files, path, initial=''):
+        self.files, self.path = files, path
+        self.parts = [initial] if initial else []
+        self.write = self.parts.append
+        self.closed = False
+
+    def writelines(self, lines):
+        self.parts.extend(lines)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            # Behave as a round trip through a file written with
+            # errors='replace' would
+            text = ''.join(self.parts)
+            if not text.isascii():
+                text = text.encode('utf-8', 'replace').decode('utf-8')
+            self.files[self.path] = text
+            del self.parts[:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MemoryReader(object):
+    """Iterate over the lines of a memory file like over a text file."""
+
+    def __init__(self, text):
+        if not any(c in text for c in _other_line_breaks):
+            lines = text.splitlines(True)
+        else:
+            # Only \n, \r and \r\n end lines, as with a file opened for
+            # reading
+            lines = io.StringIO(text, newline=None).readlines()
+        self.lines = iter(lines)
+        self.readline = functools.partial(next, self.lines, '')
+
+    def __iter__(self):
+        return self.lines
+
+    def read(self):
+        return ''.join(self.lines)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def memory_files(path):
+    files = getattr(_active, 'files', None)
+    # Passes may write again to a temporary file they removed, so look at
+    # the names that were handed out rather than the current contents
+    if files is not None and path in files.names:
+        return files.files
+
+
+def mktemp():
+    files = getattr(_active, 'files', None)
+    if files is None:
+        return better_mktemp()
+    return files.mktemp()
 
 
 def open_for_read(path):
+    files = memory_files(path)
+    if files is not None:
+        return MemoryReader(files[path])
     return io.open(path, encoding='utf-8', errors='replace')
 
 
+def open_binary(path):
+    files = memory_files(path)
+    if files is not None:
+        return io.BytesIO(files[path].encode('utf-8'))
+    return open(path, 'rb')
+
+
 def open_for_write(path, append=False):
+    files = memory_files(path)
+    if files is not None:
+        return MemoryWriter(files, path, files[path] if append else '')
     mode = 'a' if append else 'w'
     return io.open(path, mode, encoding='utf-8', errors='replace', newline='')
+
+
+def rename(source, dest):
+    """Replace the contents of dest with those of source."""
+    files = memory_files(source)
+    if files is not None and memory_files(dest) is not None:
+        files[dest] = files[source]
+    else:
+        shutil.copyfile(source, dest)
+
+
+def remove(path):
+    files = memory_files(path)
+    if files is not None:
+        files.pop(path, None)
+    else:
+        os.remove(path)
@@ -10,10 +10,8 @@
 #                                                                       #
 #                                                                       #
 #########################################################################
-import os
 from ebook_converter.ebooks.rtf2xml import copy
-from ebook_converter.ptempfile import better_mktemp
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 """
 Simply write the list of strings after style table
@@ -48,7 +46,7 @@ class BodyStyles:
         self.__copy = copy
         self.__list_of_styles = list_of_styles
         self.__run_level = run_level
-        self.__write_to = better_mktemp()
+        self.__write_to = mktemp()
         # self.__write_to = 'table_info.data'
 
     def insert_info(self):
@@ -80,4 +78,4 @@ class BodyStyles:
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "body_styles.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
@@ -1,5 +1,7 @@
 import sys
 
+from . import open_binary
+
 
 class CheckEncoding:
 
@@ -17,7 +19,7 @@ class CheckEncoding:
 
     def check_encoding(self, path, encoding='us-ascii', verbose=True):
         line_num = 0
-        with open(path, 'rb') as read_obj:
+        with open_binary(path) as read_obj:
             for line in read_obj:
                 line_num += 1
                 try:
@@ -1,8 +1,7 @@
-import os, sys
+import sys
 
 from ebook_converter.ebooks.rtf2xml import copy, check_encoding
-from ebook_converter.ptempfile import better_mktemp
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 public_dtd = 'rtf2xml1.0.dtd'
 
@@ -42,7 +41,7 @@ class ConvertToTags:
         # self.__encoding = 'mac_roman'
         self.__indent = indent
         self.__run_level = run_level
-        self.__write_to = better_mktemp()
+        self.__write_to = mktemp()
         self.__convert_utf = False
         self.__bad_encoding = False
 
@@ -280,4 +279,4 @@ class ConvertToTags:
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "convert_to_tags.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
@@ -12,6 +12,8 @@
 #########################################################################
 import os, shutil
 
+from . import rename
+
 
 class Copy:
     """Copy each changed file to a directory for debugging purposes"""
@@ -59,4 +61,4 @@ class Copy:
         shutil.copyfile(file, write_file)
 
     def rename(self, source, dest):
-        shutil.copyfile(source, dest)
+        rename(source, dest)
@@ -10,11 +10,10 @@
 #                                                                       #
 #                                                                       #
 #########################################################################
-import sys, os
+import sys
 
 from ebook_converter.ebooks.rtf2xml import copy
-from ebook_converter.ptempfile import better_mktemp
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 
 class Fonts:
@@ -44,7 +43,7 @@ class Fonts:
         self.__bug_handler = bug_handler
         self.__copy = copy
         self.__default_font_num = default_font_num
-        self.__write_to = better_mktemp()
+        self.__write_to = mktemp()
         self.__run_level = run_level
 
     def __initiate_values(self):
@@ -221,5 +220,5 @@ class Fonts:
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "fonts.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
         return self.__special_font_dict
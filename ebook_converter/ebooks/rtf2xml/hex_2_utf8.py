@@ -10,13 +10,12 @@
 #                                                                       #
 #                                                                       #
 #########################################################################
-import sys, os, io
+import sys, io
 
 from ebook_converter.ebooks.rtf2xml import get_char_map, copy
 from ebook_converter.ebooks.rtf2xml.char_set import char_set
-from ebook_converter.ptempfile import better_mktemp
 
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 
 class Hex2Utf8:
@@ -78,7 +77,7 @@ class Hex2Utf8:
         self.__convert_wingdings = 0
         self.__convert_zapf = 0
         self.__run_level = run_level
-        self.__write_to = better_mktemp()
+        self.__write_to = mktemp()
         self.__bug_handler = bug_handler
         self.__invalid_rtf_handler = invalid_rtf_handler
 
@@ -298,7 +297,7 @@ class Hex2Utf8:
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "preamble_utf_convert.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
 
     def __preamble_for_body_func(self, line):
         """
@@ -556,7 +555,7 @@ class Hex2Utf8:
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "body_utf_convert.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
 
     def convert_hex_2_utf8(self):
         self.__initiate_values()
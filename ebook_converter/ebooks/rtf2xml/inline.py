@@ -1,8 +1,7 @@
-import sys, os
+import sys
 
 from ebook_converter.ebooks.rtf2xml import copy
-from ebook_converter.ptempfile import better_mktemp
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 """
 States.
@@ -42,7 +41,7 @@ class Inline:
         self.__bug_handler = bug_handler
         self.__copy = copy
         self.__run_level = run_level
-        self.__write_to = better_mktemp()
+        self.__write_to = mktemp()
 
     def __initiate_values(self):
         """
@@ -423,4 +422,4 @@ class Inline:
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "inline.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
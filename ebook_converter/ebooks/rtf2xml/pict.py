@@ -13,9 +13,8 @@
 import sys, os
 
 from ebook_converter.ebooks.rtf2xml import copy
-from ebook_converter.ptempfile import better_mktemp
 
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 
 class Pict:
@@ -32,7 +31,7 @@ class Pict:
         self.__bug_handler = bug_handler
         self.__copy = copy
         self.__run_level = run_level
-        self.__write_to = better_mktemp()
+        self.__write_to = mktemp()
         self.__bracket_count = 0
         self.__ob_count = 0
         self.__cb_count = 0
@@ -172,7 +171,7 @@ class Pict:
             except:
                 pass
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
         if self.__pict_count == 0:
             try:
                 os.rmdir(self.__dir_name)
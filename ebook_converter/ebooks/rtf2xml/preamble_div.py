@@ -10,10 +10,9 @@
 #                                                                       #
 #                                                                       #
 #########################################################################
-import sys, os
+import sys
 from ebook_converter.ebooks.rtf2xml import copy, override_table, list_table
-from ebook_converter.ptempfile import better_mktemp
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 
 class PreambleDiv:
@@ -41,7 +40,7 @@ class PreambleDiv:
         self.__bug_handler = bug_handler
         self.__copy = copy
         self.__no_namespace = no_namespace
-        self.__write_to = better_mktemp()
+        self.__write_to = mktemp()
         self.__run_level = run_level
 
     def __initiate_values(self):
@@ -585,5 +584,5 @@ cw<ci<font-style<nu<0
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "preamble_div.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
         return self.__all_lists
@@ -13,7 +13,7 @@
 import sys,os
 
 from ebook_converter.ebooks.rtf2xml import copy
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 
 class Preamble:
@@ -54,7 +54,7 @@ class Preamble:
         if temp_dir:
             self.__write_to = os.path.join(temp_dir,"info_table_info.data")
         else:
-            self.__write_to = "info_table_info.data"
+            self.__write_to = mktemp()
 
     def __initiate_values(self):
         """
@@ -153,4 +153,4 @@ class Preamble:
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "preamble_div.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
@@ -10,10 +10,8 @@
 #                                                                       #
 #                                                                       #
 #########################################################################
-import os
 from ebook_converter.ebooks.rtf2xml import copy
-from ebook_converter.ptempfile import better_mktemp
-from . import open_for_read, open_for_write
+from . import open_for_read, open_for_write, mktemp, remove
 
 # note to self. This is the first module in which I use tempfile. A good idea?
 """
@@ -48,7 +46,7 @@ class TableInfo:
         self.__copy = copy
         self.__table_data = table_data
         self.__run_level = run_level
-        self.__write_to = better_mktemp()
+        self.__write_to = mktemp()
         # self.__write_to = 'table_info.data'
 
     def insert_info(self):
@@ -84,4 +82,4 @@ class TableInfo:
         if self.__copy:
             copy_obj.copy_file(self.__write_to, "table_info.data")
         copy_obj.rename(self.__write_to, self.__file)
-        os.remove(self.__write_to)
+        remove(self.__write_to)
@@ -246,7 +246,7 @@ def split_string_separator(txt, size):
     return txt
 
 
-def detect_paragraph_type(txt):
+def detect_paragraph_type(txt, docanalysis=None):
     '''
     Tries to determine the paragraph type of the document.
 
@@ -257,13 +257,16 @@ def detect_paragraph_type(txt):
     unformatted: most lines have hard line breaks, few/no blank lines or indents
 
     returns block, single, print, unformatted
+
+    docanalysis is the :class:`DocAnalysis` of txt, if the caller has it.
     '''
     txt = txt.replace('\r\n', '\n')
     txt = txt.replace('\r', '\n')
     txt_line_count = len(re.findall(r'(?mu)^\s*.+$', txt))
 
     # Check for hard line breaks - true if 55% of the doc breaks in the same region
-    docanalysis = DocAnalysis('txt', txt)
+    if docanalysis is None:
+        docanalysis = DocAnalysis('txt', txt)
     hardbreaks = docanalysis.line_histogram(.55)
 
     if hardbreaks:
@@ -11,11 +11,8 @@ This functionality is owned by Kakasi Japanese processing engine.
 
 Copyright (c) 2010 Hiroshi Miura
 """
-import re
-
+from ebook_converter.ebooks.unihandecode import tables
 from ebook_converter.ebooks.unihandecode.unidecoder import Unidecoder
-from ebook_converter.ebooks.unihandecode.unicodepoints import CODEPOINTS
-from ebook_converter.ebooks.unihandecode.jacodepoints import CODEPOINTS as JACODES
 from ebook_converter.ebooks.unihandecode.pykakasi.kakasi import kakasi
 
 
@@ -26,16 +23,15 @@ __docformat__ = 'restructuredtext en'
 
 class Jadecoder(Unidecoder):
     kakasi = None
-    codepoints = {}
+    lang = 'ja'
 
     def __init__(self):
-        self.codepoints = CODEPOINTS
-        self.codepoints.update(JACODES)
+        Unidecoder.__init__(self)
         self.kakasi = kakasi()
 
     def decode(self, text):
         try:
-            result=self.kakasi.do(text)
-            return re.sub('[^\x00-\x7f]', lambda x: self.replace_point(x.group()),result)
+            result = self.kakasi.do(text)
         except:
-            return re.sub('[^\x00-\x7f]', lambda x: self.replace_point(x.group()),text)
+            result = text
+        return tables.transliterate(result, self.table, self.astral)
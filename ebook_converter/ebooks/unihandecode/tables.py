@@ -0,0 +1,139 @@
+"""
+Flat translation tables for the decoders.
+
+The code point dictionaries map code groups ('xAB') to lists of
+replacements. Looking up every character in them from Python is slow, so for
+each language they are merged once into a table usable with str.translate():
+a list indexed by the code points of the Basic Multilingual Plane, plus a
+dict for the few characters above it. Building a table means importing the
+large code point modules, so the tables are cached on disk and those modules
+are only imported when the cache is missing or out of date.
+"""
+import hashlib
+import importlib
+import importlib.util
+import marshal
+import os
+import re
+import tempfile
+import threading
+
+
+# Bump when the layout of the tables changes
+TABLE_VERSION = 1
+
+CACHE_DIR_NAME = 'ebook-converter-unihandecode'
+
+# Modules with the replacements specific to each language, they take
+# precedence over the generic ones in unicodepoints
+LANG_MODULES = {
+    'zh': 'zhcodepoints',
+    'ja': 'jacodepoints',
+    'kr': 'krcodepoints',
+    'vn': 'vncodepoints',
+}
+
+BMP_SIZE = 0x10000
+ASTRAL_PAT = re.compile('[\U00010000-\U0010ffff]')
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def cache_path(lang):
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~/'), '.cache')
+    return os.path.join(base, CACHE_DIR_NAME, lang + '.marshal')
+
+
+def module_names(lang):
+    return ('unicodepoints', LANG_MODULES[lang])
+
+
+def source_key(lang):
+    """Identify the version of the code point modules a table is built
+    from, without importing them."""
+    h = hashlib.sha1(b'%d:%s' % (TABLE_VERSION, lang.encode('ascii')))
+    for name in module_names(lang):
+        spec = importlib.util.find_spec('%s.%s' % (__package__, name))
+        origin = getattr(spec, 'origin', None)
+        try:
+            st = os.stat(origin)
+        except (TypeError, OSError):
+            continue
+        h.update(b'%s:%d:%d' % (name.encode('ascii'), st.st_size,
+                                st.st_mtime_ns))
+    return h.hexdigest()
+
+
+def build_table(lang):
+    """
+    Return (table, astral) for lang. table maps every code point of the BMP
+    to its replacement, ASCII characters to themselves and characters
+    without a replacement to '?'. astral maps the characters above the BMP
+    that have a replacement.
+    """
+    codepoints = {}
+    for name in module_names(lang):
+        module = importlib.import_module('%s.%s' % (__package__, name))
+        codepoints.update(module.CODEPOINTS)
+    table = list(range(128)) + ['?'] * (BMP_SIZE - 128)
+    astral = {}
+    for group, replacements in codepoints.items():
+        start = int(group[1:], 16) << 8
+        for i, replacement in enumerate(replacements, start):
+            if i < 128:
+                continue
+            if i < BMP_SIZE:
+                table[i] = replacement
+            else:
+                astral[i] = replacement
+    return table, astral
+
+
+def load_table(lang):
+    key = source_key(lang)
+    path = cache_path(lang)
+    try:
+        with open(path, 'rb') as f:
+            cached_key, table, astral = marshal.loads(f.read())
+        if cached_key == key and len(table) == BMP_SIZE:
+            return table, astral
+    except Exception:
+        pass
+    table, astral = build_table(lang)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+                                   prefix='.%s-' % lang)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump((key, table, astral), f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    except OSError:
+        # The cache is only an optimization
+        pass
+    return table, astral
+
+
+def translation_table(lang):
+    """The (table, astral) pair for lang, loaded once per process."""
+    with _lock:
+        ans = _tables.get(lang)
+        if ans is None:
+            ans = _tables[lang] = load_table(lang)
+        return ans
+
+
+def transliterate(text, table, astral):
+    """Replace the non ASCII characters of text using the given tables."""
+    if text.isascii():
+        return text
+    if max(text) > '\uffff':
+        text = ASTRAL_PAT.sub(lambda m: astral.get(ord(m.group()), '?'),
+                              text)
+    return text.translate(table)
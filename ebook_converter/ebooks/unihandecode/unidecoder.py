@@ -14,8 +14,8 @@ unidecode can be found at
 http://interglacial.com/~sburke/tpj/as_html/tpj22.html.
 
 The major differences between this implementation and others is it's written in
-python and it uses a single dictionary instead of loading the code group files
-as needed.
+python and it merges the code group files into a single str.translate() table
+per language, cached on disk.
 
 
 Copyright (c) 2007 Russell Norris
@@ -52,10 +52,7 @@ purpose.
 This library is free software; you can redistribute it and/or modify
 it under the same terms as Perl itself.
 """
-import re
-
-from ebook_converter.ebooks.unihandecode.unicodepoints import CODEPOINTS
-from ebook_converter.ebooks.unihandecode.zhcodepoints import CODEPOINTS as HANCODES
+from ebook_converter.ebooks.unihandecode import tables
 
 
 __license__ = 'GPL 3'
@@ -65,28 +62,32 @@ __docformat__ = 'restructuredtext en'
 
 class Unidecoder(object):
 
-    codepoints = {}
+    # The code point tables are merged into one translation table per
+    # language, see the tables module
+    lang = 'zh'
 
     def __init__(self):
-        self.codepoints = CODEPOINTS
-        self.codepoints.update(HANCODES)
+        self.table, self.astral = tables.translation_table(self.lang)
 
     def decode(self, text):
         # Replace characters larger than 127 with their ASCII equivelent.
-        return re.sub('[^\x00-\x7f]',lambda x: self.replace_point(x.group()), text)
+        return tables.transliterate(text, self.table, self.astral)
 
     def replace_point(self, codepoint):
         '''
         Returns the replacement character or ? if none can be found.
         '''
+        if not isinstance(codepoint, str):
+            codepoint = str(codepoint, "utf-8")
         try:
-            # Split the unicode character xABCD into parts 0xAB and 0xCD.
-            # 0xAB represents the group within CODEPOINTS to query and 0xCD
-            # represents the position in the list of characters for the group.
-            return self.codepoints[self.code_group(codepoint)][self.grouped_point(
-                codepoint)]
-        except:
+            code = ord(codepoint)
+        except TypeError:
             return '?'
+        if code < 128:
+            return codepoint
+        if code < tables.BMP_SIZE:
+            return self.table[code]
+        return self.astral.get(code, '?')
 
     def code_group(self, character):
         '''
@@ -0,0 +1,328 @@
+"""
+Background conversion jobs for the web interface.
+
+Conversions are executed in a bounded pool of worker processes, each running
+a single Plumber at a time, so that a large book never ties up the request
+thread which submitted it. Progress reported by the Plumber is sent back to
+the parent process over a queue and exposed on the :class:`Job` objects.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = frozenset((DONE, FAILED, CANCELLED))
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker to abort a conversion that was cancelled."""
+
+
+class ConversionArgs:
+    """Minimal stand-in for the parsed command line used by main.run()."""
+
+    def __init__(self, from_file, to_file, verbose=0, quiet=0, profile=None):
+        self.from_file = from_file
+        self.to_file = to_file
+        self.verbose = verbose
+        self.quiet = quiet
+        self.profile = profile
+
+
+class Job:
+    """State of a single conversion as seen from the web process."""
+
+    def __init__(self, filename, output_format, work_dir, input_path,
+                 output_path, output_filename, profile_path=None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.output_format = output_format
+        self.work_dir = work_dir
+        self.input_path = input_path
+        self.output_path = output_path
+        self.output_filename = output_filename
+        # Where the timing report of the conversion is written, if requested
+        self.profile_path = profile_path
+        self.state = PENDING
+        self.progress = 0.0
+        self.message = ''
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        # Set once the final state of the job is recorded
+        self.done = threading.Event()
+
+    @property
+    def is_finished(self):
+        return self.state in FINISHED_STATES
+
+    def as_dict(self):
+        return {'job_id': self.id,
+                'filename': self.filename,
+                'output_filename': self.output_filename,
+                'output_format': self.output_format,
+                'status': self.state,
+                'progress': round(self.progress, 4),
+                'message': self.message,
+                'error': self.error,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished}
+
+
+# Worker process side {{{
+
+_progress_queue = None
+_cancelled = None
+
+
+def _init_worker(progress_queue, cancelled):
+    global _progress_queue, _cancelled
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+
+
+def _run_conversion(job_id, input_path, output_path, output_format,
+                    profile_path=None):
+    """
+    Convert a single book inside a worker process. If profile_path is set,
+    the timing report of the conversion is written there.
+
+    Returns a ``(state, error)`` tuple, where state is one of DONE, FAILED or
+    CANCELLED.
+    """
+    from ebook_converter.ebooks.conversion.plumber import \
+        CompositeProgressReporter
+
+    def report(fraction, msg=''):
+        if job_id in _cancelled:
+            raise JobCancelled()
+        _progress_queue.put((job_id, fraction, msg))
+
+    _progress_queue.put((job_id, 0.0, 'Starting conversion...'))
+    try:
+        if output_format == 'pdf':
+            from ebook_converter.pdf_converter import convert_to_pdf_via_epub
+            code = convert_to_pdf_via_epub(
+                input_path, output_path,
+                report_progress=CompositeProgressReporter(0, 0.8, report),
+                profile=profile_path)
+        else:
+            from ebook_converter.main import run
+            code = run(ConversionArgs(input_path, output_path,
+                                      profile=profile_path), report)
+    except JobCancelled:
+        return CANCELLED, None
+    except SystemExit as e:
+        code = e.code
+    except Exception as e:
+        traceback.print_exc()
+        return FAILED, str(e)
+
+    if job_id in _cancelled:
+        return CANCELLED, None
+    if code:
+        return FAILED, 'Conversion failed with exit code: %s' % code
+    if not os.path.exists(output_path):
+        return FAILED, 'Conversion did not produce an output file'
+    _progress_queue.put((job_id, 1.0, 'Conversion finished'))
+    return DONE, None
+# }}}
+
+
+class JobQueue:
+    """
+    A bounded queue of conversion jobs backed by a process pool.
+
+    At most ``workers`` conversions run concurrently and at most
+    ``queue_depth`` more are allowed to wait for a free worker. Submitting
+    beyond that raises :class:`QueueFull`, so that callers can apply
+    backpressure instead of piling up uploads. Results of finished jobs are
+    kept for ``result_ttl`` seconds.
+    """
+
+    def __init__(self, workers=None, queue_depth=None, result_ttl=3600):
+        self.workers = workers or os.cpu_count() or 1
+        if queue_depth is None:
+            queue_depth = 4 * self.workers
+        self.queue_depth = queue_depth
+        self.result_ttl = result_ttl
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self._manager = multiprocessing.Manager()
+        self._cancelled = self._manager.dict()
+        self._progress_queue = self._manager.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker,
+            initargs=(self._progress_queue, self._cancelled))
+        self._listener = threading.Thread(target=self._listen,
+                                          name='JobProgressListener',
+                                          daemon=True)
+        self._listener.start()
+
+    @property
+    def capacity(self):
+        return self.workers + self.queue_depth
+
+    def active_count(self):
+        with self.lock:
+            return sum(1 for j in self.jobs.values() if not j.is_finished)
+
+    def available(self):
+        return max(0, self.capacity - self.active_count())
+
+    def create_job(self, filename, output_format, output_filename,
+                   input_name, output_name, profile=False):
+        """
+        Create a job together with its private work directory. The caller
+        is expected to save the upload to ``job.input_path`` and then pass
+        the job to :meth:`submit`. With profile, a timing report of the
+        conversion is kept in the work directory.
+        """
+        work_dir = tempfile.mkdtemp(prefix='ebook-converter-job-')
+        profile_path = os.path.join(work_dir, 'profile.json') \
+            if profile else None
+        return Job(filename, output_format, work_dir,
+                   os.path.join(work_dir, input_name),
+                   os.path.join(work_dir, output_name), output_filename,
+                   profile_path)
+
+    def submit(self, job):
+        self.expire()
+        with self.lock:
+            active = sum(1 for j in self.jobs.values() if not j.is_finished)
+            if active >= self.capacity:
+                raise QueueFull('Too many conversions in progress')
+            self.jobs[job.id] = job
+            job.future = self._pool.submit(_run_conversion, job.id,
+                                           job.input_path, job.output_path,
+                                           job.output_format,
+                                           job.profile_path)
+        job.future.add_done_callback(
+            lambda future, job=job: self._job_done(job, future))
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Pending jobs never start, running jobs are aborted at
+        the next progress report of their Plumber.
+        """
+        job = self.get(job_id)
+        if job is None or job.is_finished:
+            return job
+        if job.future is not None and job.future.cancel():
+            # Never reached a worker, the done callback finishes the job
+            return job
+        self._cancelled[job.id] = True
+        job.message = 'Cancelling...'
+        return job
+
+    def wait(self, jobs, timeout=None):
+        """
+        Block until all given jobs are finished and their final state is
+        recorded.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        for job in jobs:
+            if job.future is None:
+                continue
+            remaining = None if deadline is None else \
+                max(0, deadline - time.time())
+            job.done.wait(remaining)
+        return jobs
+
+    def remove(self, job_id):
+        """Forget a finished job and delete its work directory."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or not job.is_finished:
+                return False
+            del self.jobs[job_id]
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+        return True
+
+    def expire(self):
+        """Remove finished jobs whose results are older than result_ttl."""
+        now = time.time()
+        with self.lock:
+            expired = [j.id for j in self.jobs.values() if j.is_finished
+                       and now - j.finished > self.result_ttl]
+        for job_id in expired:
+            self.remove(job_id)
+
+    def shutdown(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._progress_queue.put(None)
+        self._listener.join()
+        self._manager.shutdown()
+        for job_id in list(self.jobs):
+            self.remove(job_id)
+
+    def _listen(self):
+        while True:
+            try:
+                item = self._progress_queue.get()
+            except (EOFError, OSError):
+                break
+            if item is None:
+                break
+            job_id, fraction, msg = item
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None or job.is_finished:
+                    continue
+                if job.state == PENDING:
+                    job.state = RUNNING
+                    job.started = time.time()
+                job.progress = max(job.progress, min(fraction, 1.0))
+                if msg:
+                    job.message = msg
+
+    def _job_done(self, job, future):
+        if future.cancelled():
+            state, error = CANCELLED, None
+        else:
+            exc = future.exception()
+            if exc is not None:
+                state, error = FAILED, str(exc)
+            else:
+                state, error = future.result()
+        if state == CANCELLED:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+        with self.lock:
+            job.error = error
+            if state == DONE:
+                job.progress = 1.0
+            elif state == CANCELLED:
+                job.message = 'Cancelled'
+            job.finished = time.time()
+            job.state = state
+        try:
+            self._cancelled.pop(job.id, None)
+        finally:
+            # Also when the manager is already shut down
+            job.done.set()
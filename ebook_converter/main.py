@@ -4,7 +4,6 @@ import os
 import sys
 
 from ebook_converter import logging
-from ebook_converter.ebooks.conversion.plumber import Plumber
 
 
 LOG = logging.default_log
@@ -24,7 +23,12 @@ def progress_bar(frac, msg=''):
         LOG.info('%d%% %s' % (percent, msg))
 
 
-def create_option_parser(args):
+def create_option_parser(args, report_progress=None):
+    # Imported here, so that --connect does not pay for the conversion
+    # pipeline
+    from ebook_converter.ebooks.conversion.cache import ResultCache
+    from ebook_converter.ebooks.conversion.plumber import Plumber
+    from ebook_converter.ebooks.conversion.profiling import PipelineProfile
 
     # parser = option_parser()
 
@@ -33,18 +37,33 @@ def create_option_parser(args):
     if os.path.abspath(input_file) == os.path.abspath(output_file):
         raise ValueError('Input file is the same as the output file')
 
+    result_cache = None
+    cache_dir = getattr(args, 'cache_dir', None) or \
+        os.environ.get('EBOOK_CONVERTER_CACHE_DIR')
+    if cache_dir:
+        cache_size = getattr(args, 'cache_size', None) or \
+            int(os.environ.get('EBOOK_CONVERTER_CACHE_SIZE', 1024))
+        result_cache = ResultCache(cache_dir, cache_size * 1024 * 1024)
+
+    profile = None
+    if getattr(args, 'profile', None):
+        profile = PipelineProfile(
+            cprofile=getattr(args, 'profile_cprofile', False))
+
     # TODO(gryf): Plumber has to be imported late, because first mimetypes
     # needs to be updated.
-    plumber = Plumber(input_file, output_file, LOG, progress_bar)
+    plumber = Plumber(input_file, output_file, LOG,
+                      report_progress or progress_bar,
+                      result_cache=result_cache, profile=profile)
     # add_input_output_options(parser, plumber)
     # add_pipeline_options(parser, plumber)
 
     return plumber
 
 
-def run(args):
+def run(args, report_progress=None):
 
-    plumber = create_option_parser(args)
+    plumber = create_option_parser(args, report_progress)
 
     # TODO(gryf): perhaps there is a need to recreate commandline options for
     # certain formats - for sure it's needed to consider if they have some
@@ -61,7 +80,19 @@ def run(args):
     # for n in parser.options_iter() if n.dest]
     # plumber.merge_ui_recommendations(recommendations)
 
-    plumber.run()
+    try:
+        plumber.run()
+    finally:
+        if plumber.profile is not None:
+            # Also written for failed conversions, to see where they failed.
+            # Failing to write it must not hide the error of the conversion.
+            try:
+                plumber.profile.dump(args.profile)
+            except Exception as e:
+                LOG.error('Failed to save the conversion profile to %s: %s',
+                          args.profile, e)
+            else:
+                LOG.info('Conversion profile saved to %s', args.profile)
 
     LOG.info('Output saved to %s', plumber.output)
 
@@ -70,17 +101,68 @@ def run(args):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('from_file', help="Input file to be converted")
-    parser.add_argument('to_file', help="Output file to be written to")
+    parser.add_argument('from_file', nargs='?',
+                        help="Input file to be converted")
+    parser.add_argument('to_file', nargs='?',
+                        help="Output file to be written to")
     parser.add_argument('-v', '--verbose', action='count', default=0,
                         help='be verbose. Adding more "v" will increase '
                         'verbosity')
     parser.add_argument('-q', '--quiet', action='count', default=0,
                         help='suppress output. Adding more "q" will make '
                         'boxpy to shut up.')
+    parser.add_argument('--cache-dir', help='Reuse the output of identical '
+                        'earlier conversions stored in this directory, and '
+                        'store the output of this one there. Defaults to '
+                        'the EBOOK_CONVERTER_CACHE_DIR environment variable, '
+                        'the cache is disabled if neither is set')
+    parser.add_argument('--cache-size', type=int,
+                        help='Maximum size of the conversion cache in MB, '
+                        'least recently used results are removed first '
+                        '(default: 1024)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Write the time, CPU time, memory and number '
+                        'of items of every stage of the conversion to FILE '
+                        'as JSON')
+    parser.add_argument('--profile-cprofile', action='store_true',
+                        help='Also run every stage under cProfile and add '
+                        'its most expensive functions to the --profile '
+                        'report')
+    parser.add_argument('--serve', metavar='SOCKET',
+                        help='Run as a daemon converting the books sent to '
+                        'the Unix domain socket SOCKET with --connect, in '
+                        'worker processes that are started once')
+    parser.add_argument('--connect', metavar='SOCKET',
+                        help='Convert with the daemon started with --serve '
+                        'SOCKET instead of in this process')
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes of the daemon '
+                        '(default: one per CPU)')
+    parser.add_argument('--max-jobs', type=int, default=100,
+                        help='Replace a worker of the daemon after this '
+                        'many conversions (default: 100)')
+    parser.add_argument('--max-memory', type=int, default=1024,
+                        help='Replace a worker of the daemon once its '
+                        'memory use grew by this many MB (default: 1024)')
 
     args = parser.parse_args()
+    if args.profile_cprofile and not args.profile:
+        parser.error('--profile-cprofile requires --profile')
+    if args.serve and args.connect:
+        parser.error('--serve and --connect are exclusive')
+    if args.serve:
+        if args.from_file or args.to_file:
+            parser.error('--serve does not take input and output files')
+    elif not args.to_file:
+        parser.error('the input and output files are required')
 
     LOG.set_verbose(args.verbose, args.quiet)
 
+    if args.serve:
+        from ebook_converter import server
+        sys.exit(server.serve(args.serve, args.workers, args.max_jobs,
+                              args.max_memory))
+    if args.connect:
+        from ebook_converter import server
+        sys.exit(server.connect(args.connect, args))
     sys.exit(run(args))
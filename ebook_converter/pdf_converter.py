@@ -307,7 +307,8 @@ def parse_css_for_colors(css_content):
     return styles
 
 
-def convert_to_pdf_via_epub(input_file, output_file, verbose=0, quiet=0):
+def convert_to_pdf_via_epub(input_file, output_file, verbose=0, quiet=0,
+                            report_progress=None, profile=None):
     """
     Convert ebook to PDF using reportlab with Chinese font support.
     
@@ -321,6 +322,10 @@ def convert_to_pdf_via_epub(input_file, output_file, verbose=0, quiet=0):
         output_file: Path to output PDF file
         verbose: Verbosity level (0-2)
         quiet: Quiet level (0-2)
+        report_progress: Optional callable(fraction, msg) receiving the
+            progress of the intermediate EPUB conversion
+        profile: Optional path to write the JSON timing report of the
+            intermediate EPUB conversion to
     
     Returns:
         0 on success, non-zero on failure
@@ -511,6 +516,7 @@ def convert_to_pdf_via_epub(input_file, output_file, verbose=0, quiet=0):
                     self.to_file = to_file
                     self.verbose = verbose
                     self.quiet = quiet
+                    self.profile = profile
             
             args = Args(input_file, epub_path)
             
@@ -519,7 +525,7 @@ def convert_to_pdf_via_epub(input_file, output_file, verbose=0, quiet=0):
                 print("1% Converting input to EPUB...")
             
             try:
-                result = ebook_convert_run(args)
+                result = ebook_convert_run(args, report_progress)
                 if result != 0:
                     print(f"EPUB conversion failed with code {result}")
                     return result
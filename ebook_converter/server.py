@@ -0,0 +1,287 @@
+"""
+Warm conversion daemon.
+
+``ebook-converter --serve SOCKET`` imports the conversion pipeline, the
+plugins and the libraries they use once, then forks a pool of worker
+processes accepting conversions on a Unix domain socket. Each conversion
+runs :func:`ebook_converter.main.run` in an already warm worker, instead of
+paying for the imports and the initialization of a new process.
+``ebook-converter --connect SOCKET input output`` sends a conversion to the
+daemon and prints its log and progress as it runs.
+
+The protocol is one JSON object per line. The client sends the request,
+made of the REQUEST_FIELDS of the command line, with absolute paths. The
+worker answers with ``{"log": level, "message": ...}`` and
+``{"progress": fraction, "message": ...}`` lines, followed by
+``{"status": exit_code}``.
+
+Workers are replaced after max_jobs conversions, or as soon as their memory
+use grew by more than max_memory since they started, so that leaks and
+fragmentation do not accumulate.
+"""
+import json
+import logging
+import os
+import socket
+
+from ebook_converter import logging as ec_logging
+
+
+LOG = ec_logging.default_log
+
+DEFAULT_MAX_JOBS = 100
+DEFAULT_MAX_MEMORY = 1024  # MB
+
+# The arguments of the command line sent for a conversion, with defaults
+REQUEST_FIELDS = {
+    'from_file': None,
+    'to_file': None,
+    'verbose': 0,
+    'quiet': 0,
+    'cache_dir': None,
+    'cache_size': None,
+    'profile': None,
+    'profile_cprofile': False,
+}
+PATH_FIELDS = ('from_file', 'to_file', 'cache_dir', 'profile')
+
+# Imported before forking, so that the workers start with them loaded
+WARM_MODULES = ('lxml.etree', 'lxml.html', 'css_parser', 'html5_parser',
+                'PIL.Image', 'ebook_converter.ebooks.oeb.base',
+                'ebook_converter.ebooks.oeb.transforms.flatcss')
+
+
+def memory_usage():
+    """Peak resident memory of this process, in bytes."""
+    import resource
+    import sys
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def warm_up():
+    """Do the work every conversion would otherwise repeat."""
+    import importlib
+    from ebook_converter.customize import ui
+    from ebook_converter.ebooks.conversion import plumber  # noqa
+
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            LOG.warning('Failed to import %s: %s', name, e)
+    # Load the format plugins, only the ones used are imported otherwise
+    list(ui.initialized_plugins())
+    try:
+        from ebook_converter.utils.fonts.scanner import font_scanner
+    except Exception as e:
+        LOG.warning('Failed to scan fonts: %s', e)
+    else:
+        # The scan runs in a thread, which does not survive forking
+        font_scanner.join()
+
+
+# Worker process side {{{
+
+class ForwardHandler(logging.Handler):
+    """Send the records of the conversion log to the client."""
+
+    def __init__(self, send):
+        logging.Handler.__init__(self)
+        self.send = send
+
+    def emit(self, record):
+        try:
+            self.send({'log': record.levelno, 'message': self.format(record)})
+        except Exception:
+            self.handleError(record)
+
+
+def convert(request, send):
+    """Run the conversion described by request, return its exit code."""
+    import argparse
+    import traceback
+    from ebook_converter import ptempfile
+    from ebook_converter.main import run
+
+    args = argparse.Namespace(**REQUEST_FIELDS)
+    for name in REQUEST_FIELDS:
+        if name in request:
+            setattr(args, name, request[name])
+    if not args.from_file or not args.to_file:
+        send({'log': logging.ERROR,
+              'message': 'The input and output files are required'})
+        return 1
+
+    def report_progress(fraction, msg=''):
+        send({'progress': fraction, 'message': msg})
+
+    handler = ForwardHandler(send)
+    handlers, level = LOG.handlers[:], LOG.level
+    LOG.handlers[:] = [handler]
+    LOG.set_verbose(args.verbose, args.quiet)
+    # A temporary directory per conversion, removed once it is done
+    ptempfile.reset_base_dir()
+    try:
+        return run(args, report_progress)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    except Exception:
+        LOG.error('Conversion failed:\n%s', traceback.format_exc())
+        return 1
+    finally:
+        ptempfile.remove_dir(ptempfile.base_dir())
+        LOG.handlers[:] = handlers
+        LOG.setLevel(level)
+
+
+def handle(conn):
+    stream = conn.makefile('rwb')
+
+    def send(msg):
+        stream.write(json.dumps(msg).encode('utf-8') + b'\n')
+        stream.flush()
+
+    try:
+        line = stream.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+        except ValueError:
+            send({'log': logging.ERROR, 'message': 'Invalid request'})
+            send({'status': 1})
+            return
+        send({'status': convert(request, send)})
+    except OSError:
+        # The client went away
+        pass
+    finally:
+        stream.close()
+
+
+def worker(server, max_jobs, max_memory):
+    import signal
+    # Stopping is up to the daemon, which terminates the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    baseline = memory_usage()
+    for _ in range(max_jobs):
+        conn, _ = server.accept()
+        with conn:
+            handle(conn)
+        if memory_usage() - baseline > max_memory:
+            break
+# }}}
+
+
+def listen(path):
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            # Left behind by a daemon that did not shut down cleanly
+            os.remove(path)
+        else:
+            raise SystemExit('A daemon is already listening on %s' % path)
+        finally:
+            probe.close()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(128)
+    return server
+
+
+def serve(path, workers=None, max_jobs=DEFAULT_MAX_JOBS,
+          max_memory=DEFAULT_MAX_MEMORY):
+    """
+    Serve conversions on the Unix domain socket at path until interrupted.
+    max_memory is in MB.
+    """
+    import multiprocessing
+    import multiprocessing.connection
+    import signal
+
+    workers = workers or os.cpu_count() or 1
+    path = os.path.abspath(path)
+    warm_up()
+    server = listen(path)
+    ctx = multiprocessing.get_context('fork')
+    processes = {}
+    stopping = []
+
+    def stop(*args):
+        stopping.append(True)
+
+    def start():
+        # Not daemonic, daemonic processes cannot start the process pools
+        # the conversions use, they are terminated below
+        p = ctx.Process(target=worker, args=(server, max_jobs,
+                                             max_memory * 1024 * 1024))
+        p.start()
+        processes[p.sentinel] = p
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    LOG.warning('Serving conversions on %s with %d workers', path, workers)
+    try:
+        for _ in range(workers):
+            start()
+        while not stopping:
+            for sentinel in multiprocessing.connection.wait(
+                    list(processes), timeout=1):
+                processes.pop(sentinel).join()
+                if not stopping:
+                    # Recycled, or died
+                    start()
+    finally:
+        for p in processes.values():
+            p.terminate()
+        for p in processes.values():
+            p.join()
+        server.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return 0
+
+
+def connect(path, args):
+    """
+    Send the conversion described by the command line args to the daemon
+    listening at path, log its output, return its exit code.
+    """
+    request = {}
+    for name in REQUEST_FIELDS:
+        value = getattr(args, name, None)
+        if value is not None and name in PATH_FIELDS:
+            value = os.path.abspath(os.path.expanduser(value))
+        request[name] = value
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except OSError as e:
+        LOG.error('Cannot connect to the daemon at %s: %s', path, e)
+        return 1
+    with conn, conn.makefile('rwb') as stream:
+        stream.write(json.dumps(request).encode('utf-8') + b'\n')
+        stream.flush()
+        for line in stream:
+            msg = json.loads(line)
+            if 'status' in msg:
+                return msg['status']
+            if 'progress' in msg:
+                if msg['message']:
+                    LOG.info('%d%% %s', int(msg['progress'] * 100),
+                             msg['message'])
+            else:
+                LOG.log(msg['log'], '%s', msg['message'])
+    LOG.error('The daemon closed the connection before the end of the '
+              'conversion')
+    return 1
@@ -0,0 +1,191 @@
+"""
+On disk index of the metadata of the fonts installed on the system.
+
+The index is an append only log of msgpack records: a change to a single font
+file only costs appending its own record, instead of rewriting the whole
+cache. Along with the metadata of each font, the characters it has glyphs
+for are stored as compressed range bounds, so that finding a font able to
+render some text does not need to read any font file. It also stores the
+family to faces lookup built from the fonts, so that processes can use it
+without rebuilding it. The log is compacted once
+it has grown to be much larger than the live data.
+"""
+import hashlib
+import os
+import tempfile
+from bisect import bisect_right
+
+import msgpack
+from filelock import FileLock
+
+from ebook_converter.utils.fonts.metadata import FontMetadata, UnsupportedFont
+from ebook_converter.utils.fonts.sfnt.cmap import CmapTable
+
+
+INDEX_NAME = 'ebook-converter-font-index.msgpack'
+
+
+def index_path():
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~/'), '.cache')
+    return os.path.join(base, INDEX_NAME)
+
+
+def read_font_metadata(path):
+    """
+    Return the metadata of the font file at path, an empty dict for
+    unsupported fonts.
+    """
+    with open(path, 'rb') as f:
+        try:
+            fm = FontMetadata(f)
+        except UnsupportedFont:
+            return {}
+        coverage = read_coverage(f, fm.tables)
+    data = fm.to_dict()
+    data['path'] = path
+    data['coverage'] = coverage
+    return data
+
+
+def read_coverage(f, tables):
+    """
+    Return the range bounds of the characters the font in the file f has
+    glyphs for, tables is the table directory of the font, as read by
+    FontMetadata.
+    """
+    if b'cmap' not in tables:
+        return []
+    offset, length = tables[b'cmap'][:2]
+    f.seek(offset)
+    try:
+        return CmapTable(f.read(length)).get_coverage()
+    except Exception:
+        # A broken cmap supports nothing, as for supports_text()
+        return []
+
+
+def covers(coverage, codes):
+    """True if all the character codes are in the range bounds coverage."""
+    # Codes are covered when they fall after a start and before the
+    # matching stop, that is at an odd position in the bounds
+    return all(bisect_right(coverage, c) & 1 for c in codes)
+
+
+def safe_read_font_metadata(path):
+    # Run in worker processes, errors are returned rather than raised so
+    # that one bad font does not abort the whole scan
+    try:
+        return path, read_font_metadata(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def families_key(folders, fileids):
+    """Identify the set of fonts and folders a family lookup was built for."""
+    h = hashlib.sha1()
+    for x in folders:
+        h.update(x.encode('utf-8') + b'\0')
+    h.update(b'\0')
+    for x in sorted(fileids):
+        h.update(x.encode('utf-8') + b'\0')
+    return h.hexdigest()
+
+
+class FontIndex(object):
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        self.fonts = {}
+        self.families = None
+        self.records = 0
+        self.valid = False
+
+    def lock(self):
+        return FileLock(self.path + '.lock')
+
+    def load(self):
+        """
+        Read the index. fonts maps file ids to metadata and families is
+        the last stored family lookup, as a (key, family_map, font_families)
+        tuple, where family_map maps lower cased family names to file ids.
+        """
+        self.fonts, self.families, self.records = {}, None, 0
+        self.valid = False
+        try:
+            f = open(self.path, 'rb')
+        except EnvironmentError:
+            return
+        with f:
+            unpacker = msgpack.Unpacker(f, raw=False, use_list=True,
+                                        strict_map_key=False)
+            try:
+                if next(unpacker) != ['version', self.version]:
+                    return
+                for record in unpacker:
+                    kind = record[0]
+                    if kind == 'font':
+                        self.fonts[record[1]] = record[2]
+                    elif kind == 'drop':
+                        self.fonts.pop(record[1], None)
+                    elif kind == 'families':
+                        self.families = tuple(record[1:])
+                    self.records += 1
+            except Exception:
+                # Truncated by an interrupted write, what was read before
+                # is still good, the next update rewrites the file
+                return
+        self.valid = True
+
+    def update(self, added=None, removed=(), families=None):
+        """
+        Record fonts that were added (a mapping of file id to metadata) or
+        removed, and optionally a new family lookup.
+        """
+        records = [('font', k, v) for k, v in (added or {}).items()]
+        records.extend(('drop', k) for k in removed)
+        if families is not None:
+            records.append(('families',) + tuple(families))
+            self.families = tuple(families)
+        if not records:
+            return
+        self.fonts.update(added or {})
+        for k in removed:
+            self.fonts.pop(k, None)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock():
+            self.records += len(records)
+            if not self.valid or self.records > 2 * len(self.fonts) + 64:
+                self.rewrite()
+                return
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(msgpack.packb(r, use_bin_type=True)
+                                 for r in records))
+
+    def rewrite(self):
+        """Write out the live records only. Must be called with the lock
+        held."""
+        records = [('version', self.version)]
+        records.extend(('font', k, v) for k, v in self.fonts.items())
+        if self.families is not None:
+            records.append(('families',) + self.families)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                   prefix='.font-index-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for r in records:
+                    f.write(msgpack.packb(r, use_bin_type=True))
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.records = len(records) - 1
+        self.valid = True
+
+    def clear(self):
+        self.fonts, self.families = {}, None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock():
+            self.rewrite()
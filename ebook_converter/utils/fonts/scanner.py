@@ -1,11 +1,16 @@
 import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from threading import Thread
 
 from ebook_converter.constants_old import DEBUG
 from ebook_converter.constants_old import filesystem_encoding
-from ebook_converter.utils.fonts.metadata import FontMetadata, UnsupportedFont
-from ebook_converter.utils import config
+from ebook_converter.utils.fonts import index
+
+
+# Below this number of new font files, reading their metadata in worker
+# processes costs more than it saves
+MIN_PARALLEL_FONTS = 32
 
 
 class NoFonts(ValueError):
@@ -168,7 +173,7 @@ def build_families(cached_fonts, folders, family_attr='font-family'):
 
 class FontScanner(Thread):
 
-    CACHE_VERSION = 2
+    CACHE_VERSION = 4
 
     def __init__(self, folders=[], allowed_extensions={'ttf', 'otf'}):
         Thread.__init__(self)
@@ -242,47 +247,87 @@ class FontScanner(Thread):
 
         :return: (family name, faces) or None, None
         '''
-        from ebook_converter.utils.fonts.utils import \
-            supports_text, panose_to_css_generic_family, \
-            get_printable_characters
         if not isinstance(text, str):
             raise TypeError(u'%r is not unicode' % text)
-        text = get_printable_characters(text)
-        found = {}
+        return self.find_fonts_for_texts((text,), allowed_families,
+                                         preferred_families)[text]
+
+    def find_fonts_for_texts(self, texts,
+                             allowed_families={'serif', 'sans-serif'},
+                             preferred_families=('serif', 'sans-serif',
+                                                 'monospace', 'cursive',
+                                                 'fantasy')):
+        '''
+        Find fonts for many pieces of text at once, for example all the text
+        runs of a book. Returns a dictionary mapping each text to what
+        find_font_for_text() returns for it. Texts made of the same
+        characters are looked up only once and no font file is read, the
+        character coverage stored in the font index is used instead.
+        '''
+        from ebook_converter.utils.fonts.utils import \
+            panose_to_css_generic_family, get_printable_characters
+        charsets = {}
+        for text in texts:
+            if not isinstance(text, str):
+                raise TypeError(u'%r is not unicode' % text)
+            charsets[text] = frozenset(map(ord,
+                                           get_printable_characters(text)))
+
+        families = [(family, self.fonts_for_family(family))
+                    for family in self.find_font_families()]
+        found_for = {}
+
+        def find(codes):
+            found = {}
+            for family, faces in families:
+                faces = [face for face in faces
+                         if self.supports_codes(face, codes)]
+                if not faces:
+                    continue
+                generic_family = panose_to_css_generic_family(
+                    faces[0]['panose'])
+                if (generic_family in allowed_families or
+                        generic_family == preferred_families[0]):
+                    return (family, faces)
+                elif generic_family not in found:
+                    found[generic_family] = (family, faces)
+
+            for f in preferred_families:
+                if f in found:
+                    return found[f]
+            return None, None
 
-        def filter_faces(font):
-            try:
-                raw = self.get_font_data(font)
-                return supports_text(raw, text)
-            except Exception:
-                pass
-            return False
-
-        for family in self.find_font_families():
-            faces = list(filter(filter_faces, self.fonts_for_family(family)))
-            if not faces:
-                continue
-            generic_family = panose_to_css_generic_family(faces[0]['panose'])
-            if (generic_family in allowed_families or
-                    generic_family == preferred_families[0]):
-                return (family, faces)
-            elif generic_family not in found:
-                found[generic_family] = (family, faces)
-
-        for f in preferred_families:
-            if f in found:
-                return found[f]
-        return None, None
+        ans = {}
+        for text, codes in charsets.items():
+            if codes not in found_for:
+                found_for[codes] = find(codes)
+            ans[text] = found_for[codes]
+        return ans
+
+    def supports_codes(self, font, codes):
+        '''
+        Return True if font (as returned by fonts_for_family()) has glyphs for
+        all the character codes.
+        '''
+        coverage = font.get('coverage')
+        if coverage is not None:
+            return index.covers(coverage, codes)
+        from ebook_converter.utils.fonts.utils import supports_text
+        try:
+            return supports_text(self.get_font_data(font),
+                                 ''.join(map(chr, codes)),
+                                 has_only_printable_chars=True)
+        except Exception:
+            pass
+        return False
     # }}}
 
     def reload_cache(self):
-        if not hasattr(self, 'cache'):
-            self.cache = config.JSONConfig('ebook-converter-scanner-cache')
-        else:
-            self.cache.refresh()
-        if self.cache.get('version', None) != self.CACHE_VERSION:
-            self.cache.clear()
-        self.cached_fonts = self.cache.get('fonts', {})
+        if not hasattr(self, 'index'):
+            self.index = index.FontIndex(index.index_path(),
+                                         self.CACHE_VERSION)
+        self.index.load()
+        self.cached_fonts = dict(self.index.fonts)
 
     def run(self):
         self.do_scan()
@@ -291,6 +336,7 @@ class FontScanner(Thread):
         self.reload_cache()
         cached_fonts = self.cached_fonts.copy()
         self.cached_fonts.clear()
+        unread = {}
         for folder in self.folders:
             if not os.path.isdir(folder):
                 continue
@@ -319,43 +365,77 @@ class FontScanner(Thread):
                     # last modified timestamp have not changed.
                     self.cached_fonts[fileid] = cached_fonts[fileid]
                     continue
+                unread[fileid] = candidate
+
+        added = self.read_fonts_metadata(unread)
+        self.cached_fonts.update(added)
+        removed = set(cached_fonts) - set(self.cached_fonts)
+
+        key = index.families_key(self.folders, self.cached_fonts)
+        families = self.index.families
+        if families is not None and families[0] == key:
+            family_map, font_families = families[1:]
+            self.font_family_map = {
+                family: [self.cached_fonts[fileid] for fileid in fileids]
+                for family, fileids in family_map.items()}
+            self.font_families = tuple(font_families)
+            families = None
+        else:
+            self.build_families()
+            ids = {id(font): fileid
+                   for fileid, font in self.cached_fonts.items()}
+            families = (key,
+                        {family: [ids[id(font)] for font in fonts]
+                         for family, fonts in self.font_family_map.items()},
+                        list(self.font_families))
+
+        if added or removed or families is not None:
+            # Only record what changed since the last scan
+            try:
+                self.index.update(added, removed, families)
+            except EnvironmentError as e:
+                if DEBUG:
+                    print(f'Failed to update the font index: {e}')
+
+    def read_fonts_metadata(self, paths):
+        """
+        Read the metadata of the font files in paths, a mapping of file id
+        to path. Many files are read in a pool of worker processes, as when
+        a container with thousands of fonts is first used.
+        """
+        ans = {}
+        workers = os.cpu_count() or 1
+        if workers < 2 or len(paths) < MIN_PARALLEL_FONTS:
+            for fileid, path in paths.items():
                 try:
-                    self.read_font_metadata(candidate, fileid)
+                    ans[fileid] = index.read_font_metadata(path)
                 except Exception as e:
                     if DEBUG:
                         print(f'Failed to read metadata from font file '
-                              f'{candidate}: {e}')
-                    continue
-
-        if frozenset(cached_fonts) != frozenset(self.cached_fonts):
-            # Write out the cache only if some font files have changed
-            self.write_cache()
-
-        self.build_families()
+                              f'{path}: {e}')
+            return ans
+        chunksize = max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(index.safe_read_font_metadata,
+                                   paths.values(), chunksize=chunksize)
+            for fileid, (path, data, err) in zip(paths, results):
+                if err is None:
+                    ans[fileid] = data
+                elif DEBUG:
+                    print(f'Failed to read metadata from font file '
+                          f'{path}: {err}')
+        return ans
 
     def build_families(self):
         (self.font_family_map,
          self.font_families) = build_families(self.cached_fonts, self.folders)
 
-    def write_cache(self):
-        with self.cache:
-            self.cache['version'] = self.CACHE_VERSION
-            self.cache['fonts'] = self.cached_fonts
-
     def force_rescan(self):
         self.cached_fonts = {}
-        self.write_cache()
+        self.index.clear()
 
     def read_font_metadata(self, path, fileid):
-        with open(path, 'rb') as f:
-            try:
-                fm = FontMetadata(f)
-            except UnsupportedFont:
-                self.cached_fonts[fileid] = {}
-            else:
-                data = fm.to_dict()
-                data['path'] = path
-                self.cached_fonts[fileid] = data
+        self.cached_fonts[fileid] = index.read_font_metadata(path)
 
     def dump_fonts(self):
         self.join()
@@ -159,6 +159,49 @@ class BMPTable(object):
                     ans[code] = glyph_id
         return ans
 
+    def get_code_map(self):
+        '''
+        Return a dict mapping every character code in the table to its glyph
+        id, the same as get_glyph_ids() would give, but much faster for many
+        codes.
+        '''
+        ans = {}
+        for i, ec in enumerate(self.end_count):
+            sc = self.start_count[i]
+            ro, delta = self.range_offset[i], self.id_delta[i]
+            for code in range(sc, ec + 1):
+                # Segments may overlap, as in get_glyph_ids() the first one
+                # containing a code decides its glyph
+                if code in ans:
+                    continue
+                if ro == 0:
+                    glyph_id = delta + code
+                else:
+                    idx = ro//2 + (code - sc) + i - self.array_len
+                    try:
+                        glyph_id = self.glyph_id_map[idx]
+                    except IndexError:
+                        # Broken table, treat the code as unmapped
+                        glyph_id = 0
+                    if glyph_id != 0:
+                        glyph_id += delta
+                ans[code] = glyph_id % 0x10000
+        return ans
+
+    def get_coverage(self):
+        '''
+        Return the character codes mapped to a glyph as a sorted list of
+        range bounds, [start1, stop1, start2, stop2, ...] with stop excluded.
+        '''
+        ans = []
+        for code in sorted(code for code, glyph_id in
+                           self.get_code_map().items() if glyph_id):
+            if ans and ans[-1] == code:
+                ans[-1] = code + 1
+            else:
+                ans.extend((code, code + 1))
+        return ans
+
 
 class CmapTable(UnknownTable):
 
@@ -179,6 +222,7 @@ class CmapTable(UnknownTable):
             recs.append((platform, encoding, table_offset))
 
         self.bmp_table = None
+        self._code_map = None
 
         for i in range(len(recs)):
             platform, encoding, offset = recs[i]
@@ -200,12 +244,28 @@ class CmapTable(UnknownTable):
             raise UnsupportedFont('This font has no Windows BMP cmap subtable.'
                     ' Most likely a special purpose font.')
         chars = sorted(set(chars))
+        if len(chars) > 64 or self._code_map is not None:
+            # Looking up each code walks the segments, for many codes map
+            # them all at once
+            code_map = self.get_code_map()
+            glyph_ids = (code_map.get(code, 0) for code in chars)
+        else:
+            glyph_ids = self.bmp_table.get_glyph_ids(chars)
         ans = OrderedDict()
-        for i, glyph_id in enumerate(self.bmp_table.get_glyph_ids(chars)):
+        for i, glyph_id in enumerate(glyph_ids):
             if glyph_id > 0:
                 ans[chars[i]] = glyph_id
         return ans
 
+    def get_code_map(self):
+        '''
+        A mapping of all character codes in the font to glyph ids, computed
+        once.
+        '''
+        if self._code_map is None:
+            self._code_map = self.bmp_table.get_code_map()
+        return self._code_map
+
     def get_glyph_map(self, glyph_ids):
         '''
         Get a mapping of character codes to glyph ids for the specified glyph
@@ -217,8 +277,19 @@ class CmapTable(UnknownTable):
         glyph_ids = frozenset(glyph_ids)
         return self.bmp_table.get_glyph_map(glyph_ids)
 
+    def get_coverage(self):
+        '''
+        Get the character codes supported by the font, as range bounds, see
+        :meth:`BMPTable.get_coverage`. Empty if the font has no Windows BMP
+        cmap subtable.
+        '''
+        if self.bmp_table is None:
+            return []
+        return self.bmp_table.get_coverage()
+
     def set_character_map(self, cmap):
         self.version, self.num_tables = 0, 1
+        self._code_map = None
         fmt = b'>7H'
         codes = sorted(cmap)
 
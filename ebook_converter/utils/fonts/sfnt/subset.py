@@ -1,5 +1,9 @@
+import hashlib
+import os
+import threading
 import traceback
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from operator import itemgetter
 from functools import partial
 
@@ -8,6 +12,10 @@ from ebook_converter.utils.fonts.sfnt.container import Sfnt
 from ebook_converter.utils.fonts.sfnt.errors import UnsupportedFont, NoGlyphs
 
 
+# Below this number of fonts to subset, starting worker processes costs more
+# than it saves
+MIN_PARALLEL_FONTS = 4
+
 # TrueType outlines {{{
 
 
@@ -104,9 +112,7 @@ def safe_ord(x):
     return ord_string(str(x))[0]
 
 
-def subset(raw, individual_chars, ranges=(), warnings=None):
-    warn = partial(do_warn, warnings)
-
+def char_codes(individual_chars, ranges=()):
     chars = set(map(safe_ord, individual_chars))
     for r in ranges:
         chars |= set(range(safe_ord(r[0]), safe_ord(r[1])+1))
@@ -114,9 +120,51 @@ def subset(raw, individual_chars, ranges=(), warnings=None):
     # Always add the space character for ease of use from the command line
     if safe_ord(' ') not in chars:
         chars.add(safe_ord(' '))
+    return chars
+
+
+class ParsedFont(object):
+
+    '''
+    The tables of a font that subsetting reads but does not modify, parsed
+    once so that they can be used to subset the font many times. sfnt is an
+    optional, already parsed, :class:`Sfnt` of raw.
+    '''
+
+    def __init__(self, raw, sfnt=None):
+        if sfnt is None:
+            sfnt = Sfnt(raw)
+        self.cmap = sfnt.get(b'cmap')
+        self.gsub = sfnt.get(b'GSUB')
+        self.gsub_error = None
+        if self.gsub is not None:
+            try:
+                self.gsub.decompile()
+            except UnsupportedFont as e:
+                self.gsub_error = ('Usupported GSUB table: %s'%e,)
+            except Exception:
+                self.gsub_error = ('Failed to decompile GSUB table:',
+                                   traceback.format_exc())
+
+
+def subset(raw, individual_chars, ranges=(), warnings=None, parsed=None):
+    '''
+    Subset the font raw to the glyphs needed for individual_chars and the
+    ranges of characters. Returns the subset font and the sizes of its tables
+    before and after. parsed is an optional :class:`ParsedFont` for raw, to
+    avoid parsing it again.
+    '''
+    return subset_codes(raw, char_codes(individual_chars, ranges), warnings,
+                        parsed)
 
+
+def subset_codes(raw, chars, warnings=None, parsed=None):
+    warn = partial(do_warn, warnings)
     sfnt = Sfnt(raw)
     old_sizes = sfnt.sizes()
+    if parsed is None:
+        # Used once, so the tables of the font being subset can be read
+        parsed = ParsedFont(raw, sfnt)
 
     # Remove the Digital Signature table since it is useless in a subset
     # font anyway
@@ -139,17 +187,19 @@ def subset(raw, individual_chars, ranges=(), warnings=None):
         raise UnsupportedFont('This font has no cmap table')
 
     # Get mapping of chars to glyph ids for all specified chars
-    character_map = cmap.get_character_map(chars)
+    character_map = parsed.cmap.get_character_map(chars)
 
     extra_glyphs = set()
 
     if b'GSUB' in sfnt:
         # Parse all substitution rules to ensure that glyphs that can be
         # substituted for the specified set of glyphs are not removed
-        gsub = sfnt[b'GSUB']
         try:
-            gsub.decompile()
-            extra_glyphs = gsub.all_substitutions(character_map.values())
+            if parsed.gsub_error is not None:
+                warn(*parsed.gsub_error)
+            else:
+                extra_glyphs = parsed.gsub.all_substitutions(
+                    character_map.values())
         except UnsupportedFont as e:
             warn('Usupported GSUB table: %s'%e)
         except Exception:
@@ -180,6 +230,180 @@ def subset(raw, individual_chars, ranges=(), warnings=None):
     raw, new_sizes = sfnt()
     return raw, old_sizes, new_sizes
 
+
+# Caching {{{
+
+
+def font_digest(raw):
+    return hashlib.sha256(raw).hexdigest()
+
+
+class SubsetCache(object):
+
+    '''
+    In memory caches for subsetting the same fonts again and again, as when
+    the same fonts are embedded in many books converted by one process. The
+    parsed tables of the most recently used fonts are kept, keyed by the
+    digest of the font, as are the subset fonts, keyed by the digest and the
+    characters kept. Both are bounded, least recently used entries are
+    evicted first. Subset fonts are bounded by their total size and, as
+    failures take no space, by their number.
+    '''
+
+    def __init__(self, max_fonts=16, max_size=64 * 1024 * 1024,
+                 max_results=1024):
+        self.max_fonts, self.max_size = max_fonts, max_size
+        self.max_results = max_results
+        self.lock = threading.Lock()
+        self.fonts = OrderedDict()
+        self.results = OrderedDict()
+        self.size = 0
+
+    def key(self, digest, chars):
+        h = hashlib.sha256(digest.encode('ascii'))
+        h.update(','.join(map(str, sorted(chars))).encode('ascii'))
+        return h.hexdigest()
+
+    def parsed_font(self, raw, digest):
+        with self.lock:
+            ans = self.fonts.pop(digest, None)
+        if ans is None:
+            ans = ParsedFont(raw)
+        with self.lock:
+            self.fonts[digest] = ans
+            while len(self.fonts) > self.max_fonts:
+                self.fonts.popitem(last=False)
+        return ans
+
+    def get(self, key):
+        '''
+        Return the result of subsetting for key, or the class and arguments
+        of the exception it raised, None if it is not in the cache.
+        '''
+        with self.lock:
+            try:
+                self.results.move_to_end(key)
+            except KeyError:
+                return None
+            return self.results[key][1]
+
+    def put(self, key, result):
+        size = len(result[0]) if isinstance(result[0], bytes) else 0
+        if size > self.max_size:
+            return
+        with self.lock:
+            old = self.results.pop(key, None)
+            if old is not None:
+                self.size -= old[0]
+            self.results[key] = (size, result)
+            self.size += size
+            while self.size > self.max_size or \
+                    len(self.results) > self.max_results:
+                self.size -= self.results.popitem(last=False)[1][0]
+
+    def clear(self):
+        with self.lock:
+            self.fonts.clear()
+            self.results.clear()
+            self.size = 0
+
+
+subset_cache = SubsetCache()
+
+
+def freeze_result(result):
+    # Failures are kept as the class and arguments of the exception, not the
+    # exception itself, raising the same instance again and again would chain
+    # its tracebacks
+    if isinstance(result, Exception):
+        return type(result), result.args
+    return result
+
+
+def copy_result(result):
+    if not isinstance(result[0], bytes):
+        cls, args = result
+        return cls(*args)
+    raw, old_sizes, new_sizes = result
+    return raw, OrderedDict(old_sizes), OrderedDict(new_sizes)
+
+
+def safe_subset_codes(raw, chars):
+    # Run in worker processes, fonts that cannot be subset are returned
+    # rather than raised, so that the results can be cached, warnings are
+    # returned to be reported by the parent
+    warnings = []
+    try:
+        return subset_codes(raw, chars, warnings), warnings
+    except (NoGlyphs, UnsupportedFont) as e:
+        return e, warnings
+
+
+def cached_subset(raw, individual_chars, ranges=(), warnings=None):
+    '''
+    The same as :func:`subset`, but using :data:`subset_cache`, so that
+    subsetting a font again to the same characters is instant and the font
+    is not parsed again for other characters.
+    '''
+    ans = subset_many(((raw, individual_chars),), ranges, warnings,
+                      workers=1)[0]
+    if isinstance(ans, Exception):
+        raise ans
+    return ans
+
+
+def subset_many(fonts, ranges=(), warnings=None, workers=None):
+    '''
+    Subset several fonts, fonts is a sequence of (raw, individual_chars)
+    pairs. Fonts that are not in :data:`subset_cache` are subset
+    concurrently, in a pool of worker processes, if there are enough of
+    them. Returns, in order, for each font either what :func:`subset` does
+    or the :class:`NoGlyphs` or :class:`UnsupportedFont` exception raised.
+    '''
+    ans, todo, pending = [], [], {}
+    for raw, individual_chars in fonts:
+        chars = char_codes(individual_chars, ranges)
+        digest = font_digest(raw)
+        key = subset_cache.key(digest, chars)
+        result = subset_cache.get(key)
+        if result is None:
+            # The same font and characters are only subset once per batch
+            if key in pending:
+                pending[key].append(len(ans))
+            else:
+                pending[key] = [len(ans)]
+                todo.append((len(ans), key, raw, chars, digest))
+        ans.append(result)
+
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(todo) < MIN_PARALLEL_FONTS:
+        for i, key, raw, chars, digest in todo:
+            parsed = subset_cache.parsed_font(raw, digest)
+            try:
+                ans[i] = subset_codes(raw, chars, warnings, parsed)
+            except (NoGlyphs, UnsupportedFont) as e:
+                ans[i] = freeze_result(e)
+            subset_cache.put(key, ans[i])
+            for j in pending[key]:
+                ans[j] = ans[i]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(safe_subset_codes,
+                                   [x[2] for x in todo], [x[3] for x in todo])
+            for (i, key, raw, chars, digest), (result, w) in zip(todo,
+                                                                 results):
+                if warnings is None:
+                    for line in w:
+                        print(line)
+                else:
+                    warnings.extend(w)
+                result = freeze_result(result)
+                for j in pending[key]:
+                    ans[j] = result
+                subset_cache.put(key, result)
+    return [copy_result(result) for result in ans]
+# }}}
+
 # CLI {{{
 
 
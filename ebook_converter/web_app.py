@@ -4,19 +4,34 @@ Web interface for ebook-converter.
 Provides a user-friendly GUI for converting ebooks.
 """
 import os
-import tempfile
 import shutil
+import threading
 from pathlib import Path
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, url_for
 
 # Import the conversion function directly
 from ebook_converter.main import run as ebook_convert_run
 from ebook_converter.pdf_converter import convert_to_pdf_via_epub
+from ebook_converter import jobs
+from ebook_converter.downloads import WorkDir, stream_file
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+# Conversion worker processes (default: one per CPU core)
+app.config['CONVERSION_WORKERS'] = int(
+    os.environ.get('EBOOK_CONVERTER_WORKERS', 0)) or os.cpu_count()
+# Jobs allowed to wait for a free worker before uploads are rejected
+app.config['CONVERSION_QUEUE_DEPTH'] = int(
+    os.environ.get('EBOOK_CONVERTER_QUEUE_DEPTH',
+                   4 * app.config['CONVERSION_WORKERS']))
+# Seconds a finished job's result is kept for download
+app.config['CONVERSION_RESULT_TTL'] = int(
+    os.environ.get('EBOOK_CONVERTER_RESULT_TTL', 3600))
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
 
 # Supported formats
 INPUT_FORMATS = {
@@ -53,6 +68,77 @@ def allowed_output_format(format_ext):
     return format_ext.lower() in OUTPUT_FORMATS
 
 
+def output_names(filename, output_format):
+    """
+    Return (output_filename, safe_output_filename) for an uploaded file.
+
+    The first one preserves the original (e.g. Chinese) name and is used for
+    the download, the second one is safe to use on the local filesystem.
+    """
+    output_filename = Path(filename).stem + '.' + output_format
+    safe_output_filename = secure_filename(output_filename)
+    # If secure_filename removed all characters, use a fallback
+    if not safe_output_filename or safe_output_filename == '.' + output_format:
+        safe_output_filename = 'output.' + output_format
+    return output_filename, safe_output_filename
+
+
+def safe_input_filename(filename):
+    """Return a filesystem safe name for an upload, keeping its extension."""
+    input_filename = secure_filename(filename)
+    if not input_filename or '.' not in input_filename:
+        # secure_filename() strips non-ASCII names down to the extension
+        input_filename = 'input.' + filename.rsplit('.', 1)[1].lower()
+    return input_filename
+
+
+def get_job_queue():
+    """Return the job queue, starting the worker pool on first use."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = jobs.JobQueue(
+                workers=app.config['CONVERSION_WORKERS'],
+                queue_depth=app.config['CONVERSION_QUEUE_DEPTH'],
+                result_ttl=app.config['CONVERSION_RESULT_TTL'])
+        return _job_queue
+
+
+def create_job(file, output_format, profile=False):
+    """Save an uploaded file into a new job's work directory."""
+    queue = get_job_queue()
+    output_filename, safe_output_filename = output_names(file.filename,
+                                                         output_format)
+    job = queue.create_job(file.filename, output_format, output_filename,
+                           safe_input_filename(file.filename),
+                           safe_output_filename, profile=profile)
+    file.save(job.input_path)
+    return job
+
+
+def job_status(job):
+    """Serialize a job for the JSON API."""
+    ans = job.as_dict()
+    ans['status_url'] = url_for('job_info', job_id=job.id)
+    if job.state == jobs.DONE:
+        ans['download_url'] = url_for('job_download', job_id=job.id)
+    if job.profile_path is not None:
+        ans['profile_url'] = url_for('job_profile', job_id=job.id)
+    return ans
+
+
+def form_flag(name):
+    """True if the form field name is set to a true value."""
+    return request.form.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def queue_full_response():
+    response = jsonify({'error': '服务器繁忙，请稍后再试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
+
+
 @app.route('/')
 def index():
     """Render the main page."""
@@ -88,35 +174,16 @@ def convert():
         return jsonify({'error': f'不支持的输出格式。支持的格式: {", ".join(OUTPUT_FORMATS.keys())}'}), 400
     
     try:
-        # Create temporary directory for processing
-        temp_dir = tempfile.mkdtemp()
-        
-        try:
-            # Save uploaded file with safe name for temp processing
-            input_filename = secure_filename(file.filename)
-            input_path = os.path.join(temp_dir, input_filename)
+        # The work directory is removed once the result has been streamed
+        # to the client, or right away if anything fails before that.
+        with WorkDir() as work_dir:
+            input_path = work_dir.join(safe_input_filename(file.filename))
             file.save(input_path)
-            
-            # Create output filename - preserve original Chinese name, only change extension
-            # Get original filename without extension (preserving Chinese characters)
-            original_name = Path(file.filename).stem
-            output_filename = original_name + '.' + output_format
-            # For temp path, use secure filename, but we'll use original for download
-            safe_output_filename = secure_filename(output_filename)
-            # If secure_filename removed all characters, use a fallback
-            if not safe_output_filename or safe_output_filename == '.' + output_format:
-                safe_output_filename = 'output.' + output_format
-            output_path = os.path.join(temp_dir, safe_output_filename)
-            
-            # Perform conversion using the converter directly
-            # Create arguments object
-            class Args:
-                def __init__(self, from_file, to_file):
-                    self.from_file = from_file
-                    self.to_file = to_file
-                    self.verbose = 0
-                    self.quiet = 0
-            
+
+            output_filename, safe_output_filename = output_names(
+                file.filename, output_format)
+            output_path = work_dir.join(safe_output_filename)
+
             # Special handling for PDF output (uses weasyprint instead of PyQt5)
             if output_format.lower() == 'pdf':
                 try:
@@ -133,8 +200,8 @@ def convert():
                     return jsonify({'error': error_msg}), 500
             else:
                 # Standard conversion for other formats
-                args = Args(input_path, output_path)
-                
+                args = jobs.ConversionArgs(input_path, output_path)
+
                 # Call the conversion function directly
                 try:
                     result_code = ebook_convert_run(args)
@@ -148,43 +215,103 @@ def convert():
                         error_msg = f'转换失败，退出码: {se.code}'
                         print(f"[ERROR] Conversion exited with code: {se.code}")
                         return jsonify({'error': error_msg}), 500
-            
+
             # Check if output file was created
             if not os.path.exists(output_path):
                 return jsonify({'error': '转换失败，未生成输出文件'}), 500
-            
-            # Read file into memory before cleanup
-            with open(output_path, 'rb') as f:
-                file_data = f.read()
-            
-            # Clean up temp directory
-            shutil.rmtree(temp_dir)
-            
-            # Return file data with filename in JSON response
-            # The client-side JavaScript will handle the download with correct filename
-            import base64
-            return jsonify({
-                'success': True,
-                'filename': output_filename,
-                'data': base64.b64encode(file_data).decode('utf-8'),
-                'mimetype': 'application/octet-stream'
-            })
-        except Exception as inner_e:
-            # Clean up temp directory on error
-            print(f"[ERROR] Exception during conversion: {str(inner_e)}")
-            import traceback
-            traceback.print_exc()
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-            raise inner_e
-    
+
+            # Stream the file from disk, the original Chinese filename is
+            # sent in the Content-Disposition header
+            return work_dir.release_after(
+                stream_file(output_path, output_filename))
+
     except Exception as e:
-        print(f"[ERROR] Outer exception: {str(e)}")
+        print(f"[ERROR] Exception during conversion: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
 
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a file for conversion and return the job id right away."""
+    if 'file' not in request.files:
+        return jsonify({'error': '没有选择文件'}), 400
+
+    file = request.files['file']
+
+    if file.filename == '':
+        return jsonify({'error': '文件名为空'}), 400
+
+    if not allowed_input_file(file.filename):
+        return jsonify({'error': f'不支持的输入格式。支持的格式: {", ".join(INPUT_FORMATS.keys())}'}), 400
+
+    output_format = request.form.get('output_format', '').lower()
+    if not output_format or not allowed_output_format(output_format):
+        return jsonify({'error': f'不支持的输出格式。支持的格式: {", ".join(OUTPUT_FORMATS.keys())}'}), 400
+
+    queue = get_job_queue()
+    if not queue.available():
+        return queue_full_response()
+
+    job = create_job(file, output_format, profile=form_flag('profile'))
+    try:
+        queue.submit(job)
+    except jobs.QueueFull:
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+        return queue_full_response()
+    return jsonify(job_status(job)), 202
+
+
+@app.route('/jobs/<job_id>')
+def job_info(job_id):
+    """Return the status and progress of a job."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job_status(job))
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def job_cancel(job_id):
+    """Cancel a pending or running job, or discard a finished one."""
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if job.is_finished:
+        queue.remove(job_id)
+    else:
+        queue.cancel(job_id)
+    return jsonify(job_status(job))
+
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    """Download the result of a finished job."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if job.state != jobs.DONE:
+        return jsonify({'error': '任务尚未完成', 'status': job.state}), 409
+    return stream_file(job.output_path, job.output_filename)
+
+
+@app.route('/jobs/<job_id>/profile')
+def job_profile(job_id):
+    """Return the timing report of a job submitted with profile=1."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if job.profile_path is None:
+        return jsonify({'error': '任务未启用性能分析'}), 404
+    if not job.is_finished or not os.path.exists(job.profile_path):
+        return jsonify({'error': '性能报告尚未生成', 'status': job.state}), 409
+    with open(job.profile_path, 'rb') as f:
+        return app.response_class(f.read(), mimetype='application/json')
+
+
 @app.route('/batch')
 def batch():
     """Render the batch conversion page."""
@@ -206,7 +333,9 @@ def batch_convert():
         return jsonify({'error': f'不支持的输出格式'}), 400
     
     results = []
-    
+    submitted = []
+    queue = get_job_queue()
+
     for file in files:
         if file.filename == '':
             continue
@@ -218,94 +347,46 @@ def batch_convert():
                 'message': '不支持的格式'
             })
             continue
-        
+
+        # Fan out: every file becomes a job, so the whole batch is
+        # converted in parallel across the worker pool.
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                input_filename = secure_filename(file.filename)
-                input_path = os.path.join(temp_dir, input_filename)
-                file.save(input_path)
-                
-                # Preserve original Chinese filename, only change extension
-                original_name = Path(file.filename).stem
-                output_filename = original_name + '.' + output_format
-                # For temp path, use secure filename
-                safe_output_filename = secure_filename(output_filename)
-                if not safe_output_filename or safe_output_filename == '.' + output_format:
-                    safe_output_filename = 'output.' + output_format
-                output_path = os.path.join(temp_dir, safe_output_filename)
-                
-                # Special handling for PDF output
-                if output_format.lower() == 'pdf':
-                    try:
-                        result_code = convert_to_pdf_via_epub(input_path, output_path, verbose=0, quiet=0)
-                        if result_code == 0 and os.path.exists(output_path):
-                            results.append({
-                                'filename': file.filename,
-                                'status': 'success',
-                                'message': '转换成功',
-                                'output_filename': output_filename
-                            })
-                        else:
-                            results.append({
-                                'filename': file.filename,
-                                'status': 'error',
-                                'message': 'PDF 转换失败'
-                            })
-                    except Exception as pdf_error:
-                        results.append({
-                            'filename': file.filename,
-                            'status': 'error',
-                            'message': f'PDF 转换出错: {str(pdf_error)}'
-                        })
-                else:
-                    # Standard conversion for other formats
-                    # Create arguments object
-                    class Args:
-                        def __init__(self, from_file, to_file):
-                            self.from_file = from_file
-                            self.to_file = to_file
-                            self.verbose = 0
-                            self.quiet = 0
-                    
-                    args = Args(input_path, output_path)
-                    
-                    # Call the conversion function directly
-                    try:
-                        result_code = ebook_convert_run(args)
-                        if result_code == 0 and os.path.exists(output_path):
-                            results.append({
-                                'filename': file.filename,
-                                'status': 'success',
-                                'message': '转换成功',
-                                'output_filename': output_filename
-                            })
-                        else:
-                            results.append({
-                                'filename': file.filename,
-                                'status': 'error',
-                                'message': '转换失败'
-                            })
-                    except SystemExit as se:
-                        # Handle sys.exit() calls
-                        if se.code == 0 and os.path.exists(output_path):
-                            results.append({
-                                'filename': file.filename,
-                                'status': 'success',
-                                'message': '转换成功',
-                                'output_filename': output_filename
-                            })
-                        else:
-                            results.append({
-                                'filename': file.filename,
-                                'status': 'error',
-                                'message': f'转换失败，退出码: {se.code}'
-                            })
+            job = create_job(file, output_format)
+            queue.submit(job)
+        except jobs.QueueFull:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+            results.append({
+                'filename': file.filename,
+                'status': 'error',
+                'message': '服务器繁忙，请稍后再试'
+            })
+            continue
         except Exception as e:
             results.append({
                 'filename': file.filename,
                 'status': 'error',
                 'message': str(e)
             })
+            continue
+        result = {'filename': file.filename, 'job_id': job.id}
+        results.append(result)
+        submitted.append((result, job))
+
+    queue.wait([job for _, job in submitted])
+
+    for result, job in submitted:
+        if job.state == jobs.DONE:
+            result.update({
+                'status': 'success',
+                'message': '转换成功',
+                'output_filename': job.output_filename,
+                'download_url': url_for('job_download', job_id=job.id)
+            })
+        else:
+            result.update({
+                'status': 'error',
+                'message': job.error or '转换失败'
+            })
     
     return jsonify({'results': results})
 